@@ -1,14 +1,25 @@
+import argparse
+import os
+import subprocess
+import sys
 import uvicorn
 import webbrowser
 import shutil
-import os
+import tempfile
 from threading import Timer
 from web.core import app, UPLOAD_DIR, OUTPUT_DIR
+from vlm.backends import BACKENDS
+from vlm.worker import default_address, ensure_authkey, parse_address
+from vlm import tracing
 
 import web.routes 
 
-def open_browser():
-    webbrowser.open("http://localhost:8000")
+def open_browser(port: int = 8000):
+    webbrowser.open(f"http://localhost:{port}")
+
+def start_inference_worker(address: str, backend: str) -> subprocess.Popen:
+    """Launch the one process that holds the model; every web worker connects to it."""
+    return subprocess.Popen([sys.executable, "-m", "vlm.worker", "--address", address, "--backend", backend])
 
 def cleanup():
     """Remove all files in the upload and output directories."""
@@ -26,8 +37,49 @@ def cleanup():
                     print(f"Failed to delete {file_path}. Reason: {e}")
 
 if __name__ == "__main__":
-    Timer(1.5, open_browser).start()
+    parser = argparse.ArgumentParser(description="Run the Ink2Pixel web app.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Web worker processes (they share one model)")
+    parser.add_argument("--backend", default=os.environ.get("INK2PIXEL_BACKEND", "qwen"), choices=BACKENDS,
+                        help="Inference backend; 'stub' runs without a model")
+    parser.add_argument("--trace", metavar="FILE", default=os.environ.get("INK2PIXEL_TRACE_FILE"),
+                        help="Append per-job trace spans to this JSONL file")
+    parser.add_argument("--profile-dir", default=os.environ.get("INK2PIXEL_PROFILE_DIR"),
+                        help="Save a torch.profiler Chrome trace of the first job here")
+    args = parser.parse_args()
+
+    # Exported so the inference worker and any extra web workers pick them up too.
+    for name, value in (("INK2PIXEL_TRACE_FILE", args.trace), ("INK2PIXEL_PROFILE_DIR", args.profile_dir)):
+        if value:
+            os.environ[name] = os.path.abspath(value)
+    tracing.configure(os.environ.get("INK2PIXEL_TRACE_FILE"), os.environ.get("INK2PIXEL_PROFILE_DIR"))
+
+    # Reuse externally managed workers if any are configured, else start our own.
+    worker = None
+    if not (os.environ.get("INK2PIXEL_INFERENCE_ADDRESS") or os.environ.get("INK2PIXEL_SHARD_WORKERS")):
+        os.environ["INK2PIXEL_INFERENCE_ADDRESS"] = default_address()
+        if isinstance(parse_address(os.environ["INK2PIXEL_INFERENCE_ADDRESS"]), tuple):
+            ensure_authkey()
+        worker = start_inference_worker(os.environ["INK2PIXEL_INFERENCE_ADDRESS"], args.backend)
+
+    # Each web worker writes its metrics here, so whichever one a scrape reaches reports all of them.
+    metrics_dir = None
+    if args.workers > 1 and not os.environ.get("INK2PIXEL_METRICS_DIR"):
+        metrics_dir = os.environ["INK2PIXEL_METRICS_DIR"] = tempfile.mkdtemp(prefix="ink2pixel-metrics-")
+
+    Timer(1.5, open_browser, args=(args.port,)).start()
     try:
-        uvicorn.run(app, host='0.0.0.0', port=8000)
+        if args.workers > 1:
+            uvicorn.run("app:app", host='0.0.0.0', port=args.port, workers=args.workers)
+        else:
+            uvicorn.run(app, host='0.0.0.0', port=args.port)
     finally:
-        cleanup()
\ No newline at end of file
+        if worker is not None:
+            worker.terminate()
+            try:
+                worker.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        cleanup()
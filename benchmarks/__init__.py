@@ -0,0 +1 @@
+# Ink2Pixel benchmarks
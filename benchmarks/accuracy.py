@@ -0,0 +1,287 @@
+"""
+Accuracy vs latency over a grid of DocumentDigitizer settings.
+
+Runs a labeled page set through the digitizer once per combination of
+
+  --dpi             PDF rasterization DPI (images are used as they are)
+  --max-pixels      pixel cap before the vision tower (0 = qwen_vl_utils' default)
+  --max-new-tokens  generation cap per page
+  --quantization    nf4, int8 or none (the model is reloaded per value)
+
+and reports, per grid point, character and word error rates against the
+labels, seconds per page, visual tokens per page and peak memory. Points
+that no other point beats on error rate, latency and memory together are
+marked as the Pareto frontier: those are the settings worth choosing from.
+
+A labeled set is either a directory where each image/PDF has a transcript
+next to it with the same stem (page1.jpg + page1.txt), or a JSONL file of
+{"path": ..., "text": ...} lines (paths relative to the JSONL file). For a
+PDF the transcript covers the whole document.
+
+    python -m benchmarks.accuracy samples/ --dpi 100 144 --max-pixels 0 1000000 --quantization nf4 int8
+    python -m benchmarks.accuracy --synthetic 3 --tiny     # smoke test on CPU, no download
+
+--tiny swaps in the random-weight model from benchmarks/tiny_qwen.py, so the
+error rates are meaningless but the harness runs end to end.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "legacy_hand_writing_model"))
+
+from benchmarks import fixtures
+from benchmarks.pipeline import _git_revision, _versions
+from edit_distance import levenshtein_distance
+from vlm.batch import INPUT_EXTENSIONS
+from vlm.metrics import resident_memory_bytes
+
+LABEL_EXTENSIONS = (".txt", ".md")
+_PAGE_BREAK_RE = re.compile(r"\s*=== PAGE BREAK ===\s*")
+_MARKUP_RE = re.compile(r"^\s{0,3}(#{1,6}|[-*+]|>)\s+|\*\*|__|`+", re.MULTILINE)
+
+
+# =============================================================================
+#  DATASET
+# =============================================================================
+
+def load_dataset(source: str) -> list:
+    """[(input_path, reference_text)] from a directory of labeled inputs or a JSONL file."""
+    samples = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in INPUT_EXTENSIONS:
+                continue
+            for label_ext in LABEL_EXTENSIONS:
+                label = os.path.join(source, stem + label_ext)
+                if os.path.isfile(label):
+                    with open(label, encoding="utf-8") as f:
+                        samples.append((os.path.join(source, name), f.read()))
+                    break
+            else:
+                print(f"WARNING: no transcript for {name}; skipping.")
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    samples.append((os.path.join(base, record["path"]), record["text"]))
+    if not samples:
+        raise SystemExit(f"No labeled samples found in {source}")
+    return samples
+
+
+def synthetic_dataset(work_dir: str, count: int) -> list:
+    """Rendered pages from benchmarks/fixtures.py, labeled with the text drawn on them."""
+    samples = []
+    for seed in range(count):
+        path = fixtures.make_page_image(os.path.join(work_dir, f"synthetic_{seed}.png"), seed=seed)
+        samples.append((path, fixtures.page_text(0, seed=seed)))
+    return samples
+
+
+def normalize(text: str, strip_markup: bool = True, casefold: bool = False) -> str:
+    """Compare transcripts on content: no page breaks, light Markdown markup removed, whitespace collapsed."""
+    text = _PAGE_BREAK_RE.sub("\n", text)
+    if strip_markup:
+        text = _MARKUP_RE.sub("", text)
+    text = " ".join(text.split())
+    return text.casefold() if casefold else text
+
+
+# =============================================================================
+#  GRID
+# =============================================================================
+
+def _load_digitizer(quantization, tiny: bool, model_id: str):
+    if tiny:
+        from benchmarks.tiny_qwen import build_tiny_digitizer
+        return build_tiny_digitizer()
+    from vlm.document_digitizer import DocumentDigitizer
+    return DocumentDigitizer(model_id, quantization=quantization)
+
+
+def _release(digitizer) -> None:
+    digitizer.model = None
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _reset_peak_memory() -> None:
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+
+def _peak_memory_bytes():
+    """Peak CUDA allocation since the last reset, else current RSS (CPU runs keep weights in RAM)."""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return max(torch.cuda.max_memory_allocated(d) for d in range(torch.cuda.device_count()))
+    return resident_memory_bytes()
+
+
+def run_point(digitizer, samples: list, strip_markup: bool, casefold: bool) -> dict:
+    """Transcribe every sample with the digitizer's current settings and score it."""
+    char_errors = char_total = word_errors = word_total = 0
+    page_seconds, visual_tokens, generated_tokens = [], [], 0
+    _reset_peak_memory()
+    started = time.perf_counter()
+    for path, reference in samples:
+        texts = []
+        page_started = time.perf_counter()
+        for _, _, text in digitizer.iter_page_texts(path, "md"):
+            page_seconds.append(time.perf_counter() - page_started)
+            texts.append(text)
+            page = getattr(digitizer, "last_page", None) or {}
+            if page.get("visual_tokens") is not None:
+                visual_tokens.append(page["visual_tokens"])
+            generated_tokens += page.get("generated_tokens", 0)
+            page_started = time.perf_counter()
+
+        ref = normalize(reference, strip_markup, casefold)
+        hyp = normalize("\n".join(texts), strip_markup, casefold)
+        char_errors += levenshtein_distance(ref, hyp)
+        char_total += len(ref)
+        ref_words, hyp_words = ref.split(), hyp.split()
+        word_errors += levenshtein_distance(ref_words, hyp_words)
+        word_total += len(ref_words)
+    elapsed = time.perf_counter() - started
+
+    seconds_sorted = sorted(page_seconds)
+    return {
+        "documents": len(samples),
+        "pages": len(page_seconds),
+        "cer": round(char_errors / max(char_total, 1), 5),
+        "wer": round(word_errors / max(word_total, 1), 5),
+        "seconds_per_page": round(statistics.fmean(page_seconds), 4),
+        "p95_seconds_per_page": round(seconds_sorted[min(len(seconds_sorted) - 1, int(0.95 * len(seconds_sorted)))], 4),
+        "pages_per_second": round(len(page_seconds) / elapsed, 4),
+        "visual_tokens_per_page": round(statistics.fmean(visual_tokens), 1) if visual_tokens else None,
+        "generated_tokens_per_page": round(generated_tokens / max(len(page_seconds), 1), 1),
+        "peak_memory_bytes": _peak_memory_bytes(),
+    }
+
+
+def run_grid(samples: list, dpis: list, max_pixels: list, max_new_tokens: list, quantizations: list,
+             tiny: bool = False, model_id: str = "Qwen/Qwen2.5-VL-7B-Instruct",
+             strip_markup: bool = True, casefold: bool = False) -> list:
+    points = []
+    for quantization in quantizations:
+        print(f"Loading model (quantization={quantization or 'none'})...")
+        digitizer = _load_digitizer(quantization, tiny, model_id)
+        footprint = getattr(digitizer.model, "get_memory_footprint", lambda: None)()
+
+        # Warm-up on one page so the first grid point does not pay for lazy init.
+        digitizer.max_new_tokens = min(max_new_tokens)
+        next(iter(digitizer.iter_page_texts(samples[0][0], "md")), None)
+
+        for dpi, pixels, tokens in itertools.product(dpis, max_pixels, max_new_tokens):
+            settings = {"quantization": quantization or "none", "dpi": dpi, "max_pixels": pixels or None,
+                        "max_new_tokens": tokens}
+            print(f"Grid point {settings}")
+            digitizer.pdf_zoom = dpi / 72
+            digitizer.max_pixels = pixels or None
+            digitizer.max_new_tokens = tokens
+            result = run_point(digitizer, samples, strip_markup, casefold)
+            points.append({**settings, **result, "weights_bytes": footprint})
+        _release(digitizer)
+    return points
+
+
+# =============================================================================
+#  PARETO
+# =============================================================================
+
+OBJECTIVES = ("cer", "seconds_per_page", "peak_memory_bytes")
+
+
+def _dominates(a: dict, b: dict) -> bool:
+    keys = [k for k in OBJECTIVES if a.get(k) is not None and b.get(k) is not None]
+    return all(a[k] <= b[k] for k in keys) and any(a[k] < b[k] for k in keys)
+
+
+def mark_pareto(points: list) -> list:
+    for point in points:
+        point["pareto"] = not any(_dominates(other, point) for other in points if other is not point)
+    return points
+
+
+def print_table(points: list) -> None:
+    header = f"{'':1} {'quant':>5} {'dpi':>4} {'max_pixels':>10} {'tokens':>6} {'CER':>7} {'WER':>7} " \
+             f"{'s/page':>7} {'p95':>7} {'vis tok':>7} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for p in sorted(points, key=lambda p: (p["seconds_per_page"], p["cer"])):
+        vis = f"{p['visual_tokens_per_page']:.0f}" if p["visual_tokens_per_page"] is not None else "-"
+        print(f"{'*' if p['pareto'] else ' ':1} {p['quantization']:>5} {p['dpi']:>4} {p['max_pixels'] or 'default':>10} "
+              f"{p['max_new_tokens']:>6} {p['cer']:>7.4f} {p['wer']:>7.4f} {p['seconds_per_page']:>7.3f} "
+              f"{p['p95_seconds_per_page']:>7.3f} {vis:>7} {p['peak_memory_bytes'] / 2**20:>8.0f}")
+    print("* = Pareto frontier (no other setting is at least as good on CER, s/page and memory, and better on one)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", nargs="?", help="Directory of inputs with same-stem .txt/.md transcripts, or a JSONL file")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="Use N rendered pages instead of a dataset")
+    parser.add_argument("--limit", type=int, help="Only use the first N samples")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[144], help="PDF rasterization DPI values")
+    parser.add_argument("--max-pixels", type=int, nargs="+", default=[0], help="Pixel caps (0 = default)")
+    parser.add_argument("--max-new-tokens", type=int, nargs="+", default=[4096], help="Generation caps")
+    parser.add_argument("--quantization", nargs="+", default=["nf4"], choices=["nf4", "int8", "none"])
+    parser.add_argument("--model-id", default="Qwen/Qwen2.5-VL-7B-Instruct")
+    parser.add_argument("--tiny", action="store_true", help="Use the tiny random-weight model (smoke test)")
+    parser.add_argument("--keep-markup", action="store_true", help="Score Markdown markup characters too")
+    parser.add_argument("--casefold", action="store_true", help="Ignore case when scoring")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/accuracy-<rev>.json)")
+    args = parser.parse_args()
+    if not args.dataset and not args.synthetic:
+        parser.error("give a dataset or --synthetic N")
+
+    quantizations = [None if q == "none" else q for q in args.quantization]
+    if args.tiny and quantizations != [None]:
+        print("NOTE: --tiny ignores --quantization; the tiny model runs unquantized on CPU.")
+        quantizations = [None]
+
+    with tempfile.TemporaryDirectory(prefix="ink2pixel-accuracy-") as work_dir:
+        samples = synthetic_dataset(work_dir, args.synthetic) if args.synthetic else load_dataset(args.dataset)
+        samples = samples[:args.limit] if args.limit else samples
+        points = run_grid(samples, args.dpi, args.max_pixels, args.max_new_tokens, quantizations,
+                          tiny=args.tiny, model_id=args.model_id,
+                          strip_markup=not args.keep_markup, casefold=args.casefold)
+    mark_pareto(points)
+    print()
+    print_table(points)
+
+    report = {
+        "benchmark": "accuracy",
+        "revision": _git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "versions": _versions(),
+        "dataset": args.dataset or f"synthetic:{args.synthetic}",
+        "samples": len(samples),
+        "model": "tiny" if args.tiny else args.model_id,
+        "points": points,
+    }
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"accuracy-{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
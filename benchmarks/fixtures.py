@@ -0,0 +1,85 @@
+"""
+Synthetic inputs for the benchmarks: notes-like PDFs and page images.
+
+Generated on the fly so the suite needs no checked-in binaries and no
+downloads. The content is text plus inline math, roughly the density of a
+page of lecture notes.
+"""
+import os
+import random
+
+LINES = [
+    "Lecture 7: eigenvalues and the spectral theorem",
+    "Let A be symmetric. Then \\( A = Q \\Lambda Q^T \\) with Q orthogonal.",
+    "Claim: for all \\( n \\in \\mathbb{N} \\), \\[ \\sum_{k=1}^{n} k = \\frac{n(n+1)}{2} \\]",
+    "1. Compute the characteristic polynomial det(A - tI).",
+    "2. Find the roots; each root is an eigenvalue.",
+    "Proof by induction on n. Base case n = 1 is immediate.",
+    "Note: \\( \\| x \\|_2^2 = x^T x \\) and \\( \\langle Ax, x \\rangle \\ge 0 \\).",
+]
+
+
+def page_text(page: int, lines: int = 28, seed: int = 0) -> str:
+    rng = random.Random(seed * 1000 + page)
+    return "\n".join(rng.choice(LINES) for _ in range(lines))
+
+
+def make_pdf(path: str, pages: int = 8, seed: int = 0) -> str:
+    """Write a Letter-size PDF of text pages and return its path."""
+    import fitz
+
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((54, 72), page_text(page_number, seed=seed), fontsize=11, lineheight=1.9)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_page_image(path: str, size=(1224, 1584), seed: int = 0) -> str:
+    """Write one page-sized image (default: Letter at 144 DPI, like a rasterized PDF page)."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(page_text(0, seed=seed).splitlines()):
+        draw.text((100, 120 + row * 48), line, fill=(20, 20, 60))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    image.save(path)
+    return path
+
+
+def make_scan(path: str, dpi: int = 300, blobs: int = 3000, seed: int = 0,
+              noise: float = 6, blur: float = 1) -> str:
+    """Write a Letter-size grayscale "scan" at dpi: text lines, paper texture and ink rings.
+
+    Each ring encloses a patch of paper large enough to survive the
+    preprocessor's opening, so it is one more connected component for
+    clean_binary_image to filter, like the loops of dense handwriting or
+    stains on a real archive scan. noise is the standard deviation of the
+    sensor grain, blur the radius of the optics' softening.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+    rng = np.random.default_rng(seed)
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    image = Image.new("L", (width, height), 235)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=max(10, dpi // 6))
+    for row, line in enumerate(page_text(0, seed=seed).splitlines()):
+        draw.text((dpi, dpi + row * dpi // 3), line, fill=40, font=font)
+    for x, y, r in zip(rng.integers(0, width, blobs), rng.integers(0, height, blobs), rng.integers(8, 13, blobs)):
+        draw.ellipse((int(x) - int(r), int(y) - int(r), int(x) + int(r), int(y) + int(r)), outline=50, width=3)
+    image = image.filter(ImageFilter.GaussianBlur(blur))
+    pixels = np.asarray(image, dtype=np.int16) + rng.normal(0, noise, (height, width)).astype(np.int16)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path)
+    return path
+
+
+def transcript(pages: int = 10, seed: int = 0) -> str:
+    """A model-output-like document: pages joined by the digitizer's page-break marker."""
+    return "\n\n=== PAGE BREAK ===\n\n".join(page_text(p, seed=seed) for p in range(pages))
@@ -0,0 +1,68 @@
+"""
+Import-time regression check for the web layer.
+
+Runs `python -X importtime -c "import web.routes"` in a fresh interpreter and
+fails when the import takes longer than the budget, or when it drags in any
+of the ML libraries that must only load inside the inference subsystem.
+
+    python -m benchmarks.import_time [--budget-ms 1000] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages the web server must be able to start without.
+FORBIDDEN = ("torch", "torchvision", "transformers", "qwen_vl_utils", "bitsandbytes", "accelerate")
+
+
+def measure(module: str = "web.routes") -> list:
+    """Return [(module, self_us, cumulative_us)] for one cold import of module."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="web.routes")
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total_ms = sum(self_us for _, self_us, _ in rows) / 1000
+    forbidden = sorted({name for name, _, _ in rows if name.split(".")[0] in FORBIDDEN})
+
+    print(f"import {args.module}: {total_ms:.1f} ms across {len(rows)} modules (budget {args.budget_ms:.0f} ms)")
+    print(f"\nSlowest {args.top} by cumulative time:")
+    for name, _, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  {name}")
+
+    failed = False
+    if forbidden:
+        print(f"\nFAIL: heavy modules imported at web startup: {', '.join(forbidden[:10])}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\nFAIL: import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("\nOK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
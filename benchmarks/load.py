@@ -0,0 +1,300 @@
+"""
+Async load generator for a running Ink2Pixel server.
+
+Each simulated request uploads a page image or a PDF (from
+benchmarks/fixtures.py) to POST /process, then fetches the result from
+GET /download/<id>/<ext>, like a user clicking the download button. While a
+level runs, /metrics is polled for the inference queue depth and jobs in
+flight. Every --users value is one level; levels run one after another.
+
+Two arrival models:
+
+  closed loop (default)  every user sends its next request as soon as the
+                         previous one finishes (after --think-time)
+  open loop (--rate R)   requests arrive as a Poisson process at R/s, at
+                         most --users in flight. Latency is measured from the
+                         scheduled arrival, so time spent waiting for a free
+                         slot counts (no coordinated omission).
+
+Reported per endpoint: p50/p95/p99 latency, error and HTTP 429 rates and
+throughput; plus queue depth over time. Start the server with the stub
+backend to measure the web layer and queueing without a GPU:
+
+    python app.py --backend stub --port 8000
+    python -m benchmarks.load --url http://127.0.0.1:8000 --users 10 50 200 --duration 30
+    python -m benchmarks.load --users 50 --rate 5 --pdf-ratio 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import httpx
+
+from benchmarks import fixtures
+from benchmarks.pipeline import _git_revision
+
+_DOWNLOAD_RE = re.compile(r'href="(/download/[a-f0-9]+/\w+)"')
+_WARNING_RE = re.compile(r'class="warning-box".*?<p[^>]*>(.*?)</p>', re.DOTALL)
+_GAUGE_RE = re.compile(r"^(ink2pixel_queue_depth|ink2pixel_jobs_in_flight)(?:\{[^}]*\})?\s+(\S+)", re.MULTILINE)
+
+
+def make_payloads(work_dir: str, pdf_pages: int) -> dict:
+    """{"image": (filename, bytes, media type), "pdf": ...} uploaded by every request."""
+    image = fixtures.make_page_image(os.path.join(work_dir, "page.png"))
+    pdf = fixtures.make_pdf(os.path.join(work_dir, "notes.pdf"), pages=pdf_pages)
+    with open(image, "rb") as f:
+        image_bytes = f.read()
+    with open(pdf, "rb") as f:
+        pdf_bytes = f.read()
+    return {"image": ("page.png", image_bytes, "image/png"), "pdf": ("notes.pdf", pdf_bytes, "application/pdf")}
+
+
+# =============================================================================
+#  REQUESTS
+# =============================================================================
+
+class Recorder:
+    """Collects one sample per request; keyed by endpoint."""
+
+    def __init__(self):
+        self.samples = []
+
+    def add(self, endpoint: str, kind: str, started: float, status, outcome: str) -> None:
+        self.samples.append({"endpoint": endpoint, "kind": kind, "ts": time.perf_counter(),
+                             "seconds": time.perf_counter() - started, "status": status, "outcome": outcome})
+
+
+async def one_job(client: httpx.AsyncClient, recorder: Recorder, payloads: dict, kind: str,
+                  fmt: str, download: bool, started: float = None) -> None:
+    """POST /process with one upload, then GET its download link."""
+    started = started if started is not None else time.perf_counter()
+    filename, body, media = payloads[kind]
+    try:
+        response = await client.post("/process", data={"agree": "on", "fmt": fmt},
+                                     files={"up_file": (filename, body, media)})
+    except httpx.TimeoutException:
+        recorder.add("/process", kind, started, None, "timeout")
+        return
+    except httpx.HTTPError as e:
+        recorder.add("/process", kind, started, None, f"connection: {type(e).__name__}")
+        return
+
+    # The app answers 200 with an HTML fragment even when a job fails, so look
+    # for the download link to tell success from an in-page error.
+    link = _DOWNLOAD_RE.search(response.text) if response.status_code == 200 else None
+    if link:
+        outcome = "ok"
+    elif response.status_code == 200:
+        warning = _WARNING_RE.search(response.text)
+        outcome = "app error: " + (re.sub(r"<[^>]+>", "", warning.group(1)).strip()[:80] if warning else "no download link")
+    else:
+        outcome = f"http {response.status_code}"
+    recorder.add("/process", kind, started, response.status_code, outcome)
+    if not (link and download):
+        return
+
+    started = time.perf_counter()
+    try:
+        response = await client.get(link.group(1))
+        outcome = "ok" if response.status_code == 200 and response.content else f"http {response.status_code}"
+        recorder.add("/download", kind, started, response.status_code, outcome)
+    except httpx.HTTPError as e:
+        recorder.add("/download", kind, started, None, f"connection: {type(e).__name__}")
+
+
+async def sample_queue(client: httpx.AsyncClient, interval: float, stop: asyncio.Event, series: list) -> None:
+    """Poll /metrics every interval seconds; append (seconds since start, queue depth, jobs in flight)."""
+    begin = time.perf_counter()
+    while not stop.is_set():
+        point = {"t": round(time.perf_counter() - begin, 2), "queue_depth": None, "jobs_in_flight": None}
+        try:
+            response = await client.get("/metrics", timeout=interval * 5)
+            values = {}
+            for name, value in _GAUGE_RE.findall(response.text):
+                values[name] = values.get(name, 0) + float(value)  # summed over processes / shards
+            point["queue_depth"] = values.get("ink2pixel_queue_depth")
+            point["jobs_in_flight"] = values.get("ink2pixel_jobs_in_flight")
+        except httpx.HTTPError:
+            pass
+        series.append(point)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+# =============================================================================
+#  LEVELS
+# =============================================================================
+
+async def run_level(url: str, users: int, duration: float, payloads: dict, pdf_ratio: float, fmt: str,
+                    rate: float = None, think_time: float = 0.0, download: bool = True,
+                    timeout: float = 600.0, metrics_interval: float = 1.0, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    recorder = Recorder()
+    queue_series = []
+    limits = httpx.Limits(max_connections=users + 2, max_keepalive_connections=users + 2)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client, \
+            httpx.AsyncClient(base_url=url, timeout=timeout) as metrics_client:
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_queue(metrics_client, metrics_interval, stop, queue_series))
+        started = time.perf_counter()
+        deadline = started + duration
+
+        def pick() -> str:
+            return "pdf" if rng.random() < pdf_ratio else "image"
+
+        if rate:
+            slots = asyncio.Semaphore(users)
+
+            async def arrival(kind: str, scheduled: float) -> None:
+                async with slots:
+                    await one_job(client, recorder, payloads, kind, fmt, download, started=scheduled)
+
+            tasks, next_at = [], started
+            while next_at < deadline:
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+                tasks.append(asyncio.create_task(arrival(pick(), next_at)))
+                next_at += rng.expovariate(rate)
+            await asyncio.gather(*tasks)
+        else:
+            async def user() -> None:
+                while time.perf_counter() < deadline:
+                    await one_job(client, recorder, payloads, pick(), fmt, download)
+                    if think_time:
+                        await asyncio.sleep(rng.expovariate(1 / think_time))
+
+            await asyncio.gather(*(user() for _ in range(users)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+    return summarize(recorder.samples, elapsed, users, rate, queue_series)
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return round(sorted_values[index], 4)
+
+
+def summarize(samples: list, elapsed: float, users: int, rate: float, queue_series: list) -> dict:
+    endpoints = {}
+    for endpoint in sorted({s["endpoint"] for s in samples}):
+        rows = [s for s in samples if s["endpoint"] == endpoint]
+        ok = sorted(s["seconds"] for s in rows if s["outcome"] == "ok")
+        outcomes = {}
+        for s in rows:
+            if s["outcome"] != "ok":
+                outcomes[s["outcome"]] = outcomes.get(s["outcome"], 0) + 1
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "p50": _percentile(ok, 0.50),
+            "p95": _percentile(ok, 0.95),
+            "p99": _percentile(ok, 0.99),
+            "mean": round(statistics.fmean(ok), 4) if ok else None,
+            "error_rate": round((len(rows) - len(ok)) / len(rows), 4),
+            "rate_429": round(sum(1 for s in rows if s["status"] == 429) / len(rows), 4),
+            "throughput_per_second": round(len(ok) / elapsed, 3),
+            "by_kind_p50": {kind: _percentile(sorted(s["seconds"] for s in rows
+                                                     if s["kind"] == kind and s["outcome"] == "ok"), 0.50)
+                            for kind in sorted({s["kind"] for s in rows})},
+            "errors": outcomes,
+        }
+    depths = [p["queue_depth"] for p in queue_series if p["queue_depth"] is not None]
+    return {
+        "users": users,
+        "rate": rate,
+        "seconds": round(elapsed, 2),
+        "endpoints": endpoints,
+        "queue_depth": {"max": max(depths) if depths else None,
+                        "mean": round(statistics.fmean(depths), 2) if depths else None,
+                        "series": queue_series},
+    }
+
+
+_BARS = " ▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: list, width: int = 60) -> str:
+    values = [v for v in values if v is not None]
+    if not values:
+        return "(no /metrics samples)"
+    step = max(1, len(values) // width)
+    values = [max(values[i:i + step]) for i in range(0, len(values), step)]
+    top = max(values) or 1
+    return "".join(_BARS[round(v / top * (len(_BARS) - 1))] for v in values)
+
+
+def print_level(result: dict) -> None:
+    load = f"{result['rate']}/s open loop, max {result['users']} in flight" if result["rate"] \
+        else f"{result['users']} users closed loop"
+    print(f"\n== {load}, {result['seconds']}s ==")
+    print(f"{'endpoint':<10} {'reqs':>6} {'ok':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6} {'429%':>6} {'ok/s':>7}")
+    for endpoint, row in result["endpoints"].items():
+        fmt = lambda v: f"{v:8.3f}" if v is not None else f"{'-':>8}"
+        print(f"{endpoint:<10} {row['requests']:>6} {row['ok']:>6} {fmt(row['p50'])} {fmt(row['p95'])} {fmt(row['p99'])} "
+              f"{row['error_rate'] * 100:>6.1f} {row['rate_429'] * 100:>6.1f} {row['throughput_per_second']:>7.2f}")
+        for outcome, count in row["errors"].items():
+            print(f"{'':<10}   {count} x {outcome}")
+    queue = result["queue_depth"]
+    print(f"queue depth max {queue['max']}, mean {queue['mean']}: "
+          f"{sparkline([p['queue_depth'] for p in queue['series']])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running server")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 50, 200], help="Concurrency levels, run in turn")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load per level")
+    parser.add_argument("--rate", type=float, help="Open loop: Poisson arrivals per second (default: closed loop)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Closed loop: mean pause between a user's requests")
+    parser.add_argument("--pdf-ratio", type=float, default=0.3, help="Fraction of uploads that are PDFs")
+    parser.add_argument("--pdf-pages", type=int, default=2, help="Pages in the uploaded PDF")
+    parser.add_argument("--format", default="markdown", help="Output format key sent with each upload")
+    parser.add_argument("--no-download", action="store_true", help="Skip fetching /download after each job")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout in seconds")
+    parser.add_argument("--metrics-interval", type=float, default=1.0, help="Seconds between /metrics polls")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/load-<rev>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ink2pixel-load-") as work_dir:
+        payloads = make_payloads(work_dir, args.pdf_pages)
+    levels = []
+    for users in args.users:
+        result = asyncio.run(run_level(args.url, users, args.duration, payloads, args.pdf_ratio, args.format,
+                                       rate=args.rate, think_time=args.think_time, download=not args.no_download,
+                                       timeout=args.timeout, metrics_interval=args.metrics_interval))
+        print_level(result)
+        levels.append(result)
+
+    report = {
+        "benchmark": "load",
+        "revision": _git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "url": args.url,
+        "params": {"duration": args.duration, "rate": args.rate, "think_time": args.think_time,
+                   "pdf_ratio": args.pdf_ratio, "pdf_pages": args.pdf_pages, "format": args.format},
+        "levels": levels,
+    }
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"load-{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output}")
+
+
+if __name__ == "__main__":
+    main()
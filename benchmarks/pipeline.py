@@ -0,0 +1,253 @@
+"""
+End-to-end pipeline benchmark that runs on a laptop CPU.
+
+Measures the stages of a digitization job and writes the numbers to JSON, so
+two commits can be compared without a GPU or a model download:
+
+  rasterize   PDF page -> PNG, as DocumentDigitizer.iter_page_texts does it
+  math_fixup  DocumentDigitizer._fix_math_delimiters on a long transcript
+  export      _export_document for each text format (and docx if installed)
+  model       DocumentDigitizer._run_vlm on a tiny random-weight Qwen2.5-VL
+              (benchmarks/tiny_qwen.py): pages/s, time to first token,
+              prefill and decode tokens/s
+  memory      peak RSS of the run
+
+The model section needs torch, transformers and qwen_vl_utils. Without them
+it is recorded as skipped and the rest still runs.
+
+    python -m benchmarks.pipeline [--pages 4] [--max-new-tokens 64] [--output results.json]
+    python -m benchmarks.pipeline --compare base.json new.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fixtures
+from vlm.document_digitizer import DocumentDigitizer, iter_pdf_pages
+from vlm.metrics import resident_memory_bytes
+
+TEXT_FORMATS = ("md", "html", "latex", "txt")
+
+
+def _git_revision() -> str:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _versions() -> dict:
+    versions = {"python": platform.python_version()}
+    for name in ("torch", "transformers", "fitz", "PIL"):
+        module = sys.modules.get(name)
+        if module is None:
+            try:
+                module = __import__(name)
+            except ImportError:
+                continue
+        versions[name] = getattr(module, "__version__", getattr(module, "VersionBind", "?"))
+    return versions
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _summary(values: list) -> dict:
+    return {
+        "mean": round(statistics.fmean(values), 6),
+        "median": round(statistics.median(values), 6),
+        "min": round(min(values), 6),
+        "max": round(max(values), 6),
+    }
+
+
+# =============================================================================
+#  SECTIONS
+# =============================================================================
+
+def bench_rasterize(pdf_path: str, work_dir: str, zoom: float = 2.0) -> dict:
+    per_page = []
+    started = time.perf_counter()
+    page_started = started
+    for i, _, pix in iter_pdf_pages(pdf_path, zoom=zoom):
+        pix.save(os.path.join(work_dir, f"page_{i}.png"))
+        now = time.perf_counter()
+        per_page.append(now - page_started)
+        page_started = now
+    elapsed = time.perf_counter() - started
+    return {"pages": len(per_page), "zoom": zoom, "pages_per_second": round(len(per_page) / elapsed, 3),
+            "seconds_per_page": _summary(per_page)}
+
+
+def bench_math_fixup(digitizer: DocumentDigitizer, repeats: int = 20) -> dict:
+    text = fixtures.transcript(pages=40)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        digitizer._fix_math_delimiters(text)
+        timings.append(time.perf_counter() - started)
+    size = len(text.encode("utf-8"))
+    return {"input_bytes": size, "repeats": repeats, "seconds": _summary(timings),
+            "megabytes_per_second": round(size / statistics.median(timings) / 1e6, 3)}
+
+
+def bench_export(digitizer: DocumentDigitizer, work_dir: str, repeats: int = 10) -> dict:
+    text = digitizer._fix_math_delimiters(fixtures.transcript(pages=40))
+    formats = list(TEXT_FORMATS)
+    if importlib.util.find_spec("pypandoc") or importlib.util.find_spec("docx"):
+        formats.append("docx")
+    results = {}
+    for output_format in formats:
+        timings = []
+        for i in range(repeats if output_format != "docx" else max(1, repeats // 5)):
+            started = time.perf_counter()
+            digitizer._export_document(text, os.path.join(work_dir, f"export_{output_format}_{i}"), output_format)
+            timings.append(time.perf_counter() - started)
+        results[output_format] = _summary(timings)
+    return results
+
+
+def bench_model(image_paths: list, max_new_tokens: int, threads: int = None) -> dict:
+    try:
+        import torch  # noqa: F401
+        import qwen_vl_utils  # noqa: F401
+        from benchmarks.tiny_qwen import build_tiny_digitizer
+    except ImportError as e:
+        return {"skipped": f"{type(e).__name__}: {e}"}
+
+    digitizer = build_tiny_digitizer(max_new_tokens=max_new_tokens, threads=threads)
+    prompt = digitizer._get_prompt_for_format("md")
+    digitizer._run_vlm(image_paths[0], prompt)  # warm-up: allocator, kernels, lazy imports
+
+    pages = []
+    started = time.perf_counter()
+    for path in image_paths:
+        page_started = time.perf_counter()
+        digitizer._run_vlm(path, prompt)
+        stats = dict(digitizer.last_page, seconds=time.perf_counter() - page_started)
+        pages.append(stats)
+    elapsed = time.perf_counter() - started
+
+    ttft = [p["preprocess_seconds"] + p["prefill_seconds"] for p in pages]
+    return {
+        "pages": len(pages),
+        "max_new_tokens": max_new_tokens,
+        "torch_threads": torch.get_num_threads(),
+        "pages_per_second": round(len(pages) / elapsed, 3),
+        "time_to_first_token_seconds": _summary(ttft),
+        "preprocess_seconds": _summary([p["preprocess_seconds"] for p in pages]),
+        "prefill_tokens_per_second": round(
+            sum(p["prompt_tokens"] for p in pages) / sum(p["prefill_seconds"] for p in pages), 1),
+        "decode_tokens_per_second": round(
+            sum(p["generated_tokens"] - 1 for p in pages) / sum(p["decode_seconds"] for p in pages), 1),
+        "visual_tokens_per_page": _summary([p["visual_tokens"] for p in pages]),
+        "prompt_tokens_per_page": _summary([p["prompt_tokens"] for p in pages]),
+    }
+
+
+def run(pages: int = 4, max_new_tokens: int = 64, zoom: float = 2.0, threads: int = None,
+        skip_model: bool = False) -> dict:
+    digitizer = DocumentDigitizer.__new__(DocumentDigitizer)  # the text stages need no model
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="ink2pixel-bench-") as work_dir:
+        pdf_path = fixtures.make_pdf(os.path.join(work_dir, "notes.pdf"), pages=max(pages, 8))
+
+        print("Rasterizing PDF pages...")
+        results["rasterize"] = bench_rasterize(pdf_path, work_dir, zoom=zoom)
+        print("Timing math delimiter fixups...")
+        results["math_fixup"] = bench_math_fixup(digitizer)
+        print("Timing exports...")
+        results["export_seconds"] = bench_export(digitizer, work_dir)
+        results["rss_before_model_bytes"] = resident_memory_bytes()
+
+        if skip_model:
+            results["model"] = {"skipped": "--skip-model"}
+        else:
+            print(f"Running {pages} page(s) through the tiny Qwen2.5-VL...")
+            images = [os.path.join(work_dir, f"page_{i}.png") for i in range(pages)]
+            results["model"] = bench_model(images, max_new_tokens, threads)
+    results["peak_rss_bytes"] = _peak_rss_bytes()
+
+    return {
+        "benchmark": "pipeline",
+        "revision": _git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": {"machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()},
+        "versions": _versions(),
+        "params": {"pages": pages, "max_new_tokens": max_new_tokens, "zoom": zoom, "threads": threads},
+        "results": results,
+    }
+
+
+# =============================================================================
+#  COMPARISON
+# =============================================================================
+
+def _flatten(value, prefix="") -> dict:
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            out.update(_flatten(item, f"{prefix}.{key}" if prefix else key))
+        return out
+    return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+
+
+def compare(base_path: str, new_path: str) -> None:
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{base.get('revision')} -> {new.get('revision')}")
+    old_values, new_values = _flatten(base["results"]), _flatten(new["results"])
+    width = max(map(len, new_values), default=10)
+    for key, value in new_values.items():
+        if key not in old_values:
+            continue
+        old = old_values[key]
+        change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{key:<{width}}  {old:>14g}  {value:>14g}  {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=4, help="Pages run through the tiny model")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Tokens generated per page")
+    parser.add_argument("--zoom", type=float, default=2.0, help="PDF rasterization zoom (2.0 = 144 DPI, as in production)")
+    parser.add_argument("--threads", type=int, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--skip-model", action="store_true", help="Only run the model-free stages")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/pipeline-<rev>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Print the change between two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.pages, args.max_new_tokens, args.zoom, args.threads, args.skip_model)
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"pipeline-{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Benchmark for legacy_preprocessing.ImagePreprocessor on 300-DPI scans.
+
+Runs the current pipeline and a frozen copy of the original implementation
+(one full-image pass per connected component in clean_binary_image, a fresh
+array at every stage) on the same synthetic scans. It checks that the outputs
+are bit-identical and reports seconds per page for the whole pipeline and
+for each stage. The fast profile (reduced-resolution denoising) is timed too,
+with its ink agreement against the exact output.
+
+    python -m benchmarks.preprocessing [--pages 3] [--dpi 300] [--blobs 3000] [--output results.json]
+    python -m benchmarks.preprocessing --fast-sweep [--scans DIR]
+
+--blobs sets the number of ink rings per page, i.e. roughly the number of
+connected components the cleaning stage has to filter.
+
+--fast-sweep measures the fast profile over a page set instead: synthetic
+scans at 200-600 DPI with light and heavy grain, sharp and soft focus, and
+sparse and dense ink, or every image in --scans DIR. For each page it
+reports the full-page ink agreement with the exact pipeline, the check's
+window estimate of it, whether the page falls back to the exact filter, and
+both timings; then the fallback rate at FAST_MIN_AGREEMENT and at nearby
+thresholds. FAST_MIN_AGREEMENT was set from the synthetic set; run it on a
+folder of your own scans before relying on the fast profile.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import cv2
+import numpy as np
+
+from benchmarks import fixtures
+from benchmarks.pipeline import _git_revision, _summary, _versions
+from legacy_preprocessing import ImagePreprocessor, ink_agreement, stage_params
+from legacy_preprocessing.image_preprocessor import FAST_MIN_AGREEMENT, fast_scale
+from legacy_preprocessing.utils import load_image
+
+
+# =============================================================================
+#  REFERENCE (the pipeline as it was, kept verbatim for comparison)
+# =============================================================================
+
+def reference_stages(image: np.ndarray) -> dict:
+    """(output, {stage: seconds}, component count) for the original implementation."""
+    timings = {}
+
+    def timed(name, fn, *args):
+        started = time.perf_counter()
+        out = fn(*args)
+        timings[name] = time.perf_counter() - started
+        return out
+
+    def clean(image):
+        cleaned = cv2.medianBlur(image, 5)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(cleaned, connectivity=8)
+        cleaned_image = np.zeros_like(cleaned)
+        for i in range(1, num_labels):
+            if stats[i, cv2.CC_STAT_AREA] >= 10:
+                cleaned_image[labels == i] = 255
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2, 2))
+        return cv2.morphologyEx(cleaned_image, cv2.MORPH_CLOSE, kernel), num_labels - 1
+
+    gray = timed("grayscale", cv2.cvtColor, image, cv2.COLOR_BGR2GRAY)
+    out = timed("enhance_contrast", lambda g: cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(g), gray)
+    out = timed("reduce_noise", cv2.bilateralFilter, out, 15, 120, 120)
+    out = timed("apply_threshold", cv2.adaptiveThreshold, out, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY, 19, 8)
+    out, components = timed("clean_binary_image", clean, out)
+    return out, timings, components
+
+
+def current_stages(preprocessor: ImagePreprocessor, image: np.ndarray) -> tuple:
+    """Same stages through ImagePreprocessor, timed one by one (preprocess() minus the file read)."""
+    timings = {}
+    shape = image.shape[:2]
+    a, b = preprocessor._buffer('a', shape), preprocessor._buffer('b', shape)
+
+    def timed(name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        out = fn(*args, **kwargs)
+        timings[name] = time.perf_counter() - started
+        return out
+
+    timed("grayscale", cv2.cvtColor, image, cv2.COLOR_BGR2GRAY, dst=a)
+    timed("enhance_contrast", preprocessor.enhance_contrast, a, dst=b)
+    timed("reduce_noise", preprocessor.reduce_noise, b, method='bilateral', dst=a)
+    timed("apply_threshold", preprocessor.apply_threshold, a, method='adaptive', dst=b)
+    out = timed("clean_binary_image", preprocessor.clean_binary_image, b)
+    return out, timings
+
+
+def run(pages: int = 3, dpi: int = 300, blobs: int = 3000) -> dict:
+    preprocessor = ImagePreprocessor()
+    reference, current, identical, components = [], [], [], []
+    fast_seconds, fast_agreement = [], []
+    with tempfile.TemporaryDirectory(prefix="ink2pixel-preprocess-") as work_dir:
+        paths = [fixtures.make_scan(os.path.join(work_dir, f"scan_{i}.png"), dpi=dpi, blobs=blobs, seed=i)
+                 for i in range(pages)]
+        preprocessor.preprocess(paths[0])  # warm-up: buffers, OpenCV's thread pool
+
+        for i, path in enumerate(paths):
+            image = load_image(path)
+            print(f"Page {i + 1}/{pages}: reference...")
+            ref_out, ref_times, count = reference_stages(image)
+            print(f"Page {i + 1}/{pages}: current...")
+            out, times = current_stages(preprocessor, image)
+            started = time.perf_counter()
+            full = preprocessor.preprocess(path)
+            times["preprocess_total"] = time.perf_counter() - started
+            ref_times["preprocess_total"] = sum(ref_times.values())
+            started = time.perf_counter()
+            fast = preprocessor.preprocess(path, profile='fast')
+            fast_seconds.append(time.perf_counter() - started)
+            fast_agreement.append(round(ink_agreement(fast, ref_out), 4))
+
+            identical.append(bool(np.array_equal(out, ref_out) and np.array_equal(full, ref_out)))
+            components.append(count)
+            reference.append(ref_times)
+            current.append(times)
+
+    stages = list(reference[0])
+    results = {}
+    for stage in stages:
+        before = [t[stage] for t in reference]
+        after = [t[stage] for t in current]
+        results[stage] = {"reference": _summary(before), "current": _summary(after),
+                          "speedup": round(statistics.median(before) / statistics.median(after), 2)}
+    return {
+        "benchmark": "preprocessing",
+        "revision": _git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "versions": _versions(),
+        "params": {"pages": pages, "dpi": dpi, "blobs": blobs, "opencv_threads": cv2.getNumThreads()},
+        "results": {"bit_identical": all(identical), "components_per_page": components, "seconds": results,
+                    "fast_profile": {"seconds": _summary(fast_seconds), "ink_agreement": fast_agreement,
+                                     "speedup": round(results["preprocess_total"]["current"]["median"]
+                                                      / statistics.median(fast_seconds), 2)}},
+    }
+
+
+# =============================================================================
+#  FAST PROFILE OVER A PAGE SET
+# =============================================================================
+
+SWEEP_DPIS = (200, 300, 400, 600)
+SWEEP_NOISE = (3, 12)
+SWEEP_BLUR = (0.5, 2)
+SWEEP_BLOBS = (300, 3000)
+
+
+def sweep_pages(work_dir: str) -> list:
+    """Synthetic scans over every combination of the SWEEP_* settings."""
+    combos = itertools.product(SWEEP_DPIS, SWEEP_NOISE, SWEEP_BLUR, SWEEP_BLOBS)
+    return [fixtures.make_scan(os.path.join(work_dir, f"scan_{dpi}dpi_noise{noise}_blur{blur}_blobs{blobs}.png"),
+                               dpi=dpi, blobs=blobs, seed=i, noise=noise, blur=blur)
+            for i, (dpi, noise, blur, blobs) in enumerate(combos)]
+
+
+def fast_sweep(paths: list) -> dict:
+    """The fast profile against the exact pipeline on each page: agreement, check estimate, fallback, seconds."""
+    preprocessor = ImagePreprocessor()
+    params = stage_params()
+    pages = []
+    for i, path in enumerate(paths):
+        image = load_image(path)
+        if image is None:
+            continue
+        print(f"Page {i + 1}/{len(paths)}: {os.path.basename(path)}")
+        started = time.perf_counter()
+        exact = preprocessor.process_array(image)
+        exact_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        fast = preprocessor.process_array(image, profile='fast')
+        fast_seconds = time.perf_counter() - started
+        page = {"page": os.path.basename(path), "shape": list(image.shape[:2]),
+                "exact_seconds": round(exact_seconds, 4), "fast_seconds": round(fast_seconds, 4)}
+        if fast_scale(image.shape) > 1:
+            contrast = preprocessor.enhance_contrast(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+            estimate = preprocessor.check_fast_denoise(contrast, params)
+            # What the page would get without the check, to see what the check protects.
+            shrunk = preprocessor.apply_threshold(preprocessor.reduce_noise(contrast, method='fast'))
+            page.update(agreement=round(ink_agreement(preprocessor.clean_binary_image(shrunk), exact), 4),
+                        estimate=round(estimate, 4), fallback=estimate < FAST_MIN_AGREEMENT)
+        pages.append(page)
+
+    shrunk = [p for p in pages if "agreement" in p]
+    thresholds = [round(FAST_MIN_AGREEMENT + step, 2) for step in (-0.02, -0.01, 0, 0.01, 0.02)]
+    return {
+        "pages": pages,
+        "shrunk_pages": len(shrunk),
+        "min_agreement": FAST_MIN_AGREEMENT,
+        "fallback_rate": {str(t): round(sum(p["estimate"] < t for p in shrunk) / len(shrunk), 3) if shrunk else None
+                          for t in thresholds},
+        "worst_agreement": min((p["agreement"] for p in shrunk), default=None),
+        "worst_estimate_error": max((round(abs(p["estimate"] - p["agreement"]), 4) for p in shrunk), default=None),
+        "speedup": round(sum(p["exact_seconds"] for p in shrunk) / sum(p["fast_seconds"] for p in shrunk), 2)
+                   if shrunk else None,
+    }
+
+
+def main_sweep(args):
+    with tempfile.TemporaryDirectory(prefix="ink2pixel-fast-sweep-") as work_dir:
+        if args.scans:
+            paths = sorted(p for p in glob.glob(os.path.join(args.scans, "*"))
+                           if p.lower().endswith((".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")))
+        else:
+            paths = sweep_pages(work_dir)
+        results = fast_sweep(paths)
+    report = {
+        "benchmark": "preprocessing-fast-sweep",
+        "revision": _git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "versions": _versions(),
+        "params": {"scans": args.scans, "opencv_threads": cv2.getNumThreads()},
+        "results": results,
+    }
+    print(f"\n{'page':<40} {'agreement':>9} {'estimate':>8} {'fallback':>8} {'exact s':>8} {'fast s':>8}")
+    for page in results["pages"]:
+        print(f"{page['page'][:40]:<40} {page.get('agreement', '-'):>9} {page.get('estimate', '-'):>8} "
+              f"{str(page.get('fallback', '-')):>8} {page['exact_seconds']:>8.3f} {page['fast_seconds']:>8.3f}")
+    print(f"{results['shrunk_pages']} of {len(results['pages'])} pages shrunk; worst agreement "
+          f"{results['worst_agreement']}, worst estimate error {results['worst_estimate_error']}; "
+          f"{results['speedup']}x the exact pipeline on them")
+    print("Fallback rate by threshold: " + ", ".join(f"{t}: {rate:.0%}" for t, rate in results["fallback_rate"].items()
+                                                    if rate is not None))
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"preprocessing-fast-{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--blobs", type=int, default=3000, help="Ink rings per page")
+    parser.add_argument("--fast-sweep", action="store_true", help="Measure the fast profile over a page set")
+    parser.add_argument("--scans", help="With --fast-sweep: folder of real scans to use instead of synthetic pages")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/preprocessing-<rev>.json)")
+    args = parser.parse_args()
+    if args.fast_sweep:
+        return main_sweep(args)
+
+    report = run(args.pages, args.dpi, args.blobs)
+    results = report["results"]
+    print(f"\nBit-identical output: {results['bit_identical']}  "
+          f"(components per page: {results['components_per_page']})")
+    print(f"{'stage':<20} {'reference':>10} {'current':>10} {'speedup':>8}")
+    for stage, row in results["seconds"].items():
+        print(f"{stage:<20} {row['reference']['median']:>10.4f} {row['current']['median']:>10.4f} {row['speedup']:>7.1f}x")
+    fast = results["fast_profile"]
+    print(f"profile='fast': {fast['seconds']['median']:.4f} s/page, {fast['speedup']:.1f}x the exact pipeline, "
+          f"ink agreement {fast['ink_agreement']}")
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"preprocessing-{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+    if not results["bit_identical"]:
+        sys.exit("Output differs from the reference implementation")
+
+
+if __name__ == "__main__":
+    main()
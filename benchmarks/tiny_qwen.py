@@ -0,0 +1,124 @@
+"""
+A tiny, randomly initialized Qwen2.5-VL that runs DocumentDigitizer on CPU.
+
+The architecture matches the production model (vision tower with window
+attention, patch merger, M-RoPE language model) but has a couple of narrow
+layers, so a page takes well under a second and nothing is downloaded. The
+output is noise, so use it for speed, never for quality.
+
+The processor is a local stand-in for AutoProcessor. It uses the real
+Qwen2VLImageProcessor for resizing and patching, and a byte-level tokenizer
+with Qwen's special tokens, so DocumentDigitizer._run_vlm runs unchanged.
+"""
+import re
+
+# Byte-level vocabulary: ids 0-255 are bytes, then Qwen's special tokens.
+SPECIAL_TOKENS = ["<|im_start|>", "<|im_end|>", "<|vision_start|>", "<|vision_end|>",
+                  "<|image_pad|>", "<|video_pad|>", "<|endoftext|>"]
+TOKEN_IDS = {token: 256 + i for i, token in enumerate(SPECIAL_TOKENS)}
+VOCAB_SIZE = 272
+_SPECIAL_RE = re.compile("(" + "|".join(re.escape(t) for t in SPECIAL_TOKENS) + ")")
+
+
+class TinyProcessor:
+    """The slice of Qwen2_5_VLProcessor that DocumentDigitizer uses."""
+
+    def __init__(self):
+        from transformers import Qwen2VLImageProcessor
+
+        self.image_processor = Qwen2VLImageProcessor()
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        parts = []
+        for message in messages:
+            parts.append(f"<|im_start|>{message['role']}\n")
+            for item in message["content"]:
+                if item["type"] == "image":
+                    parts.append("<|vision_start|><|image_pad|><|vision_end|>")
+                elif item["type"] == "text":
+                    parts.append(item["text"])
+            parts.append("<|im_end|>\n")
+        if add_generation_prompt:
+            parts.append("<|im_start|>assistant\n")
+        return "".join(parts)
+
+    def _encode(self, text: str, image_tokens: list) -> list:
+        ids, images = [], iter(image_tokens)
+        for piece in _SPECIAL_RE.split(text):
+            if piece == "<|image_pad|>":
+                ids.extend([TOKEN_IDS[piece]] * next(images))
+            elif piece in TOKEN_IDS:
+                ids.append(TOKEN_IDS[piece])
+            else:
+                ids.extend(piece.encode("utf-8"))
+        return ids
+
+    def __call__(self, text, images=None, videos=None, padding=True, return_tensors="pt"):
+        import torch
+        from transformers.feature_extraction_utils import BatchFeature
+
+        data = {}
+        image_tokens = []
+        if images:
+            data.update(self.image_processor(images=images, return_tensors="pt"))
+            merge = self.image_processor.merge_size ** 2
+            image_tokens = [int(n) // merge for n in data["image_grid_thw"].prod(-1)]
+        input_ids = torch.tensor([self._encode(text[0], image_tokens)])
+        data.update(input_ids=input_ids, attention_mask=torch.ones_like(input_ids))
+        return BatchFeature(data)
+
+    def batch_decode(self, sequences, skip_special_tokens=True, clean_up_tokenization_spaces=False):
+        return [bytes(int(t) for t in seq if int(t) < 256).decode("utf-8", errors="replace") for seq in sequences]
+
+
+def tiny_config():
+    from transformers import Qwen2_5_VLConfig
+
+    return Qwen2_5_VLConfig(
+        vocab_size=VOCAB_SIZE,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=32768,
+        rope_scaling={"type": "mrope", "mrope_section": [2, 3, 3]},  # sums to head_dim / 2
+        vision_config={
+            "depth": 2,
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_heads": 2,
+            "out_hidden_size": 64,
+            "fullatt_block_indexes": [1],
+        },
+        image_token_id=TOKEN_IDS["<|image_pad|>"],
+        video_token_id=TOKEN_IDS["<|video_pad|>"],
+        vision_start_token_id=TOKEN_IDS["<|vision_start|>"],
+        vision_end_token_id=TOKEN_IDS["<|vision_end|>"],
+        bos_token_id=TOKEN_IDS["<|endoftext|>"],
+        eos_token_id=TOKEN_IDS["<|im_end|>"],
+    )
+
+
+def build_tiny_digitizer(max_new_tokens: int = 64, seed: int = 0, threads: int = None):
+    """A DocumentDigitizer around the tiny model, generating exactly max_new_tokens per page."""
+    import torch
+    from transformers import Qwen2_5_VLForConditionalGeneration
+    from vlm.document_digitizer import DocumentDigitizer, new_usage
+
+    torch.manual_seed(seed)
+    if threads:
+        torch.set_num_threads(threads)
+    model = Qwen2_5_VLForConditionalGeneration(tiny_config()).eval()
+    # Random weights could emit EOS at any point; fix the length so runs compare.
+    model.generation_config.eos_token_id = None
+    model.generation_config.pad_token_id = TOKEN_IDS["<|endoftext|>"]
+    model.generation_config.do_sample = False
+
+    digitizer = DocumentDigitizer.__new__(DocumentDigitizer)  # skip the 7B download in __init__
+    digitizer.device = "cpu"
+    digitizer.model = model
+    digitizer.processor = TinyProcessor()
+    digitizer.usage = new_usage()
+    digitizer.max_new_tokens = max_new_tokens
+    return digitizer
@@ -0,0 +1,98 @@
+"""
+Command-line entry point for running Ink2Pixel without the browser.
+
+    python ink2pixel.py batch INPUT... --output DIR [--format md ...] [--jobs N]
+    python ink2pixel.py watch INBOX [--output DIR] [--format md ...] [--jobs N]
+
+Jobs go to the same inference backend as the web app: the shared worker at
+INK2PIXEL_INFERENCE_ADDRESS (or --address) when there is one, otherwise a
+model loaded into this process (--backend).
+"""
+import argparse
+import os
+import sys
+
+from vlm.backends import BACKENDS
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--address", help="Inference worker to send jobs to (socket path or HOST:PORT)")
+    parser.add_argument("--backend", choices=BACKENDS, help="In-process backend when no worker is given")
+
+
+def apply_backend_arguments(args) -> None:
+    # vlm.backends.get_inference_backend() reads these.
+    if args.address:
+        os.environ["INK2PIXEL_INFERENCE_ADDRESS"] = args.address
+    if args.backend:
+        os.environ["INK2PIXEL_BACKEND"] = args.backend
+
+
+def cmd_batch(args) -> int:
+    from vlm.batch import run_batch
+
+    apply_backend_arguments(args)
+    summary = run_batch(
+        args.inputs,
+        output_dir=args.output,
+        formats=tuple(dict.fromkeys(args.format or ["md"])),
+        jobs=args.jobs,
+        manifest_path=args.manifest,
+        force=args.force,
+    )
+    return 1 if summary["error"] else 0
+
+
+def cmd_watch(args) -> int:
+    from vlm.hotfolder import HotFolder
+
+    apply_backend_arguments(args)
+    HotFolder(
+        args.inbox,
+        output_dir=args.output,
+        formats=tuple(dict.fromkeys(args.format or ["md"])),
+        jobs=args.jobs,
+        settle_seconds=args.settle,
+        poll_interval=args.poll_interval,
+        use_watchdog=not args.poll,
+    ).run()
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="ink2pixel", description="Digitize handwritten documents.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    from vlm.batch import OUTPUT_FORMATS
+    batch = commands.add_parser("batch", help="Digitize directories or globs of images/PDFs")
+    batch.add_argument("inputs", nargs="+", help="Files, directories (searched recursively) or glob patterns")
+    batch.add_argument("--output", "-o", required=True, help="Folder for the digitized documents")
+    batch.add_argument("--format", "-f", action="append", choices=OUTPUT_FORMATS,
+                       help="Output format; repeat for several (default: md)")
+    batch.add_argument("--jobs", "-j", type=int, default=1,
+                       help="Files kept in flight at once (worker backends only)")
+    batch.add_argument("--manifest", help="Manifest path (default: OUTPUT/.ink2pixel-manifest.jsonl)")
+    batch.add_argument("--force", action="store_true", help="Redo files the manifest lists as done")
+    add_backend_arguments(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    watch = commands.add_parser("watch", help="Digitize new files as they appear in a folder")
+    watch.add_argument("inbox", help="Folder to watch (subfolders included)")
+    watch.add_argument("--output", "-o", help="Folder for results (default: a sibling INBOX_digitized)")
+    watch.add_argument("--format", "-f", action="append", choices=OUTPUT_FORMATS,
+                       help="Output format; repeat for several (default: md)")
+    watch.add_argument("--jobs", "-j", type=int, default=1,
+                       help="Files processed at once (worker backends only)")
+    watch.add_argument("--settle", type=float, default=2.0,
+                       help="Seconds a file's size must stay unchanged before it is picked up")
+    watch.add_argument("--poll-interval", type=float, default=2.0, help="Rescan interval when polling")
+    watch.add_argument("--poll", action="store_true", help="Poll even if watchdog is installed")
+    add_backend_arguments(watch)
+    watch.set_defaults(func=cmd_watch)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+# ------------------ EDIT DISTANCE ------------------
+# Shared by test.py and the VLM accuracy harness (benchmarks/accuracy.py).
+#
+# levenshtein_distance() used to fill the full (m+1) x (n+1) table in pure
+# Python, which is fine for a 30-character line but takes seconds per pair on
+# page-length transcripts. This version trims the common prefix/suffix and
+# then runs Myers' bit-parallel algorithm (Hyyro's formulation): one column of
+# the table is a pair of Python ints, so each character of the longer string
+# costs a handful of big-int operations instead of a loop over the shorter one.
+# It works on any sequences of hashable items, so words work as well as chars.
+
+def levenshtein_distance(s1, s2):
+    """Compute edit distance (insert/delete/substitute, unit cost) between two sequences."""
+    if s1 == s2:
+        return 0
+
+    # Common prefix and suffix never contribute to the distance
+    start = 0
+    limit = min(len(s1), len(s2))
+    while start < limit and s1[start] == s2[start]:
+        start += 1
+    end1, end2 = len(s1), len(s2)
+    while end1 > start and end2 > start and s1[end1 - 1] == s2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    s1, s2 = s1[start:end1], s2[start:end2]
+
+    # Bit vectors are as wide as the pattern, so use the shorter one
+    pattern, text = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+    m = len(pattern)
+    if m == 0:
+        return len(text)
+
+    peq = {}
+    for i, item in enumerate(pattern):
+        peq[item] = peq.get(item, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for item in text:
+        eq = peq.get(item, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+    return score
+
@@ -6,6 +6,7 @@ import string
 import os
 from learning import TinyOCR
 from decoder import ctc_beam_search_decode
+from edit_distance import levenshtein_distance
 
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
@@ -83,25 +84,6 @@ for val, (img_path, gt_text) in enumerate(controlled_images):
     print(f"PR : {pr_text}\n")
    
 # ------------------ ACCURACY METRICS ------------------
-def levenshtein_distance(s1, s2):
-    """Compute edit distance between two strings."""
-    m, n = len(s1), len(s2)
-    dp = [[0]*(n+1) for _ in range(m+1)]
-
-    for i in range(m+1):
-        dp[i][0] = i
-    for j in range(n+1):
-        dp[0][j] = j
-
-    for i in range(1, m+1):
-        for j in range(1, n+1):
-            cost = 0 if s1[i-1] == s2[j-1] else 1
-            dp[i][j] = min(
-                dp[i-1][j] + 1,      
-                dp[i][j-1] + 1,      
-                dp[i-1][j-1] + cost  
-            )
-    return dp[m][n]
 
 def evaluate_dataset(dataset, name="Dataset"):
     total_chars = 0
@@ -4,9 +4,14 @@ Ink2Pixel Preprocessing Module
 This module provides image preprocessing functionality for handwritten document analysis.
 """
 
-from .image_preprocessor import ImagePreprocessor
+from .image_preprocessor import ImagePreprocessor, DEFAULT_PARAMS, PROFILES, stage_params, ink_agreement
 from .layout_detector import LayoutDetector
-from .contour_analyzer import ContourAnalyzer
+from .contour_analyzer import ContourAnalyzer, LINE_DTYPE
+from .geometry_corrector import GeometryCorrector
+from .regions import Regions, REGION_DTYPE
+from .cache import StageCache
+from .tiled_preprocessor import TiledPreprocessor, open_source
+from .parallel import preprocess_many
 from .utils import (
     load_image,
     save_image,
@@ -17,8 +22,20 @@ from .utils import (
 
 __all__ = [
     'ImagePreprocessor',
+    'DEFAULT_PARAMS',
+    'PROFILES',
+    'stage_params',
+    'ink_agreement',
     'LayoutDetector', 
     'ContourAnalyzer',
+    'LINE_DTYPE',
+    'GeometryCorrector',
+    'Regions',
+    'REGION_DTYPE',
+    'StageCache',
+    'TiledPreprocessor',
+    'open_source',
+    'preprocess_many',
     'load_image',
     'save_image',
     'validate_image',
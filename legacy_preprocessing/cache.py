@@ -0,0 +1,216 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+def content_key(image: np.ndarray) -> str:
+    """Hash of an array's shape, dtype and pixels."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.shape}{image.dtype.str}".encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def stage_key(previous: str, stage: str, params: dict) -> str:
+    """Key of a stage's output, given the key of its input and the stage's keyword arguments."""
+    description = json.dumps([previous, stage, params], sort_keys=True, default=str)
+    return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+class StageCache:
+    """
+    Results of preprocessing stages, keyed by content and parameters.
+
+    An in-memory LRU holds up to max_bytes of arrays. With disk_dir set,
+    entries put with persist=True are also written there, zlib-compressed,
+    and survive restarts; a disk hit is promoted back into memory. The disk
+    tier is kept under max_disk_bytes by removing the files read or written
+    least recently (by mtime, which a read refreshes), so processes sharing
+    disk_dir also share one LRU order. Cached arrays are read-only. Safe to
+    share between threads.
+
+    Keys come from content_key() and stage_key(). Chaining stage keys from
+    the input's content key means every upstream parameter is part of a
+    stage's key without hashing intermediate images.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_dir: str = None, compress_level: int = 1,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.compress_level = compress_level
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_bytes = 0
+        self.hits = self.disk_hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = None  # estimate; taken from a scan of disk_dir when needed
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[np.ndarray]:
+        """
+        The cached array for key (read-only), or None.
+
+        Args:
+            key: From content_key() / stage_key()
+            count_miss: Count a None result in stats(); pass False when
+                probing several keys for one result, then record_miss() once
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._read(key)
+        with self._lock:
+            if value is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def record_miss(self) -> None:
+        """Count one miss, for a lookup made of several get(count_miss=False) probes."""
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, value: np.ndarray, persist: bool = True) -> None:
+        """
+        Cache a copy of value under key.
+
+        Args:
+            key: From content_key() / stage_key()
+            value: Array to cache; later changes to it do not affect the cache
+            persist: Also write it to disk_dir, when there is one
+        """
+        value = np.array(value, copy=True)
+        value.flags.writeable = False
+        with self._lock:
+            self._remember(key, value)
+        if persist and self.disk_dir:
+            self._write(key, value)
+
+    def clear(self, disk: bool = False) -> None:
+        """Empty the memory tier, and the disk tier too if disk is True."""
+        with self._lock:
+            self._entries.clear()
+            self.memory_bytes = 0
+        if disk and self.disk_dir:
+            with self._disk_lock:
+                for path, _, _ in self._disk_entries():
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'memory_bytes': self.memory_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes,
+            }
+
+    def _remember(self, key: str, value: np.ndarray) -> None:
+        """Insert into the LRU (lock held) and evict down to max_bytes."""
+        if value.nbytes > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= previous.nbytes
+        self._entries[key] = value
+        self.memory_bytes += value.nbytes
+        while self.memory_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npy.z")
+
+    def _read(self, key: str) -> Optional[np.ndarray]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = np.lib.format.read_array(io.BytesIO(zlib.decompress(f.read())))
+            os.utime(path)  # most recently used: evicted last
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"Warning: ignoring unreadable cache entry {key}: {e}")
+            return None
+        value.flags.writeable = False
+        return value
+
+    def _write(self, key: str, value: np.ndarray) -> None:
+        path = self._path(key)
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer, value, allow_pickle=False)
+        data = zlib.compress(buffer.getbuffer(), self.compress_level)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name and renamed, so readers never see half a file.
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Warning: could not write cache entry {key}: {e}")
+            return
+        self._account(len(data))
+
+    def _disk_entries(self) -> list:
+        """[(path, mtime, size)] of every entry in disk_dir, this process's or another's."""
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith('.npy.z'):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def _account(self, size: int) -> None:
+        """Add a written entry to the disk usage; past max_disk_bytes, remove the least recently used."""
+        with self._disk_lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+                if self._disk_bytes <= self.max_disk_bytes:
+                    return
+            # Other processes may share disk_dir, so the estimate is only a
+            # trigger: the directory itself says what there is to evict.
+            entries = sorted(self._disk_entries(), key=lambda entry: entry[1])
+            total = sum(entry[2] for entry in entries)
+            for path, _, entry_size in entries:
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= entry_size
+            self._disk_bytes = total
@@ -1,110 +1,148 @@
 import cv2
 import numpy as np
-from typing import List, Dict
+from typing import Dict, Iterable, List
+from .regions import Regions
 from .utils import validate_image
 
+# One text line per row: the page it is on and its bounding box.
+LINE_DTYPE = np.dtype([('page', np.int32), ('x', np.int32), ('y', np.int32),
+                       ('width', np.int32), ('height', np.int32)])
+
 
 class ContourAnalyzer:
     def __init__(self):
         self.text_lines = []
-        self.characters = []
+        self.characters = Regions()
     
     def find_text_lines_peaks(self, image: np.ndarray) -> List[Dict]:
         if not validate_image(image):
             return []
         
+        lines = []
+        for x, y, w, h in self._line_boxes(image).tolist():
+            lines.append({
+                'bbox': (x, y, w, h),
+                'y_start': y,
+                'y_end': y + h,
+                'height': h
+            })
+        
+        return lines
+    
+    def segment_lines(self, images: Iterable[np.ndarray]) -> np.ndarray:
+        """
+        Text lines of many binary pages in one structured array.
+        
+        Lines are the same as find_text_lines_peaks() finds, one row each,
+        tagged with the index of their page. Invalid pages contribute no rows.
+        
+        Args:
+            images: Binary page images (text 255)
+            
+        Returns:
+            Array of LINE_DTYPE, ordered by page, then top to bottom
+        """
+        pages, boxes = [], []
+        for page, image in enumerate(images):
+            if not validate_image(image):
+                continue
+            found = self._line_boxes(image)
+            pages.append(np.full(len(found), page, dtype=np.int32))
+            boxes.append(found)
+        
+        lines = np.empty(sum(len(found) for found in boxes), dtype=LINE_DTYPE)
+        if boxes:
+            lines['page'] = np.concatenate(pages)
+            found = np.concatenate(boxes)
+            for column, field in enumerate(('x', 'y', 'width', 'height')):
+                lines[field] = found[:, column]
+        return lines
+    
+    def _line_boxes(self, image: np.ndarray) -> np.ndarray:
+        """(N, 4) array of line (x, y, w, h), top to bottom."""
         height, width = image.shape
-        horizontal_projection = np.sum(image == 255, axis=1)
+        # Text mask (0/255) and its row sums, in OpenCV: several times faster than numpy here.
+        text = cv2.compare(image, 255, cv2.CMP_EQ)
+        horizontal_projection = cv2.reduce(text, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+        no_lines = np.empty((0, 4), dtype=np.int64)
         
-        text_rows = np.where(horizontal_projection > 5)[0]
+        text_rows = np.flatnonzero(horizontal_projection > 5)
         if len(text_rows) > 0:
             total_text_height = text_rows[-1] - text_rows[0] + 1
-            estimated_line_height = total_text_height // 3 * 1.2  
+            estimated_line_height = total_text_height // 3 * 1.2
         else:
-            estimated_line_height = 60  
+            estimated_line_height = 60
         
-        peaks = []
-        threshold = np.max(horizontal_projection) * 0.6
+        # Peaks: rows 10..height-11 above 60% of the fullest row, higher than
+        # the rows 8 away and at least as high as their neighbours.
+        if height < 21:
+            return no_lines
+        p = horizontal_projection
+        row = p[10:height - 10]
+        is_peak = ((row > np.max(p) * 0.6) & (row > p[2:height - 18]) & (row > p[18:height - 2]) &
+                   (row >= p[9:height - 11]) & (row >= p[11:height - 9]))
+        peaks = np.flatnonzero(is_peak) + 10
+        if len(peaks) == 0:
+            return no_lines
         
-        for i in range(10, len(horizontal_projection) - 10):
-            if (horizontal_projection[i] > threshold and
-                horizontal_projection[i] > horizontal_projection[i-8] and
-                horizontal_projection[i] > horizontal_projection[i+8] and
-                horizontal_projection[i] >= horizontal_projection[i-1] and
-                horizontal_projection[i] >= horizontal_projection[i+1]):
-                peaks.append(i)
+        # Keep the first peak, then the first one at least min_distance below
+        # the last kept, and so on. next_kept[i] is the peak kept after i; the
+        # chain from 0 is followed by pointer doubling, log2(peaks) steps.
+        min_distance = int(estimated_line_height * 0.6)
+        if min_distance > 0:
+            count = len(peaks)
+            next_kept = np.append(np.searchsorted(peaks, peaks + min_distance), count)
+            kept = np.zeros(count + 1, dtype=bool)
+            kept[0] = True
+            step = 1
+            while step < count:
+                kept[next_kept[kept]] = True
+                next_kept = next_kept[next_kept]
+                step *= 2
+            peaks = peaks[kept[:count]]
         
-        filtered_peaks = []
-        min_distance = int(estimated_line_height * 0.6)  
+        starts = np.maximum(0, np.trunc(peaks - estimated_line_height * 0.6).astype(np.int64))
+        ends = np.minimum(height, np.trunc(peaks + estimated_line_height * 0.4).astype(np.int64))
+        ends[-1] = height
         
-        for peak in peaks:
-            if not filtered_peaks or peak - filtered_peaks[-1] >= min_distance:
-                filtered_peaks.append(peak)
+        # First and last row in each band with more than 3 text pixels.
+        dense_rows = np.flatnonzero(horizontal_projection > 3)
+        first = np.searchsorted(dense_rows, starts)
+        last = np.searchsorted(dense_rows, ends) - 1
+        has_rows = last >= first
+        top = dense_rows[np.minimum(first, len(dense_rows) - 1)] if len(dense_rows) else starts
+        bottom = dense_rows[np.maximum(last, 0)] if len(dense_rows) else starts
         
-        lines = []
+        # Per-band column counts: sum the rows between consecutive band
+        # edges once, then difference the running totals (bands overlap).
+        edges = np.unique(np.concatenate([starts, ends]))
+        edges = edges[edges < height]
+        bounds = np.append(edges, height)
+        totals = np.zeros((len(edges) + 1, width), dtype=np.int32)
+        for i in range(len(edges)):
+            totals[i + 1] = cv2.reduce(text[bounds[i]:bounds[i + 1]], 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)
+        np.cumsum(totals, axis=0, out=totals)
+        totals //= 255
+        columns = totals[np.searchsorted(edges, ends)] - totals[np.searchsorted(edges, starts)]
+        dense_columns = columns > 3
+        has_columns = dense_columns.any(axis=1)
+        left = np.argmax(dense_columns, axis=1)
+        right = width - 1 - np.argmax(dense_columns[:, ::-1], axis=1)
         
-        for i, peak in enumerate(filtered_peaks):
-            y_start = max(0, int(peak - estimated_line_height * 0.6))  
-            y_end = min(height, int(peak + estimated_line_height * 0.4))  
-            
-            if i == len(filtered_peaks) - 1:
-                y_end = height
-            
-            region = image[y_start:y_end, :]
-            rows_with_text = np.where(np.sum(region == 255, axis=1) > 3)[0]
-            cols_with_text = np.where(np.sum(region == 255, axis=0) > 3)[0]
-            
-            if len(rows_with_text) > 0 and len(cols_with_text) > 0:
-                min_row = rows_with_text[0]
-                max_row = rows_with_text[-1]
-                min_col = cols_with_text[0]
-                max_col = cols_with_text[-1]
-                
-                actual_y = y_start + min_row
-                actual_height = max_row - min_row + 1
-                actual_x = min_col
-                actual_width = max_col - min_col + 1
-                
-                lines.append({
-                    'bbox': (actual_x, actual_y, actual_width, actual_height),
-                    'y_start': actual_y,
-                    'y_end': actual_y + actual_height,
-                    'height': actual_height
-                })
-        
-        return lines
+        found = has_rows & has_columns
+        return np.stack([left, top, right - left + 1, bottom - top + 1], axis=1)[found]
     
-    def find_character_contours(self, image: np.ndarray) -> List[Dict]:
+    def find_character_contours(self, image: np.ndarray) -> Regions:
         if not validate_image(image):
-            return []
+            return Regions()
         
         contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
-        characters = []
-        min_area = 20
         max_area = image.shape[0] * image.shape[1] * 0.1
-        
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            
-            if area < min_area or area > max_area:
-                continue
-            
-            x, y, w, h = cv2.boundingRect(contour)
-            aspect_ratio = w / h
-            
-            if (aspect_ratio > 3 or aspect_ratio < 0.1 or
-                w < 3 or h < 5 or w > 200 or h > 200):
-                continue
-            
-            characters.append({
-                'contour': contour,
-                'bbox': (x, y, w, h),
-                'area': area,
-                'center': (x + w//2, y + h//2)
-            })
-        
-        characters.sort(key=lambda char: (char['bbox'][1], char['bbox'][0]))
+        characters = Regions.from_contours(contours).filter(min_area=20, max_area=max_area,
+                                                            min_aspect_ratio=0.1, max_aspect_ratio=3,
+                                                            min_size=(3, 5), max_size=(200, 200))
+        characters = characters.sort(('y', 'x'))
         self.characters = characters
         
-        return characters
\ No newline at end of file
+        return characters
@@ -1,95 +1,328 @@
 import cv2
 import numpy as np
 from typing import Optional, Tuple
+from .cache import StageCache, content_key, stage_key
 from .utils import load_image, save_image, validate_image
 
+# Built once; every call used to rebuild these.
+OPEN_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+CLOSE_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2, 2))
+GAMMA_LUT = np.array([((i / 255.0) ** 1.2) * 255 for i in np.arange(0, 256)]).astype("uint8")
+
+# Keyword arguments preprocess() passes to each stage, in pipeline order.
+# Override any of them per call with the params argument.
+DEFAULT_PARAMS = {
+    'enhance_contrast': {'method': 'clahe', 'clip_limit': 2.0, 'tile_grid': (8, 8)},
+    'reduce_noise': {'method': 'bilateral', 'diameter': 15, 'sigma': 120},
+    'apply_threshold': {'method': 'adaptive', 'block_size': 19, 'offset': 8},
+    'clean_binary_image': {'min_size': 10},
+}
+
+# Named sets of overrides, selected with profile=. 'fast' denoises large
+# pages at reduced resolution; see ImagePreprocessor.reduce_noise and
+# check_fast_denoise.
+PROFILES = {
+    'exact': {},
+    'fast': {'reduce_noise': {'method': 'fast'}},
+}
+
+STAGES = ('enhance_contrast', 'reduce_noise', 'apply_threshold', 'clean_binary_image')
+
+# The fast profile shrinks a page by one step per FAST_MIN_SIDE pixels of
+# its shorter side (a 300 DPI page is halved, a 150 DPI one is not touched),
+# as long as the shrunk filter keeps a diameter of at least FAST_MIN_DIAMETER.
+FAST_MIN_SIDE = 1200
+FAST_MIN_DIAMETER = 7
+
+# The fast profile's quality check: ink agreement (Dice) of the fast and the
+# exact bilateral filter on a FAST_CHECK_WINDOW square of the page, below
+# which the page gets the exact filter. From `python -m
+# benchmarks.preprocessing --fast-sweep`: on its shrunk synthetic pages the
+# whole-page agreement is 0.953-0.997 and the window estimates it to within
+# 0.015, so 0.94 lets all of them through and stops pages clearly worse.
+FAST_CHECK_WINDOW = 512
+FAST_MIN_AGREEMENT = 0.94
+
+
+def stage_params(params: dict = None, profile: str = 'exact') -> dict:
+    """DEFAULT_PARAMS, then the profile's overrides, then the stage keyword arguments in params."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown preprocessing profile: {profile}")
+    merged = {stage: dict(defaults) for stage, defaults in DEFAULT_PARAMS.items()}
+    for overrides in (PROFILES[profile], params or {}):
+        for stage, values in overrides.items():
+            if stage not in merged:
+                raise ValueError(f"Unknown preprocessing stage: {stage}")
+            merged[stage].update(values)
+    return merged
+
+
+def fast_scale(shape: Tuple[int, ...], diameter: int = 15) -> int:
+    """How many times reduce_noise(method='fast') shrinks an image of this shape; 1 means not at all."""
+    return max(1, min(min(shape[:2]) // FAST_MIN_SIDE, diameter // FAST_MIN_DIAMETER))
+
+
+def ink_agreement(binary: np.ndarray, reference: np.ndarray) -> float:
+    """Dice overlap of the ink (0) pixels of two binary images; 1.0 when neither has ink."""
+    ink, reference_ink = binary == 0, reference == 0
+    total = np.count_nonzero(ink) + np.count_nonzero(reference_ink)
+    if total == 0:
+        return 1.0
+    return float(2 * np.count_nonzero(ink & reference_ink) / total)
+
+
+def _upsample_guided(small: np.ndarray, filtered: np.ndarray, image: np.ndarray, dst: np.ndarray = None) -> np.ndarray:
+    """
+    Bring a filter's output on a shrunk copy back to the size of image.
+
+    Fits filtered ~ a * small + b over 3x3 neighbourhoods of the shrunk copy
+    (as a guided filter does), scales a and b up and applies them to image,
+    so edges keep their full-resolution position instead of being blurred
+    by the upscaling.
+    """
+    height, width = image.shape[:2]
+    small, filtered = small.astype(np.float32), filtered.astype(np.float32)
+    mean_small, mean_filtered = cv2.blur(small, (3, 3)), cv2.blur(filtered, (3, 3))
+    covariance = cv2.blur(small * filtered, (3, 3)) - mean_small * mean_filtered
+    variance = cv2.blur(small * small, (3, 3)) - mean_small * mean_small
+    # A large regularizer: in flat paper the fit falls back to the filtered mean.
+    slope = covariance / (variance + 1000)
+    offset = mean_filtered - slope * mean_small
+    slope = cv2.resize(slope, (width, height), interpolation=cv2.INTER_LINEAR)
+    offset = cv2.resize(offset, (width, height), interpolation=cv2.INTER_LINEAR)
+    return cv2.convertScaleAbs(cv2.add(cv2.multiply(slope, image, dtype=cv2.CV_32F), offset), dst)
+
+
+def _fast_bilateral(image: np.ndarray, scale: int, diameter: int, sigma: float, dst: np.ndarray = None) -> np.ndarray:
+    """The bilateral filter run on image shrunk scale times, brought back with _upsample_guided."""
+    if scale == 1:
+        return cv2.bilateralFilter(image, diameter, sigma, sigma, dst)
+    height, width = image.shape[:2]
+    small = cv2.resize(image, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+    filtered = cv2.bilateralFilter(small, diameter // scale | 1, sigma, sigma / scale)
+    return _upsample_guided(small, filtered, image, dst)
+
 
 class ImagePreprocessor:
-    """Main preprocessing pipeline for handwritten document images."""
+    """Main preprocessing pipeline for handwritten document images.
     
-    def __init__(self):
+    Every stage takes an optional dst array to write into. preprocess() runs
+    the stages through scratch buffers kept on the instance (grayscale
+    buffers used ping-pong plus a label buffer), so repeated calls on
+    same-sized pages allocate only the returned image. Not thread-safe: use
+    one instance per thread.
+    
+    With a StageCache, every stage's output is cached under the page's
+    content hash and the parameters of that stage and all before it. A
+    repeated call returns the binarized page from the cache, and a call that
+    changes only later stages resumes from the last cached one. Share one
+    cache between instances (and threads) to share results.
+    """
+    
+    def __init__(self, cache: StageCache = None):
         self.processed_image = None
         self.original_image = None
+        self.cache = cache
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self._scratch = {}
+    
+    def _buffer(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """A scratch array reused across calls while the page size stays the same."""
+        buffer = self._scratch.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self._scratch[name] = np.empty(shape, dtype=dtype)
+        return buffer
     
-    def preprocess(self, image_path: str, output_path: str = None) -> Optional[np.ndarray]:
-        """Complete preprocessing pipeline."""
+    def preprocess(self, image_path: str, output_path: str = None, params: dict = None,
+                   profile: str = 'exact') -> Optional[np.ndarray]:
+        """Complete preprocessing pipeline. params: per-stage overrides; profile: a PROFILES name."""
         self.original_image = load_image(image_path, color_mode='color')
         if not validate_image(self.original_image):
             return None
         
-        gray = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2GRAY)
-        
-        processed = self.enhance_contrast(gray)
-        processed = self.reduce_noise(processed, method='bilateral')
-        processed = self.apply_threshold(processed, method='adaptive')
-        processed = self.clean_binary_image(processed)
+        processed = self.process_array(self.original_image, params, profile)
         
         self.processed_image = processed
 
         return processed
     
-    def enhance_contrast(self, image: np.ndarray, method: str = 'clahe') -> np.ndarray:
+    def process_array(self, image: np.ndarray, params: dict = None, profile: str = 'exact') -> np.ndarray:
+        """The preprocess() pipeline on an image already in memory; keeps nothing on the instance."""
+        params = stage_params(params, profile)
+        shape = image.shape[:2]
+        a, b = self._buffer('a', shape), self._buffer('b', shape)
+        
+        keys, start = None, 0
+        if self.cache is not None:
+            keys = self._stage_keys(image, params)
+            # One lookup, probed from the last stage back: a miss is counted once, not per stage.
+            for index in range(len(STAGES) - 1, -1, -1):
+                cached = self.cache.get(keys[index], count_miss=False)
+                if cached is not None:
+                    if index == len(STAGES) - 1:
+                        return cached.copy()
+                    a[:] = cached
+                    start = index + 1
+                    break
+            else:
+                self.cache.record_miss()
+        
+        if start == 0:
+            if image.ndim == 3:
+                cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=a)
+            else:
+                a[:] = image
+        current = a
+        for index in range(start, len(STAGES) - 1):
+            stage = STAGES[index]
+            stage_args = params[stage]
+            if (stage == 'reduce_noise' and stage_args['method'] == 'fast'
+                    and fast_scale(shape, stage_args['diameter']) > 1):
+                # Checked before the page is denoised, so a page that fails costs
+                # the exact filter plus one window, not both filters on the whole page.
+                agreement = self.check_fast_denoise(current, params)
+                if agreement < FAST_MIN_AGREEMENT:
+                    print(f"Fast denoise agrees with the bilateral filter on only {agreement:.1%} of ink; "
+                          f"using the bilateral filter for this page")
+                    stage_args = dict(stage_args, method='bilateral')
+            # A stage with method=None hands back its input; keep writing into the other buffer.
+            current = getattr(self, stage)(current, dst=b if current is a else a, **stage_args)
+            if keys is not None:
+                self.cache.put(keys[index], current, persist=False)
+        
+        result = self.clean_binary_image(current, **params['clean_binary_image'])
+        if keys is not None:
+            self.cache.put(keys[-1], result)
+        return result
+    
+    def _stage_keys(self, image: np.ndarray, params: dict) -> list:
+        """Cache key of each stage's output for this image and these parameters."""
+        keys, key = [], content_key(image)
+        for stage in STAGES:
+            key = stage_key(key, stage, params[stage])
+            keys.append(key)
+        return keys
+    
+    def enhance_contrast(self, image: np.ndarray, method: str = 'clahe', dst: np.ndarray = None,
+                         clip_limit: float = 2.0, tile_grid: Tuple[int, int] = (8, 8)) -> np.ndarray:
         """Enhance image contrast."""
         if method == 'clahe':
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            return clahe.apply(image)
+            if self._clahe.getClipLimit() != clip_limit:
+                self._clahe.setClipLimit(clip_limit)
+            if tuple(self._clahe.getTilesGridSize()) != tuple(tile_grid):
+                self._clahe.setTilesGridSize(tuple(tile_grid))
+            return self._clahe.apply(image, dst)
         
         elif method == 'histogram_eq':
-            return cv2.equalizeHist(image)
+            return cv2.equalizeHist(image, dst)
         
         elif method == 'gamma':
-            gamma = 1.2
-            lookup_table = np.array([((i / 255.0) ** gamma) * 255 for i in np.arange(0, 256)]).astype("uint8")
-            return cv2.LUT(image, lookup_table)
+            return cv2.LUT(image, GAMMA_LUT, dst)
         
         return image
     
-    def reduce_noise(self, image: np.ndarray, method: str = 'bilateral') -> np.ndarray:
-        """Reduce noise while preserving edges."""
+    def reduce_noise(self, image: np.ndarray, method: str = 'bilateral', dst: np.ndarray = None,
+                     diameter: int = 15, sigma: float = 120) -> np.ndarray:
+        """
+        Reduce noise while preserving edges. dst must not be image.
+        
+        'fast' runs the bilateral filter on a copy shrunk by fast_scale()
+        (diameter and spatial sigma shrink with it) and brings the result
+        back to full size through a local linear fit to the full-size
+        image, which keeps ink edges where they were. Images too small to
+        shrink get the exact filter.
+        """
         if method == 'bilateral':
-            return cv2.bilateralFilter(image, 15, 120, 120)
+            return cv2.bilateralFilter(image, diameter, sigma, sigma, dst)
+        elif method == 'fast':
+            return _fast_bilateral(image, fast_scale(image.shape, diameter), diameter, sigma, dst)
         elif method == 'gaussian':
-            return cv2.GaussianBlur(image, (5, 5), 0)
+            return cv2.GaussianBlur(image, (5, 5), 0, dst)
         elif method == 'median':
-            return cv2.medianBlur(image, 5)
+            return cv2.medianBlur(image, 5, dst)
         
         return image
     
-    def apply_threshold(self, image: np.ndarray, method: str = 'adaptive') -> np.ndarray:
+    def check_fast_denoise(self, contrast: np.ndarray, params: dict = None) -> float:
+        """
+        Estimate how closely the fast profile will match the exact filter on this page.
+        
+        Both reduce_noise methods and the threshold are run on a sample of
+        the page, the FAST_CHECK_WINDOW square with the most ink (the
+        darkest), with enough margin that the window comes out as it would
+        on the full page.
+        
+        Args:
+            contrast: Page after enhance_contrast
+            params: Stage parameters (as from stage_params)
+            
+        Returns:
+            ink_agreement of the two binarizations inside the window
+        """
+        params = stage_params(params)
+        noise, threshold = params['reduce_noise'], params['apply_threshold']
+        diameter, sigma = noise['diameter'], noise['sigma']
+        scale = fast_scale(contrast.shape, diameter)
+        height, width = contrast.shape
+        size = min(FAST_CHECK_WINDOW, height, width)
+        
+        # Mean brightness per window-sized cell: the darkest has the most ink.
+        rows, cols = max(1, height // size), max(1, width // size)
+        cells = cv2.resize(contrast[:rows * size, :cols * size], (cols, rows), interpolation=cv2.INTER_AREA)
+        row, col = np.unravel_index(np.argmin(cells), cells.shape)
+        y, x = row * size, col * size
+        
+        # Margin in whole shrink steps, so the window shrinks on the same grid as the page.
+        margin = diameter // 2 + threshold['block_size'] // 2 + 2 * scale
+        margin += -margin % scale
+        top, left = max(0, y - margin), max(0, x - margin)
+        bottom, right = min(height, y + size + margin), min(width, x + size + margin)
+        bottom, right = top + (bottom - top) // scale * scale, left + (right - left) // scale * scale
+        window = np.ascontiguousarray(contrast[top:bottom, left:right])
+        exact = self.apply_threshold(cv2.bilateralFilter(window, diameter, sigma, sigma), **threshold)
+        fast = self.apply_threshold(_fast_bilateral(window, scale, diameter, sigma), **threshold)
+        
+        inside = (slice(y - top, y - top + size), slice(x - left, x - left + size))
+        return ink_agreement(fast[inside], exact[inside])
+    
+    def apply_threshold(self, image: np.ndarray, method: str = 'adaptive', dst: np.ndarray = None,
+                        block_size: int = 19, offset: float = 8) -> np.ndarray:
         """Convert to binary image."""
         if method == 'adaptive':
             return cv2.adaptiveThreshold(
                 image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY, 19, 8
+                cv2.THRESH_BINARY, block_size, offset, dst
             )
         elif method == 'otsu':
-            _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst)
             return binary
         elif method == 'simple':
-            _, binary = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY)
+            _, binary = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY, dst)
             return binary
         
         return image
     
-    def clean_binary_image(self, image: np.ndarray) -> np.ndarray:
-        """Remove noise from binary image."""
-        cleaned = cv2.medianBlur(image, 5)
-        
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+    def clean_binary_image(self, image: np.ndarray, min_size: int = 10) -> np.ndarray:
+        """
+        Remove noise from binary image.
         
-        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(cleaned, connectivity=8)
-        min_size = 10
-        cleaned_image = np.zeros_like(cleaned)
+        Components smaller than min_size pixels are dropped through a lookup
+        table indexed by label: one pass over the image, however many
+        components there are. Returns a new array; image is not modified.
+        """
+        blurred = self._buffer('b' if image is self._scratch.get('a') else 'a', image.shape)
+        opened = self._buffer('c', image.shape)
+        labels = self._buffer('labels', image.shape, np.int32)
         
-        for i in range(1, num_labels):
-            if stats[i, cv2.CC_STAT_AREA] >= min_size:
-                cleaned_image[labels == i] = 255
+        cv2.medianBlur(image, 5, blurred)
+        cv2.morphologyEx(blurred, cv2.MORPH_OPEN, OPEN_KERNEL, opened)
         
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2, 2))
-        cleaned_image = cv2.morphologyEx(cleaned_image, cv2.MORPH_CLOSE, kernel)
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(opened, labels, connectivity=8)
+        keep = np.where(stats[:, cv2.CC_STAT_AREA] >= min_size, 255, 0).astype(np.uint8)
+        keep[0] = 0
+        np.take(keep, labels, out=blurred)
         
-        return cleaned_image
+        return cv2.morphologyEx(blurred, cv2.MORPH_CLOSE, CLOSE_KERNEL)
     
     def normalize_image(self, image: np.ndarray, target_size: Tuple[int, int] = (800, 600)) -> np.ndarray:
         """
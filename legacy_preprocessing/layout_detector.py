@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
-from typing import List, Dict
+from typing import Optional, Tuple
+from .regions import Regions
 from .utils import validate_image
 
 
@@ -8,51 +9,35 @@ class LayoutDetector:
     """Detect basic layout and text regions in handwritten documents."""
     
     def __init__(self):
-        self.text_regions = []
+        self.text_regions = Regions()
     
-    def find_text_regions(self, image: np.ndarray) -> List[Dict]:
+    def find_text_regions(self, image: np.ndarray, min_area: float = 200,
+                          max_aspect_ratio: float = 15) -> Regions:
         """
         Find text regions/blocks in the image.
         
         Args:
             image: Preprocessed binary image
+            min_area: Smallest contour area kept
+            max_aspect_ratio: Widest width/height kept (a whole line of text merges into one region)
             
         Returns:
-            List of text region dictionaries
+            Regions, top to bottom
         """
         if not validate_image(image):
-            return []
-        
-        processed = image.copy()
+            return Regions()
         
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 1))
-        processed = cv2.morphologyEx(processed, cv2.MORPH_CLOSE, kernel)
+        processed = cv2.morphologyEx(image, cv2.MORPH_CLOSE, kernel)
         
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
         processed = cv2.dilate(processed, kernel, iterations=1)
         
         contours, _ = cv2.findContours(processed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
-        text_regions = []
-        min_area = 200  
-        
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area < min_area:
-                continue
-            
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            aspect_ratio = w / h
-            if aspect_ratio > 15 or aspect_ratio < 0.1:
-                continue
-            
-            text_regions.append({
-                'bbox': (x, y, w, h),
-                'area': area
-            })
-        
-        text_regions.sort(key=lambda region: region['bbox'][1])
+        text_regions = Regions.from_contours(contours).filter(min_area=min_area, min_aspect_ratio=0.1,
+                                                              max_aspect_ratio=max_aspect_ratio)
+        text_regions = text_regions.sort(('y',))
         self.text_regions = text_regions
         
         return text_regions
@@ -75,15 +60,72 @@ class LayoutDetector:
             return image
         
         height, width = image.shape[:2]
+        min_x, min_y, w, h = self._text_area_bbox(width, height, padding)
         
-        min_x = min(region['bbox'][0] for region in self.text_regions)
-        min_y = min(region['bbox'][1] for region in self.text_regions)
-        max_x = max(region['bbox'][0] + region['bbox'][2] for region in self.text_regions)
-        max_y = max(region['bbox'][1] + region['bbox'][3] for region in self.text_regions)
+        return image[min_y:min_y + h, min_x:min_x + w]
+    
+    def find_text_area(self, image: np.ndarray, working_size: int = 800, padding: int = 20,
+                       min_ink_density: float = 0.05) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Locate the inked area of a full-resolution page cheaply.
+        
+        Detection runs on a copy downscaled to working_size on its long edge,
+        so the cost does not grow with the input resolution. Ink touching the
+        image border, and large hollow shapes whose box is nearly empty of
+        ink (the outline of a photographed page), are ignored. Afterwards
+        self.text_regions holds the regions in full-resolution coordinates,
+        so get_text_area_roi() can be used on the original image.
+        
+        Args:
+            image: Grayscale or color page image, dark ink on light paper
+            working_size: Long edge of the copy the detection runs on
+            padding: Padding around the text area, in full-resolution pixels
+            min_ink_density: Below this fraction of ink in its box, a large shape counts as hollow
+            
+        Returns:
+            (x, y, w, h) of the padded text area, or None if no text was found
+        """
+        self.text_regions = Regions()
+        if not validate_image(image):
+            return None
+        
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        height, width = gray.shape
+        scale = min(1.0, working_size / max(height, width))
+        small = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        
+        binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY_INV, 19, 12)
+        binary = cv2.medianBlur(binary, 3)
+        
+        # Drop ink that is not text before grouping: anything touching the
+        # border, and large hollow shapes such as the outline of the page.
+        # Left in, the outline would enclose (and swallow) every text region.
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        small_height, small_width = binary.shape
+        x, y, w, h, area = (stats[:, i] for i in range(5))
+        touches_border = (x == 0) | (y == 0) | (x + w == small_width) | (y + h == small_height)
+        hollow = (w * h > 0.25 * small_width * small_height) & (area < min_ink_density * w * h)
+        keep = ~(touches_border | hollow)
+        keep[0] = False
+        binary = np.where(keep[labels], 255, 0).astype(np.uint8)
+        
+        regions = self.find_text_regions(binary, min_area=30, max_aspect_ratio=80).to_original(scale)
+        
+        self.text_regions = regions
+        if not len(regions):
+            return None
+        return self._text_area_bbox(width, height, padding)
+    
+    def _text_area_bbox(self, width: int, height: int, padding: int) -> Tuple[int, int, int, int]:
+        """Padded (x, y, w, h) around self.text_regions, clipped to the image."""
+        min_x, min_y, w, h = self.text_regions.bounds()
+        max_x, max_y = min_x + w, min_y + h
         
         min_x = max(0, min_x - padding)
         min_y = max(0, min_y - padding)
         max_x = min(width, max_x + padding)
         max_y = min(height, max_y + padding)
         
-        return image[min_y:max_y, min_x:max_x]
\ No newline at end of file
+        return min_x, min_y, max_x - min_x, max_y - min_y
@@ -0,0 +1,166 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .cache import StageCache
+from .image_preprocessor import ImagePreprocessor, stage_params
+
+# The preprocessor of a pool worker process, reused across its images.
+_preprocessor = None
+
+
+def preprocess_many(sources: Iterable[Union[str, np.ndarray]], workers: int = None, params: dict = None,
+                    profile: str = 'exact', max_pending: int = None, cache_dir: str = None) -> Iterator[Tuple[Union[str, int], Optional[np.ndarray]]]:
+    """
+    Run ImagePreprocessor over many images on a pool of processes.
+
+    Paths are decoded by the workers themselves. Arrays and results cross
+    between processes in multiprocessing.shared_memory blocks, not
+    pickled. Results are yielded as soon as each image is done, not in
+    input order, and only max_pending images are in flight at a time, so
+    memory stays flat however many sources there are.
+
+    This process creates and frees every block; workers only attach to
+    them. An array's block takes its result too, and a path gets a block
+    sized from its image header. (A block a worker created would be gone
+    on Windows by the time this process attached to it.) A path whose
+    header cannot be read, or whose decoded size differs from it, has its
+    result pickled instead.
+
+    Args:
+        sources: Image paths, or BGR / grayscale uint8 arrays
+        workers: Worker processes (default: every CPU)
+        params: Per-stage overrides of DEFAULT_PARAMS, used for every image
+        profile: A PROFILES name ('fast' denoises large pages at reduced resolution)
+        max_pending: Images queued or in progress at once (default: 2 per worker)
+        cache_dir: Directory of a StageCache disk tier the workers share:
+            binarized pages found there are not computed again
+
+    Returns:
+        Iterator of (source, binarized image); source is the path, or the
+        position in sources for an array; the image is None if a path could
+        not be read
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    params = stage_params(params, profile)
+    sources = iter(enumerate(sources))
+    pending = {}
+    if os.name != "nt":
+        # Started before the pool so the workers share it: blocks they attach
+        # to and this process unlinks are then registered and released in one
+        # place. (Windows has no tracker; a block goes with its last handle.)
+        resource_tracker.ensure_running()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_dir,)) as pool:
+        try:
+            while True:
+                while len(pending) < max_pending:
+                    item = next(sources, None)
+                    if item is None:
+                        break
+                    position, source = item
+                    if isinstance(source, np.ndarray):
+                        block, task = _share(source)
+                        key = position
+                    else:
+                        block, task = _result_block(source), source
+                        key = source
+                    pending[pool.submit(_run, task, params, block and block.name)] = (key, block)
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, block = pending.pop(future)
+                    try:
+                        result = _collect(future.result(), block)
+                    finally:
+                        _free(block)
+                    yield key, result
+        finally:
+            # Stopped early (or a worker failed): free what is still in flight.
+            # A worker still using a block keeps its own handle until it is done.
+            for future, (_, block) in pending.items():
+                future.cancel()
+                _free(block)
+
+
+def _share(image: np.ndarray) -> Tuple[shared_memory.SharedMemory, tuple]:
+    """Copy an array into a new shared memory block; returns the block and its descriptor."""
+    block = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+    np.ndarray(image.shape, dtype=image.dtype, buffer=block.buf)[...] = image
+    return block, (block.name, image.shape, image.dtype.str)
+
+
+def _result_block(path: str) -> Optional[shared_memory.SharedMemory]:
+    """A block for the binarized page of an image file, sized from its header; None if unreadable."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):  # EXIF rotation by 90 degrees; OpenCV applies it
+                width, height = height, width
+    except Exception:
+        return None
+    return shared_memory.SharedMemory(create=True, size=max(1, width * height))
+
+
+def _collect(result, block: Optional[shared_memory.SharedMemory]) -> Optional[np.ndarray]:
+    """A worker's result: the image itself, or the shape of the one it wrote into block."""
+    if result is None or isinstance(result, np.ndarray):
+        return result
+    return np.ndarray(result, dtype=np.uint8, buffer=block.buf).copy()
+
+
+def _free(block: Optional[shared_memory.SharedMemory]) -> None:
+    if block is not None:
+        block.close()
+        block.unlink()
+
+
+def _init_worker(cache_dir: Optional[str]):
+    global _preprocessor
+    # Parallelism comes from the processes; OpenCV's own threads would only compete.
+    cv2.setNumThreads(1)
+    # Disk tier only: a batch rarely sees the same page twice in one worker.
+    cache = StageCache(max_bytes=0, disk_dir=cache_dir) if cache_dir else None
+    _preprocessor = ImagePreprocessor(cache=cache)
+
+
+def _run(source, params: dict, out_name: Optional[str]):
+    """
+    Preprocess one path or shared image in a worker.
+
+    The result is written into a block of the parent's (the shared image's
+    own, or out_name for a path) and its shape returned; if there is no
+    block or the result does not fit, the result itself is returned.
+    """
+    if isinstance(source, str):
+        result = _preprocessor.preprocess(source, params=params)
+        _preprocessor.original_image = _preprocessor.processed_image = None
+        if result is None or out_name is None:
+            return result
+        block = shared_memory.SharedMemory(name=out_name)
+    else:
+        name, shape, dtype = source
+        block = shared_memory.SharedMemory(name=name)
+        result = None
+        try:
+            result = _preprocessor.process_array(np.ndarray(shape, dtype=dtype, buffer=block.buf), params)
+        finally:
+            if result is None:
+                block.close()
+    try:
+        if block.size < result.nbytes:
+            return result
+        # For a shared image this overwrites the input, which has been read by now.
+        np.ndarray(result.shape, dtype=result.dtype, buffer=block.buf)[...] = result
+        return result.shape
+    finally:
+        block.close()
@@ -0,0 +1,261 @@
+import cv2
+import numpy as np
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+# One region per row. 'contour' indexes the contour list the regions were
+# built from (-1 once regions have been merged).
+REGION_DTYPE = np.dtype([('x', np.int32), ('y', np.int32), ('width', np.int32), ('height', np.int32),
+                         ('area', np.float64), ('contour', np.int32)])
+
+
+class Regions:
+    """
+    Bounding boxes of many image regions, stored column-wise.
+
+    Filtering, sorting and overlap tests work on whole columns at once. The
+    contours behind the boxes are kept as OpenCV returned them and are only
+    touched when contour() asks for one. Iterating or indexing with an int
+    yields the dicts the analyzers used to return ('bbox', 'area', 'center',
+    'contour'), so older callers keep working.
+    """
+
+    def __init__(self, data: np.ndarray = None, contours: Sequence[np.ndarray] = (), scale: float = 1.0):
+        self.data = np.empty(0, dtype=REGION_DTYPE) if data is None else data
+        self._contours = contours
+        self._scale = scale
+
+    @classmethod
+    def from_contours(cls, contours: Sequence[np.ndarray]) -> 'Regions':
+        """
+        Boxes and areas of OpenCV contours, computed for all of them at once.
+
+        Equal to cv2.boundingRect and cv2.contourArea (shoelace formula) per contour.
+
+        Args:
+            contours: Contours from cv2.findContours
+
+        Returns:
+            Regions in contour order
+        """
+        data = np.empty(len(contours), dtype=REGION_DTYPE)
+        if not len(contours):
+            return cls(data, contours)
+
+        lengths = np.fromiter((len(contour) for contour in contours), dtype=np.int64, count=len(contours))
+        starts = np.zeros(len(contours), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        points = np.concatenate(contours).reshape(-1, 2)
+        xs, ys = points[:, 0].astype(np.int64), points[:, 1].astype(np.int64)
+
+        left, top = np.minimum.reduceat(xs, starts), np.minimum.reduceat(ys, starts)
+        data['x'], data['y'] = left, top
+        data['width'] = np.maximum.reduceat(xs, starts) - left + 1
+        data['height'] = np.maximum.reduceat(ys, starts) - top + 1
+
+        following = np.arange(1, len(xs) + 1)
+        following[starts + lengths - 1] = starts
+        cross = xs * ys[following] - xs[following] * ys
+        data['area'] = np.abs(np.add.reduceat(cross, starts)) / 2.0
+        data['contour'] = np.arange(len(contours))
+        return cls(data, contours)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._as_dict(self.data[key])
+        return Regions(self.data[key], self._contours, self._scale)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in self.data:
+            yield self._as_dict(row)
+
+    def _as_dict(self, row) -> Dict:
+        x, y, w, h = (int(row[name]) for name in ('x', 'y', 'width', 'height'))
+        return {
+            'bbox': (x, y, w, h),
+            'area': float(row['area']),
+            'center': (x + w // 2, y + h // 2),
+            'contour': self._contour(int(row['contour']))
+        }
+
+    def contour(self, i: int) -> Optional[np.ndarray]:
+        """Contour of region i, or None for merged regions."""
+        return self._contour(int(self.data['contour'][i]))
+
+    def _contour(self, index: int) -> Optional[np.ndarray]:
+        if index < 0:
+            return None
+        contour = self._contours[index]
+        if self._scale != 1.0:
+            contour = np.round(contour / self._scale).astype(np.int32)
+        return contour
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        """(N, 4) int array of (x, y, w, h)."""
+        return np.stack([self.data['x'], self.data['y'], self.data['width'], self.data['height']], axis=1)
+
+    @property
+    def centers(self) -> np.ndarray:
+        """(N, 2) int array of box centres, (x + w // 2, y + h // 2)."""
+        return np.stack([self.data['x'] + self.data['width'] // 2, self.data['y'] + self.data['height'] // 2], axis=1)
+
+    def bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """(x, y, w, h) enclosing every region, or None if there are none."""
+        if not len(self):
+            return None
+        x, y = int(self.data['x'].min()), int(self.data['y'].min())
+        right = int((self.data['x'] + self.data['width']).max())
+        bottom = int((self.data['y'] + self.data['height']).max())
+        return x, y, right - x, bottom - y
+
+    def filter(self, min_area: float = None, max_area: float = None, min_aspect_ratio: float = None,
+               max_aspect_ratio: float = None, min_size: Tuple[int, int] = None,
+               max_size: Tuple[int, int] = None) -> 'Regions':
+        """
+        Keep the regions within every given limit (all inclusive).
+
+        Args:
+            min_area, max_area: Contour area
+            min_aspect_ratio, max_aspect_ratio: Width / height of the box
+            min_size, max_size: (width, height) of the box
+
+        Returns:
+            The matching regions, in the same order
+        """
+        data = self.data
+        keep = np.ones(len(data), dtype=bool)
+        if min_area is not None:
+            keep &= data['area'] >= min_area
+        if max_area is not None:
+            keep &= data['area'] <= max_area
+        if min_aspect_ratio is not None or max_aspect_ratio is not None:
+            aspect = data['width'] / data['height']
+            if min_aspect_ratio is not None:
+                keep &= aspect >= min_aspect_ratio
+            if max_aspect_ratio is not None:
+                keep &= aspect <= max_aspect_ratio
+        if min_size is not None:
+            keep &= (data['width'] >= min_size[0]) & (data['height'] >= min_size[1])
+        if max_size is not None:
+            keep &= (data['width'] <= max_size[0]) & (data['height'] <= max_size[1])
+        return self[keep]
+
+    def sort(self, keys: Sequence[str] = ('y', 'x')) -> 'Regions':
+        """Stable sort by the given columns, most significant first."""
+        order = np.lexsort([self.data[key] for key in reversed(keys)])
+        return self[order]
+
+    def reading_order(self, line_tolerance: float = None) -> 'Regions':
+        """
+        Sort into lines top to bottom, and left to right within each line.
+
+        Regions whose vertical centres lie within line_tolerance of the
+        previous region's (in centre order) share a line.
+
+        Args:
+            line_tolerance: Pixels; default half the median region height
+
+        Returns:
+            The regions in reading order
+        """
+        if len(self) < 2:
+            return self
+        if line_tolerance is None:
+            line_tolerance = float(np.median(self.data['height'])) / 2
+        centre_y = self.data['y'] + self.data['height'] / 2
+        by_centre = np.argsort(centre_y, kind='stable')
+        line = np.empty(len(self), dtype=np.int64)
+        line[by_centre] = np.concatenate([[0], np.cumsum(np.diff(centre_y[by_centre]) > line_tolerance)])
+        return self[np.lexsort([self.data['x'], line])]
+
+    def to_original(self, scale: float) -> 'Regions':
+        """
+        Regions found on a copy of an image resized by scale, in the original's coordinates.
+
+        Positions are truncated and sizes rounded up, so boxes still cover
+        their region; contours are scaled when they are read.
+        """
+        data = self.data.copy()
+        data['x'] = (self.data['x'] / scale).astype(np.int32)
+        data['y'] = (self.data['y'] / scale).astype(np.int32)
+        data['width'] = np.ceil(self.data['width'] / scale)
+        data['height'] = np.ceil(self.data['height'] / scale)
+        data['area'] = self.data['area'] / (scale * scale)
+        return Regions(data, self._contours, self._scale * scale)
+
+    def iou(self, other: 'Regions' = None) -> np.ndarray:
+        """
+        Pairwise intersection over union of the boxes.
+
+        Args:
+            other: Regions to compare with (default: these regions themselves)
+
+        Returns:
+            len(self) x len(other) float array
+        """
+        other = self if other is None else other
+        a, b = self.bboxes.astype(np.int64), other.bboxes.astype(np.int64)
+        left = np.maximum(a[:, None, 0], b[None, :, 0])
+        top = np.maximum(a[:, None, 1], b[None, :, 1])
+        right = np.minimum((a[:, 0] + a[:, 2])[:, None], (b[:, 0] + b[:, 2])[None, :])
+        bottom = np.minimum((a[:, 1] + a[:, 3])[:, None], (b[:, 1] + b[:, 3])[None, :])
+        intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+        union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - intersection
+        return intersection / np.maximum(union, 1)
+
+    def merge(self, iou_threshold: float = 0.0, gap: int = 0) -> 'Regions':
+        """
+        Merge regions whose boxes overlap, transitively, into their enclosing box.
+
+        Two boxes are joined when, grown by gap pixels on every side, their
+        IoU is above iou_threshold (by default: when they touch at all).
+        Areas add up; merged regions have no contour. Memory is quadratic
+        in the number of regions, so filter first on pages with thousands.
+
+        Args:
+            iou_threshold: Overlap above which boxes are joined
+            gap: Pixels by which boxes are grown before the test
+
+        Returns:
+            Merged regions, sorted top to bottom
+        """
+        if len(self) < 2:
+            return self
+        grown = self.data.copy()
+        grown['x'] -= gap
+        grown['y'] -= gap
+        grown['width'] += 2 * gap
+        grown['height'] += 2 * gap
+        joined = Regions(grown).iou() > iou_threshold
+
+        # Connected components: every region takes the smallest label among
+        # its neighbours until nothing changes.
+        labels = np.arange(len(self))
+        while True:
+            smallest = np.where(joined, labels[None, :], len(self)).min(axis=1)
+            updated = np.minimum(labels, smallest)
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+
+        groups, group = np.unique(labels, return_inverse=True)
+        right = self.data['x'] + self.data['width']
+        bottom = self.data['y'] + self.data['height']
+        data = np.empty(len(groups), dtype=REGION_DTYPE)
+        limits = np.iinfo(np.int64)
+        for field, values, reduce, start in (('x', self.data['x'], np.minimum, limits.max),
+                                             ('y', self.data['y'], np.minimum, limits.max),
+                                             ('width', right, np.maximum, limits.min),
+                                             ('height', bottom, np.maximum, limits.min)):
+            combined = np.full(len(groups), start, dtype=np.int64)
+            reduce.at(combined, group, values)
+            data[field] = combined
+        data['width'] -= data['x']
+        data['height'] -= data['y']
+        data['area'] = np.bincount(group, weights=self.data['area'], minlength=len(groups))
+        data['contour'] = -1
+        return Regions(data).sort(('y', 'x'))
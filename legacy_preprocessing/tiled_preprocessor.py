@@ -0,0 +1,146 @@
+import os
+import threading
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+from .image_preprocessor import ImagePreprocessor
+
+# How far each stage reaches from a pixel, in pixels: bilateral d=15 (7),
+# adaptive threshold block 19 (9), median 5 (2), opening 5x5 (4), the
+# smallest kept component (10) and the 2x2 closing (1). A tile is computed
+# on an area this much larger than itself so its own pixels come out exact.
+FILTER_HALO = 7 + 9 + 2 + 4 + 10 + 1
+
+
+class TiledPreprocessor:
+    """Run the ImagePreprocessor pipeline on huge images tile by tile.
+
+    Memory stays at a few tiles per worker thread plus the source and the
+    output, both of which can live on disk (np.memmap / .npy). Every tile is
+    processed with a halo around it, so the result does not depend on the
+    tile size or the number of threads.
+
+    One difference from ImagePreprocessor.preprocess: CLAHE uses fixed
+    clahe_cell x clahe_cell cells instead of an 8x8 grid over the whole
+    image (an eighth of a wall-sized panorama is not a useful neighbourhood).
+    Cells are aligned to the image origin and tiles to cells, which makes the
+    tiled CLAHE equal to a single CLAHE pass over the full image.
+
+    Nothing is kept on the instance: process() returns its result.
+    """
+
+    def __init__(self, tile_size: int = 2048, workers: int = None, clahe_cell: int = 256,
+                 clip_limit: float = 2.0):
+        if clahe_cell < 2 * FILTER_HALO:
+            raise ValueError(f"clahe_cell must be at least {2 * FILTER_HALO}")
+        # Tiles are whole CLAHE cells.
+        self.tile_size = max(clahe_cell, tile_size // clahe_cell * clahe_cell)
+        self.workers = workers or os.cpu_count() or 1
+        self.clahe_cell = clahe_cell
+        self.clip_limit = clip_limit
+        self._local = threading.local()
+
+    def process(self, source, out: Union[np.ndarray, str] = None) -> np.ndarray:
+        """
+        Binarize a page, tile by tile.
+
+        Args:
+            source: Array (2-D gray or 3-D BGR, np.memmap welcome), .npy path
+                (memory-mapped) or image path (see open_source)
+            out: Array to write into, or a .npy path to create as a memory-mapped
+                output; by default a new in-memory array
+
+        Returns:
+            The binarized image (out itself when given)
+        """
+        image = open_source(source)
+        height, width = image.shape[:2]
+        if isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=np.uint8, shape=(height, width))
+        elif out is None:
+            out = np.empty((height, width), dtype=np.uint8)
+
+        tiles = [(y, x) for y in range(0, height, self.tile_size) for x in range(0, width, self.tile_size)]
+        if self.workers == 1 or len(tiles) == 1:
+            for y, x in tiles:
+                self._process_tile(image, out, y, x)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # list() re-raises the first exception from a worker.
+                list(pool.map(lambda tile: self._process_tile(image, out, *tile), tiles))
+
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out
+
+    def _preprocessor(self) -> ImagePreprocessor:
+        """One ImagePreprocessor (and its scratch buffers) per thread."""
+        preprocessor = getattr(self._local, 'preprocessor', None)
+        if preprocessor is None:
+            preprocessor = self._local.preprocessor = ImagePreprocessor()
+        return preprocessor
+
+    def _process_tile(self, image: np.ndarray, out: np.ndarray, y: int, x: int) -> None:
+        height, width = image.shape[:2]
+        cell = self.clahe_cell
+        y_end, x_end = min(y + self.tile_size, height), min(x + self.tile_size, width)
+
+        # CLAHE needs the neighbouring cell on every side (its histogram is
+        # interpolated into this tile's edge); the filters need FILTER_HALO,
+        # which fits in the inner half of that cell.
+        ry, rx = max(0, y - cell), max(0, x - cell)
+        ry_end, rx_end = min(height, y_end + cell), min(width, x_end + cell)
+        region = image[ry:ry_end, rx:rx_end]
+        gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY) if region.ndim == 3 else np.ascontiguousarray(region)
+
+        # Past the image's right/bottom edge, the last partial cell is filled
+        # out by reflection, the same way whichever tile it falls in.
+        pad_bottom = -(ry_end - ry) % cell if ry_end == height else 0
+        pad_right = -(rx_end - rx) % cell if rx_end == width else 0
+        if pad_bottom or pad_right:
+            gray = cv2.copyMakeBorder(gray, 0, pad_bottom, 0, pad_right, cv2.BORDER_REFLECT_101)
+        grid = (gray.shape[1] // cell, gray.shape[0] // cell)
+        contrast = cv2.createCLAHE(clipLimit=self.clip_limit, tileGridSize=grid).apply(gray)
+
+        # Filter on the tile plus FILTER_HALO (clipped to the image).
+        fy, fx = max(0, y - FILTER_HALO), max(0, x - FILTER_HALO)
+        fy_end, fx_end = min(height, y_end + FILTER_HALO), min(width, x_end + FILTER_HALO)
+        work = np.ascontiguousarray(contrast[fy - ry:fy_end - ry, fx - rx:fx_end - rx])
+
+        preprocessor = self._preprocessor()
+        denoised = preprocessor.reduce_noise(work, method='bilateral')
+        binary = preprocessor.apply_threshold(denoised, method='adaptive', dst=work)
+        cleaned = preprocessor.clean_binary_image(binary)
+
+        out[y:y_end, x:x_end] = cleaned[y - fy:y_end - fy, x - fx:x_end - fx]
+
+
+def open_source(source) -> np.ndarray:
+    """
+    Open an image for tile-wise reading.
+
+    Arrays (including np.memmap) are used as they are, and .npy files are
+    memory-mapped, so tiles are paged in from disk on demand and the image
+    never has to fit in memory. Other image files are decoded once, straight
+    to 8-bit grayscale: a third of the memory of the color decode in
+    load_image, but still the whole image. Convert scans too large for that
+    to .npy once and reuse the file.
+
+    Args:
+        source: Array, .npy path or image path
+
+    Returns:
+        A 2-D (gray) or 3-D (BGR) uint8 array
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if not os.path.exists(source):
+        raise FileNotFoundError(source)
+    if source.lower().endswith('.npy'):
+        return np.load(source, mmap_mode='r')
+
+    decoded = cv2.imread(source, cv2.IMREAD_GRAYSCALE)
+    if decoded is None:
+        raise ValueError(f"Could not read image {source}")
+    return decoded
@@ -0,0 +1,35 @@
+import os
+
+BACKENDS = ("qwen", "stub")
+
+
+def load_digitizer(backend: str = "qwen"):
+    """Instantiate an in-process digitizer. "stub" needs no model or GPU."""
+    if backend == "qwen":
+        from .document_digitizer import DocumentDigitizer
+        return DocumentDigitizer()
+    if backend == "stub":
+        from .stub_digitizer import StubDigitizer
+        return StubDigitizer()
+    raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def get_inference_backend():
+    """Return the object jobs should be sent to.
+
+    When INK2PIXEL_SHARD_WORKERS lists several worker addresses (comma
+    separated), pages are spread across them (see vlm/coordinator.py). When
+    INK2PIXEL_INFERENCE_ADDRESS is set, that is a client for the shared
+    inference worker process (see vlm/worker.py). Otherwise the model is loaded
+    into this process, using INK2PIXEL_BACKEND (default "qwen"). All of them
+    expose process_and_save(image_path, output_path, output_format, on_page=...).
+    """
+    shard_workers = [a.strip() for a in os.environ.get("INK2PIXEL_SHARD_WORKERS", "").split(",") if a.strip()]
+    if shard_workers:
+        from .coordinator import ShardCoordinator
+        return ShardCoordinator(shard_workers)
+    address = os.environ.get("INK2PIXEL_INFERENCE_ADDRESS")
+    if address:
+        from .worker import InferenceClient
+        return InferenceClient(address)
+    return load_digitizer(os.environ.get("INK2PIXEL_BACKEND", "qwen"))
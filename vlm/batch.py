@@ -0,0 +1,263 @@
+"""
+Offline bulk digitization with a resumable manifest.
+
+run_batch() pushes every image/PDF found under the given directories, globs or
+paths through the same inference backend the web server uses (the shared
+worker when INK2PIXEL_INFERENCE_ADDRESS is set, else an in-process model) and
+appends one JSON line per finished file to a manifest in the output folder.
+A rerun skips every file whose output is recorded as done and still exists,
+so an interrupted backfill picks up where it died. A file with the same
+content (hash) as one already done, found under another name, gets a copy
+of that output instead of a second run through the model.
+
+    python ink2pixel.py batch scans/ "archive/**/*.pdf" --output digitized --format md --format docx
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .document_digitizer import new_usage
+
+INPUT_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+OUTPUT_FORMATS = ("md", "latex", "html", "json", "txt", "docx")
+MANIFEST_NAME = ".ink2pixel-manifest.jsonl"
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _glob_root(pattern: str) -> str:
+    """The leading directories of a glob pattern that contain no wildcards."""
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or "."
+
+
+def collect_inputs(patterns) -> list:
+    """Expand directories (recursively), globs and plain paths.
+
+    Returns [(path, relative_name)] sorted and de-duplicated; relative_name is
+    where the file sits below the directory or glob root it was found under,
+    and is reused for its output path.
+    """
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            root, matches = pattern, glob.glob(os.path.join(glob.escape(pattern), "**", "*"), recursive=True)
+        elif glob.has_magic(pattern):
+            root, matches = _glob_root(pattern), glob.glob(pattern, recursive=True)
+        else:
+            root, matches = os.path.dirname(pattern) or ".", [pattern]
+        for path in matches:
+            if os.path.isfile(path) and path.lower().endswith(INPUT_EXTENSIONS):
+                found.setdefault(os.path.abspath(path), os.path.relpath(path, root))
+    return sorted(found.items(), key=lambda item: item[1])
+
+
+class BatchManifest:
+    """Append-only JSONL record of finished files, safe to share between threads.
+
+    Each line is one attempt; the last line for a key wins. Lines are flushed
+    and fsynced as they are written, and a torn last line from a crash is
+    ignored on load.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._by_stat = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._index(json.loads(line))
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue
+
+    @staticmethod
+    def _stat_key(source: str, st, output_format: str):
+        return (source, st.st_size, st.st_mtime_ns, output_format)
+
+    def _index(self, record: dict) -> None:
+        self._by_key.setdefault((record["sha256"], record["format"]), {})[record["source"]] = record
+        self._by_stat[(record["source"], record["size"], record["mtime_ns"], record["format"])] = record
+
+    def completed(self, source: str, st, output_format: str, sha256: str = None):
+        """A done record for this content and format whose output still exists, else None.
+
+        Without sha256 only an unchanged (path, size, mtime) can match, which
+        lets reruns skip finished files without reading them. With it, this
+        path's own record comes first, then that of any file with the same content.
+        """
+        with self._lock:
+            if sha256 is None:
+                candidates = [self._by_stat.get(self._stat_key(source, st, output_format))]
+            else:
+                by_source = self._by_key.get((sha256, output_format), {})
+                candidates = [by_source.get(source), *by_source.values()]
+        for record in candidates:
+            if record and record.get("status") == "done" and os.path.exists(record.get("output", "")):
+                return record
+        return None
+
+    def record(self, **fields) -> None:
+        line = json.dumps(fields, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._index(fields)
+
+
+def _usage_delta(after: dict, before: dict) -> dict:
+    return {key: after.get(key, 0) - before.get(key, 0) for key in new_usage()}
+
+
+def resolve_backend(backend=None, jobs: int = 1):
+    """(backend, jobs): the server's inference backend unless one is given, and
+    jobs capped at 1 for an in-process model, which runs one file at a time."""
+    from .backends import get_inference_backend
+    from .worker import InferenceClient
+    from .coordinator import ShardCoordinator
+
+    backend = backend or get_inference_backend()
+    if jobs > 1 and not isinstance(backend, (InferenceClient, ShardCoordinator)):
+        print("An in-process model runs one file at a time; ignoring --jobs.")
+        jobs = 1
+    return backend, jobs
+
+
+def output_path_for(output_dir: str, rel: str, output_format: str, formats) -> str:
+    """Output path (without extension) for a file found at rel below its input root.
+
+    With several formats each one gets its own subfolder, since some formats
+    share a file extension.
+    """
+    folder = os.path.join(output_dir, output_format) if len(formats) > 1 else output_dir
+    return os.path.join(folder, os.path.splitext(rel)[0])
+
+
+def digitize_file(backend, manifest: BatchManifest, source: str, output_base: str, output_format: str,
+                  force: bool = False) -> dict:
+    """Digitize one file into output_base.<ext> unless the manifest says it is done.
+
+    Returns the manifest record, with "status" one of done, copied (from a
+    byte-identical file done before), skipped or error.
+    """
+    st = os.stat(source)
+    own_base = os.path.abspath(output_base)
+    if not force:
+        record = manifest.completed(source, st, output_format)
+        if record and os.path.splitext(record["output"])[0] == own_base:
+            return {**record, "status": "skipped"}
+    sha256 = file_sha256(source)
+    fields = dict(source=source, sha256=sha256, size=st.st_size, mtime_ns=st.st_mtime_ns, format=output_format)
+    if not force:
+        record = manifest.completed(source, st, output_format, sha256)
+        if record and os.path.splitext(record["output"])[0] == own_base:
+            return {**record, "status": "skipped"}
+        if record:
+            # Same content under another name: its output is this file's output too.
+            # Copied rather than hard-linked, so a --force rerun of one leaves the other alone.
+            output = own_base + os.path.splitext(record["output"])[1]
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            try:
+                shutil.copyfile(record["output"], output)
+            except OSError as e:
+                print(f"Could not copy {record['output']} for {source} ({e}); digitizing it instead")
+            else:
+                fields.update(status="done", output=output, pages=record.get("pages"),
+                              copied_from=record["source"], seconds=0.0, finished_at=time.time())
+                manifest.record(**fields)
+                return {**fields, "status": "copied"}
+
+    os.makedirs(os.path.dirname(output_base) or ".", exist_ok=True)
+    pages = 0
+
+    def on_page(page, page_count, text):
+        nonlocal pages
+        pages = page_count
+
+    started = time.perf_counter()
+    try:
+        output = backend.process_and_save(source, output_base, output_format, on_page=on_page)
+    except Exception as e:
+        fields.update(status="error", error=f"{type(e).__name__}: {e}")
+    else:
+        fields.update(status="done", output=os.path.abspath(output), pages=pages)
+    fields.update(seconds=round(time.perf_counter() - started, 3), finished_at=time.time())
+    manifest.record(**fields)
+    return fields
+
+
+def run_batch(patterns, output_dir: str, formats=("md",), backend=None, jobs: int = 1,
+              manifest_path: str = None, force: bool = False) -> dict:
+    """Digitize everything matched by patterns into output_dir and return a summary.
+
+    jobs > 1 keeps that many files in flight, which
+    only pays off with a worker backend: the worker queues them and never
+    idles between files while this process rasterizes, hashes and exports.
+    """
+    backend, jobs = resolve_backend(backend, jobs)
+
+    inputs = collect_inputs(patterns)
+    manifest = BatchManifest(manifest_path or os.path.join(output_dir, MANIFEST_NAME))
+    tasks = []
+    for source, rel in inputs:
+        for output_format in formats:
+            tasks.append((source, output_path_for(output_dir, rel, output_format, formats), output_format))
+    print(f"Batch: {len(inputs)} file(s) x {len(formats)} format(s) -> {output_dir}")
+
+    counts = {"done": 0, "copied": 0, "skipped": 0, "error": 0}
+    usage_before = dict(backend.usage) if hasattr(backend, "usage") else new_usage()
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="batch")
+    try:
+        futures = {pool.submit(digitize_file, backend, manifest, *task, force=force): task for task in tasks}
+        for n, future in enumerate(as_completed(futures), 1):
+            source, _, output_format = futures[future]
+            try:
+                result = future.result()
+            except OSError as e:  # vanished or unreadable between listing and hashing
+                result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            counts[result["status"]] += 1
+            detail = result.get("error") or result.get("output")
+            print(f"[{n}/{len(tasks)}] {result['status']:<7} {os.path.relpath(source)} ({output_format}) {detail}")
+    except KeyboardInterrupt:
+        print("Interrupted; finished files are in the manifest and will be skipped next time.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    elapsed = time.perf_counter() - started
+
+    usage = _usage_delta(backend.usage, usage_before) if hasattr(backend, "usage") else new_usage()
+    summary = {
+        **counts,
+        "seconds": round(elapsed, 3),
+        "pages": usage["pages"],
+        "generated_tokens": usage["generated_tokens"],
+        "pages_per_second": round(usage["pages"] / elapsed, 3) if elapsed else 0.0,
+        "tokens_per_second": round(usage["generated_tokens"] / elapsed, 1) if elapsed else 0.0,
+    }
+    print(f"Done: {counts['done']} digitized, {counts['copied']} copied from identical files, "
+          f"{counts['skipped']} skipped, {counts['error']} failed "
+          f"in {elapsed:.1f}s | {summary['pages']} pages, {summary['pages_per_second']:.2f} pages/s, "
+          f"{summary['tokens_per_second']:.1f} tokens/s")
+    return summary
@@ -0,0 +1,373 @@
+"""
+Distributed page sharding across several inference workers.
+
+ShardCoordinator is a DocumentDigitizer whose pages are transcribed by a pool
+of InferenceWorker endpoints (local processes or other hosts, see
+vlm/worker.py) instead of a local model. Pages are dealt out in contiguous
+blocks, one block per healthy worker; a worker that drains its own block
+steals from the tail of the largest remaining one. A page that fails is
+retried on a different worker, and a worker that keeps failing is benched
+until it answers a ping again. Finished pages are handed back in page order,
+so the inherited process_and_save() math fixups and export path run
+unchanged.
+
+Try it locally without a model or a cluster:
+
+    python -m vlm.coordinator --spawn 3 --backend stub notes.pdf --output out/notes
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from .backends import BACKENDS
+from .document_digitizer import DocumentDigitizer, new_usage, open_pdf, render_pdf_page
+from .worker import InferenceClient, InferenceError, JobCancelled, ensure_authkey, parse_address
+
+
+class ShardFailed(RuntimeError):
+    """A page could not be transcribed by any worker within the retry budget."""
+
+
+class WorkerEndpoint:
+    """One inference worker plus the coordinator's view of its health."""
+
+    def __init__(self, address, authkey: bytes = None, failure_threshold: int = 2, retry_after: float = 10.0):
+        self.address = address
+        self.client = InferenceClient(address, authkey=authkey, connect_timeout=5.0)
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.benched_until = 0.0
+        self.pages_done = 0
+        self.pages_failed = 0
+        self.busy_seconds = 0.0
+        self.last_error = None
+
+    def available(self) -> bool:
+        """Healthy, or benched long enough that a successful ping re-admits it."""
+        if self.healthy:
+            return True
+        if time.monotonic() < self.benched_until:
+            return False
+        try:
+            pong = self.client.ping(timeout=5.0)
+        except Exception as e:
+            self._bench(f"ping failed: {type(e).__name__}: {e}")
+            return False
+        if not pong.get("ready") or pong.get("load_error"):
+            self._bench(pong.get("load_error") or "not ready")
+            return False
+        self.healthy = True
+        self.consecutive_failures = 0
+        return True
+
+    def record_success(self, seconds: float) -> None:
+        self.pages_done += 1
+        self.busy_seconds += seconds
+        self.consecutive_failures = 0
+
+    def record_failure(self, error: str) -> None:
+        self.pages_failed += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.consecutive_failures >= self.failure_threshold:
+            self._bench(error)
+
+    def _bench(self, error: str) -> None:
+        self.healthy = False
+        self.last_error = error
+        self.benched_until = time.monotonic() + self.retry_after
+
+    def snapshot(self) -> dict:
+        return {
+            "address": str(self.address),
+            "healthy": self.healthy,
+            "pages_done": self.pages_done,
+            "pages_failed": self.pages_failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "last_error": self.last_error,
+        }
+
+
+class _ShardBoard:
+    """Per-worker page deques with work stealing, shared by one job's threads."""
+
+    def __init__(self, page_count: int, worker_count: int, max_attempts: int):
+        self.lock = threading.Condition()
+        self.queues = [deque() for _ in range(worker_count)]
+        block = -(-page_count // worker_count) if worker_count else page_count
+        for page in range(page_count):
+            self.queues[min(page // block, worker_count - 1)].append(page)
+        self.attempts = [0] * page_count
+        self.tried = [set() for _ in range(page_count)]
+        self.results = {}
+        self.in_flight = 0
+        self.max_attempts = max_attempts
+        self.error = None
+        self.stopped = False
+
+    def take(self, worker: int):
+        """Next page for a worker: its own block first, else steal from the longest other block."""
+        with self.lock:
+            if self.stopped or self.error:
+                return None
+            own = self.queues[worker]
+            for i in range(len(own)):
+                page = own[i]
+                if worker not in self.tried[page]:
+                    del own[i]
+                    break
+            else:
+                page = None
+                donors = sorted(range(len(self.queues)), key=lambda q: len(self.queues[q]), reverse=True)
+                for donor in donors:
+                    for i in range(len(self.queues[donor]) - 1, -1, -1):
+                        candidate = self.queues[donor][i]
+                        if worker not in self.tried[candidate]:
+                            del self.queues[donor][i]
+                            page = candidate
+                            break
+                    if page is not None:
+                        break
+            if page is None:
+                return None
+            self.attempts[page] += 1
+            self.tried[page].add(worker)
+            self.in_flight += 1
+            return page
+
+    def finish(self, page: int, text: str) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            self.results[page] = text
+            self.lock.notify_all()
+
+    def fail(self, page: int, worker: int, error: str, healthy_workers) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            others = [w for w in healthy_workers if w not in self.tried[page]]
+            if self.attempts[page] >= self.max_attempts or not others:
+                self.error = f"page {page + 1} failed after {self.attempts[page]} attempt(s): {error}"
+            else:
+                # Retry next on the least loaded worker that has not seen it yet.
+                target = min(others, key=lambda w: len(self.queues[w]))
+                self.queues[target].appendleft(page)
+            self.lock.notify_all()
+
+    def abort(self, error: str) -> None:
+        """Fail the whole job, e.g. when a page cannot be read at all."""
+        with self.lock:
+            self.in_flight -= 1
+            self.error = self.error or error
+            self.lock.notify_all()
+
+    def pending(self) -> int:
+        with self.lock:
+            return sum(len(q) for q in self.queues) + self.in_flight
+
+
+class _PageSource:
+    """A document's pages, rasterized when a shard first claims them.
+
+    Only pages in flight, or waiting for a retry, are held in memory: a page
+    is dropped once release() says it is done. PyMuPDF documents are not
+    thread-safe, so rendering is serialized on the source's own lock, not the
+    board's, and never holds up other shards claiming or finishing pages.
+    """
+
+    def __init__(self, image_path: str):
+        self.image_path = image_path
+        self._doc = open_pdf(image_path) if image_path.lower().endswith(".pdf") else None
+        self.count = len(self._doc) if self._doc is not None else 1
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def get(self, page: int):
+        """(name, encoded_image_bytes) of a page, or None once the source is closed."""
+        with self._lock:
+            if self.closed:
+                return None
+            if page not in self._pages:
+                if self._doc is None:
+                    with open(self.image_path, "rb") as f:
+                        self._pages[page] = (os.path.basename(self.image_path), f.read())
+                else:
+                    self._pages[page] = (f"page_{page}.png", render_pdf_page(self._doc, page).tobytes("png"))
+            return self._pages[page]
+
+    def release(self, page: int) -> None:
+        with self._lock:
+            self._pages.pop(page, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self.closed = True
+            self._pages.clear()
+            if self._doc is not None:
+                self._doc.close()
+                self._doc = None
+
+
+class ShardCoordinator(DocumentDigitizer):
+    """DocumentDigitizer that fans a document's pages out over many workers."""
+
+    def __init__(self, endpoints, authkey: bytes = None, max_attempts: int = 3,
+                 shard_timeout: float = 900.0, retry_after: float = 10.0):
+        if not endpoints:
+            raise ValueError("ShardCoordinator needs at least one worker endpoint")
+        self.device = "remote"
+        self.endpoints = [WorkerEndpoint(parse_address(a), authkey, retry_after=retry_after) for a in endpoints]
+        self.max_attempts = max_attempts
+        self.shard_timeout = shard_timeout
+
+    @property
+    def usage(self) -> dict:
+        totals = new_usage()
+        for endpoint in self.endpoints:
+            for key in totals:
+                totals[key] += endpoint.client.usage[key]
+        return totals
+
+    def health(self) -> list:
+        return [endpoint.snapshot() for endpoint in self.endpoints]
+
+    def _drain(self, index: int, board: _ShardBoard, pages: _PageSource, output_format: str,
+               deskew: bool = None) -> None:
+        endpoint = self.endpoints[index]
+        while True:
+            if not endpoint.available():
+                if board.pending() == 0 or board.error or board.stopped:
+                    return
+                time.sleep(min(1.0, endpoint.retry_after))
+                continue
+            page = board.take(index)
+            if page is None:
+                if board.pending() == 0 or board.error or board.stopped:
+                    return
+                time.sleep(0.05)  # others still busy; a retry may come our way
+                continue
+            try:
+                source = pages.get(page)
+            except Exception as e:
+                board.abort(f"page {page + 1} could not be read: {type(e).__name__}: {e}")
+                return
+            if source is None:
+                return  # the job is over
+            name, image = source
+            started = time.monotonic()
+            try:
+                text = endpoint.client.transcribe_page(image, output_format, name, timeout=self.shard_timeout,
+                                                       deskew=deskew)
+            except (InferenceError, JobCancelled, OSError, EOFError) as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"Shard page {page + 1} failed on {endpoint.address}: {error}")
+                endpoint.record_failure(error)
+                board.fail(page, index, error,
+                           [i for i, ep in enumerate(self.endpoints) if ep.healthy])
+            else:
+                pages.release(page)
+                endpoint.record_success(time.monotonic() - started)
+                board.finish(page, text)
+
+    def iter_page_texts(self, image_path: str, output_format: str = "md", deskew: bool = None):
+        pages = _PageSource(image_path)
+        board = _ShardBoard(pages.count, len(self.endpoints), self.max_attempts)
+        threads = [
+            threading.Thread(target=self._drain, args=(i, board, pages, output_format, deskew),
+                             name=f"shard-{i}", daemon=True)
+            for i in range(len(self.endpoints))
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for page in range(pages.count):
+                with board.lock:
+                    while page not in board.results and board.error is None:
+                        if not any(thread.is_alive() for thread in threads):
+                            board.error = f"page {page + 1}: no worker is available"
+                            break
+                        board.lock.wait(timeout=1.0)
+                    if board.error is not None:
+                        raise ShardFailed(board.error)
+                    text = board.results.pop(page)
+                print(f"Assembled page {page + 1} of {pages.count}")
+                yield page, pages.count, text
+        finally:
+            with board.lock:
+                board.stopped = True
+                board.lock.notify_all()
+            # A shard still rendering holds the source's lock; close() waits for it.
+            pages.close()
+
+
+# =============================================================================
+#  LOCAL TEST CLUSTER
+# =============================================================================
+
+@contextmanager
+def spawn_local_workers(count: int, backend: str = "stub", timeout: float = 10.0):
+    """Run count worker processes on Unix sockets (TCP where unavailable) for a with block.
+
+    Yields their addresses. On exit the workers are terminated and waited
+    for (killed if they take longer than timeout seconds), and their socket
+    directory is removed.
+    """
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="ink2pixel-shards-") as socket_dir:
+        try:
+            addresses = []
+            for i in range(count):
+                if hasattr(socket, "AF_UNIX"):
+                    address = os.path.join(socket_dir, f"worker-{i}.sock")
+                else:
+                    ensure_authkey()
+                    address = f"127.0.0.1:{8765 + 1 + i}"
+                processes.append(subprocess.Popen([sys.executable, "-m", "vlm.worker", "--address", address,
+                                                   "--backend", backend]))
+                addresses.append(address)
+            yield addresses
+        finally:
+            for process in processes:
+                process.terminate()
+            deadline = time.monotonic() + timeout
+            for process in processes:
+                try:
+                    process.wait(timeout=max(0.0, deadline - time.monotonic()))
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Digitize one document across several inference workers.")
+    parser.add_argument("input", help="Image or PDF to digitize")
+    parser.add_argument("--output", required=True, help="Output path without extension")
+    parser.add_argument("--format", default="md", choices=["md", "latex", "html", "json", "txt", "docx"])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--workers", nargs="+", help="Worker addresses (socket path or HOST:PORT)")
+    group.add_argument("--spawn", type=int, help="Start this many local workers for the run")
+    parser.add_argument("--backend", default="stub", choices=BACKENDS, help="Backend for --spawn workers")
+    args = parser.parse_args()
+
+    with spawn_local_workers(args.spawn, args.backend) if args.spawn else nullcontext(args.workers) as addresses:
+        coordinator = ShardCoordinator(addresses)
+        started = time.perf_counter()
+        file_path = coordinator.process_and_save(args.input, args.output, args.format)
+        print(f"Saved {file_path} in {time.perf_counter() - started:.2f}s")
+        for worker in coordinator.health():
+            print(f"  {worker['address']}: {worker['pages_done']} page(s), "
+                  f"{worker['pages_failed']} failed, healthy={worker['healthy']}")
+
+
+if __name__ == "__main__":
+    main()
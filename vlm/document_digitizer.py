@@ -1,23 +1,110 @@
-import torch
 import os
 import tempfile
 import re
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor, BitsAndBytesConfig
-from qwen_vl_utils import process_vision_info
+import time
+
+from . import tracing
+from .ingest import load_page_image, load_straightened_page, crop_to_text, visual_tokens, PIXELS_PER_VISUAL_TOKEN
+from .metrics import (STAGE_SECONDS, PAGES, GENERATED_TOKENS, DECODE_TOKENS_PER_SECOND, VISUAL_TOKENS,
+                      VISUAL_TOKENS_SAVED)
+
+# torch, transformers and qwen_vl_utils are imported inside the methods that
+# need them, so importing this module (e.g. from the web layer) stays cheap.
+
+
+def open_pdf(pdf_path: str):
+    """The PDF as a PyMuPDF document; close() it when done."""
+    try:
+        import fitz  
+    except ImportError:
+        raise ImportError("Processing PDFs requires PyMuPDF. Install via: pip install pymupdf")
+    return fitz.open(pdf_path)
+
+
+def render_pdf_page(doc, index: int, zoom: float = 2.0):
+    """Pixmap of one page of an open_pdf() document, rasterized at zoom x 72 DPI."""
+    import fitz
+    return doc.load_page(index).get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+
+
+def iter_pdf_pages(pdf_path: str, zoom: float = 2.0):
+    """Yields (page_index, page_count, pixmap) for each page of a PDF, rasterized at zoom x 72 DPI."""
+    doc = open_pdf(pdf_path)
+    try:
+        for i in range(len(doc)):
+            yield i, len(doc), render_pdf_page(doc, i, zoom)
+    finally:
+        doc.close()
+
+
+class _FirstTokenTimer:
+    """Streamer for generate() that notes when the first new token arrives.
+
+    generate() calls put() once with the prompt and then once per generated
+    token, so the second call marks the end of vision encoding + prefill.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.first_token_at = None
+
+    def put(self, value):
+        self.calls += 1
+        if self.calls == 2:
+            self.first_token_at = time.perf_counter()
+
+    def end(self):
+        pass
+
+
+def new_usage() -> dict:
+    """Running totals a digitizer keeps across calls (read them as deltas)."""
+    return {"pages": 0, "generated_tokens": 0}
+
 
 class DocumentDigitizer:
-    def __init__(self, model_id="Qwen/Qwen2.5-VL-7B-Instruct"):
-        print("Loading Qwen2.5-VL in 4-bit mode into VRAM... Please wait.")
+    # Upper bound on generated tokens per page.
+    max_new_tokens = 4096
+    # PDF pages are rasterized at pdf_zoom x 72 DPI.
+    pdf_zoom = 2.0
+    # Cap on image pixels handed to the vision tower (None: qwen_vl_utils' default).
+    # Visual tokens grow linearly with it: one token per 28 x 28 pixels.
+    max_pixels = None
+    # Images are decoded and downscaled in memory to fit this many visual
+    # tokens before the VLM sees them (2560 ~ a Letter page at 144 DPI), so a
+    # 48 MP phone photo costs no more than a scanned page.
+    max_visual_tokens = 2560
+    # Crop each page to its detected text area (plus crop_padding pixels)
+    # so margins, desk and blank halves of pages are not sent as tokens.
+    crop_to_text = os.environ.get("INK2PIXEL_CROP_TO_TEXT") == "1"
+    crop_padding = 24
+    # Undo perspective and skew of photographed pages (one warp per page).
+    # The default for requests that do not say; see process_and_save(deskew=...).
+    deskew = os.environ.get("INK2PIXEL_DESKEW") == "1"
+
+    def __init__(self, model_id="Qwen/Qwen2.5-VL-7B-Instruct", quantization="nf4"):
+        """quantization: "nf4" (4-bit, the default), "int8", or None for unquantized weights."""
+        import torch
+        from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor, BitsAndBytesConfig
+
+        if quantization not in ("nf4", "int8", None):
+            raise ValueError(f"Unknown quantization: {quantization!r}")
+        mode = {"nf4": "4-bit", "int8": "8-bit", None: "full-precision"}[quantization]
+        print(f"Loading Qwen2.5-VL in {mode} mode into VRAM... Please wait.")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         
         compute_dtype = torch.bfloat16 if (torch.cuda.is_available() and torch.cuda.is_bf16_supported()) else torch.float16
         
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_compute_dtype=compute_dtype
-        )
+        quantization_config = None
+        if quantization == "nf4":
+            quantization_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_use_double_quant=True,
+                bnb_4bit_compute_dtype=compute_dtype
+            )
+        elif quantization == "int8":
+            quantization_config = BitsAndBytesConfig(load_in_8bit=True)
         
         self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
             model_id, 
@@ -26,6 +113,7 @@ class DocumentDigitizer:
             quantization_config=quantization_config
         )
         self.processor = AutoProcessor.from_pretrained(model_id)
+        self.usage = new_usage()
         print("Model loaded successfully!")
 
     def _get_prompt_for_format(self, output_format: str) -> str:
@@ -67,21 +155,81 @@ class DocumentDigitizer:
         return text
         
 
-    def _run_vlm(self, image_path: str, prompt: str) -> str:
+    def _pixel_budget(self) -> int:
+        budget = self.max_visual_tokens * PIXELS_PER_VISUAL_TOKEN if self.max_visual_tokens else None
+        if self.max_pixels:
+            budget = min(budget, self.max_pixels) if budget else self.max_pixels
+        return budget
+
+    def _run_vlm(self, image_path: str, prompt: str, deskew: bool = None) -> str:
         """Helper to process a single image through the model."""
-        messages = [{"role": "user", "content": [{"type": "image", "image": image_path}, {"type": "text", "text": prompt}]}]
+        import torch
+        from qwen_vl_utils import process_vision_info
+
+        started = time.perf_counter()
+        budget = self._pixel_budget()
+        if self.deskew if deskew is None else deskew:
+            # Measured on a small copy, warped once from the full decode to the budget size.
+            with tracing.span("load_straightened_page") as span:
+                page_image, geometry = load_straightened_page(image_path, budget)
+                if span is not None:
+                    span.set(width=page_image.width, height=page_image.height, **geometry)
+            assert not budget or visual_tokens(page_image.width, page_image.height) <= budget // PIXELS_PER_VISUAL_TOKEN, \
+                f"straightened {page_image.width}x{page_image.height} page is over the visual token budget"
+        else:
+            with tracing.span("load_page_image") as span:
+                page_image = load_page_image(image_path, budget)
+                if span is not None:
+                    span.set(width=page_image.width, height=page_image.height)
+        tokens_saved = None
+        if self.crop_to_text:
+            with tracing.span("crop_to_text") as span:
+                full_tokens = visual_tokens(page_image.width, page_image.height)
+                page_image, bbox = crop_to_text(page_image, padding=self.crop_padding)
+                tokens_saved = full_tokens - visual_tokens(page_image.width, page_image.height)
+                if span is not None:
+                    span.set(bbox=bbox, visual_tokens_saved=tokens_saved)
+            if bbox is not None:
+                print(f"Cropped page to text area {page_image.width}x{page_image.height}: "
+                      f"{tokens_saved} of {full_tokens} visual tokens saved.")
+        image = {"type": "image", "image": page_image}
+        if self.max_pixels:
+            image["max_pixels"] = self.max_pixels
+        messages = [{"role": "user", "content": [image, {"type": "text", "text": prompt}]}]
         
         text = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        image_inputs, video_inputs = process_vision_info(messages)
+        with tracing.span("process_vision_info"):
+            image_inputs, video_inputs = process_vision_info(messages)
 
-        inputs = self.processor(
-            text=[text], images=image_inputs, videos=video_inputs, padding=True, return_tensors="pt"
-        ).to(self.device)
+        with tracing.span("processor"):
+            inputs = self.processor(
+                text=[text], images=image_inputs, videos=video_inputs, padding=True, return_tensors="pt"
+            ).to(self.device)
+        generate_started = time.perf_counter()
 
+        timer = _FirstTokenTimer()
         with torch.no_grad():
-            generated_ids = self.model.generate(**inputs, max_new_tokens=4096)
+            generated_ids = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens, streamer=timer)
+        finished = time.perf_counter()
 
         generated_ids_trimmed = [out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)]
+        merge_size = getattr(self.processor.image_processor, "merge_size", 2)
+        first_token_at = timer.first_token_at or finished
+        generated_tokens = len(generated_ids_trimmed[0])
+        visual_tokens = int(inputs["image_grid_thw"].prod(-1).sum()) // merge_size ** 2
+        prompt_tokens = int(inputs.input_ids.shape[1])
+        tracing.emit("prefill", generate_started, first_token_at - generate_started,
+                     prompt_tokens=prompt_tokens, visual_tokens=visual_tokens)
+        tracing.emit("decode", first_token_at, finished - first_token_at, generated_tokens=generated_tokens)
+        self._record_page(
+            generated_tokens=generated_tokens,
+            visual_tokens=visual_tokens,
+            prompt_tokens=prompt_tokens,
+            preprocess_seconds=generate_started - started,
+            prefill_seconds=first_token_at - generate_started,
+            decode_seconds=finished - first_token_at,
+            visual_tokens_saved=tokens_saved,
+        )
         extracted_text = self.processor.batch_decode(generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False)[0]
 
         if extracted_text.startswith("```"):
@@ -91,42 +239,86 @@ class DocumentDigitizer:
                 
         return extracted_text
 
-    def process_and_save(self, image_path: str, output_path: str, output_format: str = "md") -> str:
-        """Processes the image/PDF and saves it. Handles PDFs page-by-page to insert breaks and save VRAM."""
+    def _record_page(self, generated_tokens: int, visual_tokens: int = None, prompt_tokens: int = None,
+                     preprocess_seconds: float = None, prefill_seconds: float = None,
+                     decode_seconds: float = None, visual_tokens_saved: int = None) -> None:
+        """Update usage totals and the per-page metrics after one _run_vlm call.
+
+        The same figures are kept in self.last_page for benchmarks and evals.
+        """
+        self.last_page = {"generated_tokens": generated_tokens, "visual_tokens": visual_tokens,
+                          "prompt_tokens": prompt_tokens, "preprocess_seconds": preprocess_seconds,
+                          "prefill_seconds": prefill_seconds, "decode_seconds": decode_seconds,
+                          "visual_tokens_saved": visual_tokens_saved}
+        self.usage["pages"] += 1
+        self.usage["generated_tokens"] += generated_tokens
+        PAGES.inc()
+        GENERATED_TOKENS.inc(generated_tokens)
+        if visual_tokens is not None:
+            VISUAL_TOKENS.observe(visual_tokens)
+        if visual_tokens_saved:
+            VISUAL_TOKENS_SAVED.inc(visual_tokens_saved)
+        if preprocess_seconds is not None:
+            STAGE_SECONDS.observe(preprocess_seconds, stage="preprocess")
+        if prefill_seconds is not None:
+            STAGE_SECONDS.observe(prefill_seconds, stage="prefill")
+        if decode_seconds is not None:
+            STAGE_SECONDS.observe(decode_seconds, stage="decode")
+            if decode_seconds > 0 and generated_tokens > 1:
+                # The first token comes out of prefill.
+                DECODE_TOKENS_PER_SECOND.observe((generated_tokens - 1) / decode_seconds)
+
+    def iter_page_texts(self, image_path: str, output_format: str = "md", deskew: bool = None):
+        """Yields (page_index, page_count, text) as each page of the image/PDF is transcribed."""
         prompt = self._get_prompt_for_format(output_format)
-        extracted_texts = []
 
         if image_path.lower().endswith(".pdf"):
-            try:
-                import fitz  
-            except ImportError:
-                raise ImportError("Processing PDFs requires PyMuPDF. Install via: pip install pymupdf")
-            
-            doc = fitz.open(image_path)
-            temp_dir = tempfile.TemporaryDirectory()
-            
-            for i in range(len(doc)):
-                print(f"Processing PDF page {i+1} of {len(doc)}...")
-                page = doc.load_page(i)
-                pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
-                temp_img_path = os.path.join(temp_dir.name, f"page_{i}.png")
-                pix.save(temp_img_path)
-                
-                text = self._run_vlm(temp_img_path, prompt)
-                extracted_texts.append(text)
-                
-            temp_dir.cleanup()
+            with tempfile.TemporaryDirectory() as temp_dir:
+                started = time.perf_counter()
+                for i, page_count, pix in iter_pdf_pages(image_path, zoom=self.pdf_zoom):
+                    print(f"Processing PDF page {i+1} of {page_count}...")
+                    temp_img_path = os.path.join(temp_dir, f"page_{i}.png")
+                    pix.save(temp_img_path)
+                    rasterize_seconds = time.perf_counter() - started
+                    STAGE_SECONDS.observe(rasterize_seconds, stage="rasterize")
+                    tracing.emit("rasterize", started, rasterize_seconds, page=i, width=pix.width, height=pix.height)
+
+                    # Spans must close before the yield: the caller runs in between.
+                    with tracing.span("_run_vlm", page=i, pages=page_count):
+                        text = self._run_vlm(temp_img_path, prompt, deskew=deskew)
+                    yield i, page_count, text
+                    started = time.perf_counter()
         else:
             print("Processing image...")
-            text = self._run_vlm(image_path, prompt)
-            extracted_texts.append(text)
+            with tracing.span("_run_vlm", page=0, pages=1):
+                text = self._run_vlm(image_path, prompt, deskew=deskew)
+            yield 0, 1, text
+
+    def process_and_save(self, image_path: str, output_path: str, output_format: str = "md", on_page=None,
+                         deskew: bool = None) -> str:
+        """Processes the image/PDF and saves it. Handles PDFs page-by-page to insert breaks and save VRAM.
+
+        on_page(page_index, page_count, text) is called after every page; raising from it
+        aborts the job before the next page is started. deskew straightens photographed
+        pages for this job (None: the digitizer's default).
+        """
+        with tracing.span("process_and_save", format=output_format), \
+                tracing.profile_job(os.path.basename(output_path)):
+            extracted_texts = []
+
+            for i, page_count, text in self.iter_page_texts(image_path, output_format, deskew=deskew):
+                extracted_texts.append(text)
+                if on_page is not None:
+                    on_page(i, page_count, text)
 
-        full_document_text = "\n\n=== PAGE BREAK ===\n\n".join(extracted_texts)
+            full_document_text = "\n\n=== PAGE BREAK ===\n\n".join(extracted_texts)
 
-        if output_format != "latex":
-            full_document_text = self._fix_math_delimiters(full_document_text)
+            if output_format != "latex":
+                with STAGE_SECONDS.time(stage="math_fixup"), tracing.span("math_fixup"):
+                    full_document_text = self._fix_math_delimiters(full_document_text)
 
-        return self._export_document(full_document_text, output_path, output_format)
+            with STAGE_SECONDS.time(stage="export"), tracing.span("_export_document", format=output_format):
+                return self._export_document(full_document_text, output_path, output_format)
 
     def _export_document(self, text: str, base_filename: str, output_format: str) -> str:
         """Handles file creation, page breaks, and rendering Math in Word."""
@@ -0,0 +1,54 @@
+"""
+Advisory locks on open files, used as cross-process "still running" markers.
+
+A process takes an exclusive lock on a file for as long as it is busy;
+anyone else can tell whether it still is by trying to take the lock too.
+The OS drops the lock when the holder closes the file or exits, however it
+exits, so no PID has to be probed. (os.kill(pid, 0) is no probe on Windows:
+it sends CTRL_C_EVENT to the target's process group.)
+
+    f = open(path, "wb")
+    try_lock(f)      # held until f is closed
+    ...
+    is_held(path)    # from any process, including this one
+"""
+import os
+
+
+def try_lock(f) -> bool:
+    """Take an exclusive, non-blocking lock on open binary file f; False if another handle holds it."""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def unlock(f) -> None:
+    """Release a lock taken with try_lock() (closing f does too)."""
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def is_held(path) -> bool:
+    """Whether some open handle, in any process, holds the lock on path; False if path is gone."""
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return False
+    with f:
+        if try_lock(f):
+            unlock(f)
+            return False
+        return True
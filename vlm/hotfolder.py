@@ -0,0 +1,210 @@
+"""
+Hot-folder ingestion: digitize images/PDFs as they appear in a directory.
+
+Scanners write into a shared inbox; HotFolder notices new files (through
+watchdog's inotify/FSEvents/ReadDirectoryChanges observers when the package
+is installed, by rescanning every few seconds otherwise), waits until a file
+has stopped growing, and hands it to the same inference backend as the web
+app. At most `jobs` files are in flight at once; the rest wait their turn.
+Results land in a sibling folder (scans/ -> scans_digitized/), mirroring the
+inbox's subfolders, and the batch manifest there makes restarts skip work
+already done; a duplicate drop (same content under another name) gets a copy
+of the earlier output.
+
+    python ink2pixel.py watch /srv/scans [--output /srv/scans_digitized] [--jobs 2]
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .batch import INPUT_EXTENSIONS, MANIFEST_NAME, BatchManifest, digitize_file, output_path_for, resolve_backend
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Partial downloads and editor/scanner temp files are never picked up.
+IGNORED_SUFFIXES = (".part", ".partial", ".crdownload", ".tmp", ".download")
+
+
+def default_output_dir(inbox: str) -> str:
+    inbox = os.path.abspath(inbox)
+    return os.path.join(os.path.dirname(inbox), os.path.basename(inbox) + "_digitized")
+
+
+def is_candidate(path: str) -> bool:
+    name = os.path.basename(path)
+    if name.startswith((".", "~$")) or name.lower().endswith(IGNORED_SUFFIXES):
+        return False
+    return name.lower().endswith(INPUT_EXTENSIONS)
+
+
+class _InboxEvents(FileSystemEventHandler):
+    """Forwards watchdog create/modify/move events to HotFolder.notice()."""
+
+    def __init__(self, hot_folder):
+        self.hot_folder = hot_folder
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.hot_folder.notice(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.hot_folder.notice(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.hot_folder.notice(event.dest_path)
+
+
+class HotFolder:
+    """Watches inbox and digitizes every new, fully written file once."""
+
+    def __init__(self, inbox: str, output_dir: str = None, formats=("md",), backend=None, jobs: int = 1,
+                 settle_seconds: float = 2.0, poll_interval: float = 2.0, use_watchdog: bool = True):
+        self.inbox = os.path.abspath(inbox)
+        self.output_dir = os.path.abspath(output_dir or default_output_dir(inbox))
+        if self.output_dir == self.inbox or self.output_dir.startswith(self.inbox + os.sep):
+            raise ValueError("The output folder must not be inside the watched folder")
+        self.formats = tuple(formats)
+        self.backend, self.jobs = resolve_backend(backend, jobs)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_watchdog = use_watchdog and Observer is not None
+        self.manifest = BatchManifest(os.path.join(self.output_dir, MANIFEST_NAME))
+
+        self._lock = threading.Lock()
+        self._candidates = {}  # path -> (size, mtime_ns, unchanged_since)
+        self._in_flight = set()
+        self._seen = {}        # path -> (size, mtime_ns) last handed to the backend
+        self._slots = threading.BoundedSemaphore(self.jobs)
+        self._pool = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="hotfolder")
+        self._stop = threading.Event()
+        self.counts = {"done": 0, "copied": 0, "skipped": 0, "error": 0}
+
+    # -------------------------------------------------------------------------
+    #  Discovery
+    # -------------------------------------------------------------------------
+
+    def notice(self, path: str) -> None:
+        """Mark path as possibly new or changed; it is checked on the next tick."""
+        path = os.path.abspath(path)
+        if not is_candidate(path):
+            return
+        with self._lock:
+            if path not in self._candidates and path not in self._in_flight:
+                self._candidates[path] = (-1, -1, time.monotonic())
+
+    def scan(self) -> None:
+        """Walk the inbox and notice every file not handled in its current state."""
+        for root, dirs, files in os.walk(self.inbox):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                path = os.path.join(root, name)
+                if not is_candidate(path):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if self._seen.get(path) != (st.st_size, st.st_mtime_ns):
+                    self.notice(path)
+
+    # -------------------------------------------------------------------------
+    #  Settling and dispatch
+    # -------------------------------------------------------------------------
+
+    def _settled(self) -> list:
+        """Candidates whose size and mtime have not changed for settle_seconds."""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (size, mtime_ns, since) in list(self._candidates.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del self._candidates[path]  # deleted or moved away before it settled
+                    continue
+                state = (st.st_size, st.st_mtime_ns)
+                if state != (size, mtime_ns):
+                    self._candidates[path] = (*state, now)
+                elif st.st_size > 0 and now - since >= self.settle_seconds:
+                    if self._seen.get(path) == state:
+                        del self._candidates[path]  # touched, but not rewritten
+                    else:
+                        ready.append((since, path, state))
+        return [(path, state) for _, path, state in sorted(ready)]
+
+    def _dispatch(self) -> None:
+        for path, state in self._settled():
+            if not self._slots.acquire(blocking=False):
+                return  # all slots busy; the rest stay candidates until one frees up
+            with self._lock:
+                self._candidates.pop(path, None)
+                self._in_flight.add(path)
+                self._seen[path] = state
+            self._pool.submit(self._process, path)
+
+    def _process(self, path: str) -> None:
+        rel = os.path.relpath(path, self.inbox)
+        try:
+            for output_format in self.formats:
+                try:
+                    result = digitize_file(self.backend, self.manifest, path,
+                                           output_path_for(self.output_dir, rel, output_format, self.formats),
+                                           output_format)
+                except OSError as e:
+                    result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+                with self._lock:
+                    self.counts[result["status"]] += 1
+                detail = result.get("error") or result.get("output")
+                print(f"Hot folder: {result['status']:<7} {rel} ({output_format}) {detail}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+            self._slots.release()
+
+    # -------------------------------------------------------------------------
+    #  Lifecycle
+    # -------------------------------------------------------------------------
+
+    def run(self) -> None:
+        """Watch until stop() is called (or Ctrl+C), then finish in-flight files."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        observer = None
+        if self.use_watchdog:
+            observer = Observer()
+            observer.schedule(_InboxEvents(self), self.inbox, recursive=True)
+            observer.start()
+        mode = "filesystem events" if observer else f"polling every {self.poll_interval:g}s"
+        print(f"Watching {self.inbox} ({mode}); results go to {self.output_dir}")
+
+        # Files already waiting are picked up first. With watchdog a slow rescan
+        # still runs as a safety net for events lost on network shares.
+        self.scan()
+        rescan_every = self.poll_interval if observer is None else max(60.0, self.poll_interval)
+        last_scan = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() - last_scan >= rescan_every:
+                    self.scan()
+                    last_scan = time.monotonic()
+                self._dispatch()
+                self._stop.wait(min(0.5, self.settle_seconds / 2 or 0.5))
+        except KeyboardInterrupt:
+            print("Stopping; waiting for files in progress...")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self._pool.shutdown(wait=True)
+            print(f"Hot folder stopped: {self.counts['done']} digitized, {self.counts['copied']} copied, "
+                  f"{self.counts['skipped']} skipped, {self.counts['error']} failed")
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,167 @@
+"""
+Page image ingestion ahead of the VLM.
+
+Phone photos of notes arrive at 12-48 MP. Handed to process_vision_info as a
+path, the whole file is decoded at full size and, up to qwen_vl_utils' very
+high default pixel cap, every 28 x 28 block becomes a visual token. That
+costs vision-encoder time, prefill time and memory for detail the model does
+not need to read handwriting.
+
+load_page_image() decodes the file once, in memory, to about the size the
+visual-token budget allows:
+
+  1. JPEG draft mode: libjpeg decodes straight at 1/2, 1/4 or 1/8 scale,
+     never below the target, so a 48 MP photo is never fully decoded.
+  2. EXIF orientation is applied, so sideways photos reach the model upright.
+  3. The image is converted to RGB (the mode the processor wants).
+  4. A reducing resize brings the pixel count down to the budget.
+  5. Transparency is flattened onto white rather than black, after the
+     resize so it touches as few pixels as possible.
+
+load_straightened_page() does the same for photographed pages that also
+need their perspective and skew undone. Shrinking to the budget first and
+warping afterwards would resample the page twice and, since a rotated page
+needs a larger canvas, land over the budget. Instead the page outline and
+text angle are measured on a small draft decode, and the page is warped
+once, from a decode with enough resolution, straight to a size within the
+budget.
+"""
+import math
+
+# One visual token covers a 28 x 28 pixel block (14 px patches, 2 x 2 merge).
+PIXELS_PER_VISUAL_TOKEN = 28 * 28
+
+
+def target_size(width: int, height: int, max_pixels: int) -> tuple:
+    """(width, height) scaled down, keeping aspect ratio, to at most max_pixels; never scaled up."""
+    if not max_pixels or width * height <= max_pixels:
+        return width, height
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def visual_tokens(width: int, height: int) -> int:
+    """Approximate visual tokens for an image of this size (Qwen rounds each side to a multiple of 28)."""
+    return max(1, round(width / 28)) * max(1, round(height / 28))
+
+
+def crop_to_text(image, padding: int = 24, working_size: int = 800):
+    """Crop a PIL page image to its inked area; returns (image, bbox or None).
+
+    Detection is legacy_preprocessing.LayoutDetector.find_text_area on a
+    downscaled grayscale copy. The page is left alone when no text is found
+    or when the text already fills nearly all of it.
+    """
+    import numpy as np
+    from legacy_preprocessing import LayoutDetector
+
+    bbox = LayoutDetector().find_text_area(np.asarray(image.convert("L")), working_size=working_size,
+                                           padding=padding)
+    if bbox is None:
+        return image, None
+    x, y, w, h = bbox
+    if w * h > 0.95 * image.width * image.height:
+        return image, None
+    return image.crop((x, y, x + w, y + h)), bbox
+
+
+def load_page_image(source, max_pixels: int):
+    """Open an image file (path or file object) as an upright RGB PIL image of at most max_pixels."""
+    from PIL import Image, ImageOps
+
+    image = Image.open(source)
+    size = target_size(image.width, image.height, max_pixels)
+    if image.format == "JPEG" and size != image.size:
+        # draft() picks the smallest DCT scale still >= the requested size.
+        image.draft("RGB", size)
+
+    image = ImageOps.exif_transpose(image)  # loads the (draft-sized) pixels
+
+    transparent = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    if transparent:
+        image = image.convert("RGBA")
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    size = target_size(image.width, image.height, max_pixels)
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    if transparent:
+        flat = Image.new("RGB", image.size, "white")
+        flat.paste(image, mask=image.getchannel("A"))
+        image = flat
+    return image
+
+
+def _decode(source, min_pixels: int = None):
+    """Open an image as upright RGB, JPEGs at the smallest DCT scale that keeps min_pixels.
+
+    Returns (image, factor): factor is how many times smaller each side is
+    than the full-resolution image.
+    """
+    from PIL import Image, ImageOps
+
+    image = Image.open(_rewound(source))
+    full_pixels = image.width * image.height
+    size = target_size(image.width, image.height, min_pixels)
+    if image.format == "JPEG" and size != image.size:
+        image.draft("RGB", size)
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        flat = Image.new("RGB", image.size, "white")
+        flat.paste(image, mask=image.getchannel("A"))
+        image = flat
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    return image, math.sqrt(full_pixels / (image.width * image.height))
+
+
+def load_straightened_page(source, max_pixels: int, working_size: int = 800):
+    """load_page_image() with perspective and skew undone; returns (image, info).
+
+    legacy_preprocessing.GeometryCorrector measures the page outline and the
+    text angle on a decode of about working_size px. The resulting homography
+    is scaled to map a decode of just enough resolution directly onto the
+    output, whose sides are multiples of 28 px within max_pixels (the size the
+    processor would resize to anyway), and applied in one warpPerspective.
+    """
+    import cv2
+    import numpy as np
+    from PIL import Image
+    from legacy_preprocessing import GeometryCorrector
+
+    small, small_factor = _decode(source, working_size * working_size)
+    corrector = GeometryCorrector(working_size=working_size, channel_order='RGB')
+    homography, size = corrector.estimate(np.asarray(small))
+    if homography is None:  # already straight: the same single resample, to the same block-aligned size
+        homography, size = np.eye(3), small.size
+
+    # The straightened page at full resolution, then within the budget on whole 28 px blocks.
+    natural = (size[0] * small_factor, size[1] * small_factor)
+    width, height = target_size(round(natural[0]), round(natural[1]), max_pixels)
+    width, height = max(28, width // 28 * 28), max(28, height // 28 * 28)
+
+    if small_factor == 1.0:
+        page = small  # not a JPEG, or already small: decoded in full the first time
+    else:
+        needed = (width / natural[0]) ** 2 * (small.width * small.height) * small_factor ** 2
+        page, _ = _decode(source, math.ceil(needed))
+    to_small = np.diag([small.width / page.width, small.height / page.height, 1.0])
+    to_output = np.diag([width / size[0], height / size[1], 1.0])
+    pixels = np.asarray(page)
+    # warpPerspective samples bilinearly: low-pass a page it shrinks a lot, or thin strokes alias.
+    shrink = page.width / small.width * size[0] / width
+    if shrink > 1.5:
+        pixels = cv2.GaussianBlur(pixels, (0, 0), 0.5 * shrink)
+    warped = cv2.warpPerspective(pixels, to_output @ homography @ to_small, (width, height),
+                                 flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT,
+                                 borderValue=(255, 255, 255))
+    return Image.fromarray(warped), corrector.last_info
+
+
+def _rewound(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
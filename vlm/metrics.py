@@ -0,0 +1,349 @@
+"""
+Prometheus-style metrics without the prometheus_client dependency.
+
+Metrics live in a process-wide REGISTRY. Recording is a lock and a few
+additions, cheap enough to leave on permanently. The inference worker sends
+its families to web processes over the worker socket (the "metrics" op), and
+/metrics renders them together with the web process's own. Every sample
+carries a process="web"|"worker" label so both sides' RSS and the like stay
+distinct.
+
+With several web workers, a scrape reaches only one of them. Each then
+calls REGISTRY.share(directory) (app.py exports INK2PIXEL_METRICS_DIR for
+this) and writes its families there every second; collect_shared() sums the
+counters and histograms of every process that ever wrote, and lists gauges
+of the live ones with a pid label, much as prometheus_client's multiprocess
+mode does. A process counts as live while it holds its .lock file there
+(see vlm/filelock.py).
+
+    from vlm.metrics import STAGE_SECONDS
+    with STAGE_SECONDS.time(stage="export"):
+        ...
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from vlm.filelock import is_held, try_lock
+
+# Seconds; spans a cached page render (~ms) up to a long PDF page decode (minutes).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._function = None
+        (registry or REGISTRY).register(self)
+
+    def set_function(self, function) -> None:
+        """Take values from function() at scrape time instead: a number, or [(labels_dict, number)]."""
+        self._function = function
+
+    def _function_samples(self) -> list:
+        try:
+            value = self._function()
+        except Exception:
+            return []
+        if isinstance(value, (int, float)):
+            return [(self.name, {}, value)]
+        return [(self.name, labels, v) for labels, v in value]
+
+    def samples(self) -> list:
+        """[(sample_name, labels_dict, value)]"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, registry=None):
+        self._values = {}
+        super().__init__(name, documentation, registry)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self._function is not None:
+            return self._function_samples()
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, registry=None):
+        self._values = {}
+        super().__init__(name, documentation, registry)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        if self._function is not None:
+            return self._function_samples()
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., +Inf count, sum]
+        super().__init__(name, documentation, registry)
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in series.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                out.append((f"{self.name}_bucket", {**labels, "le": le}, cumulative))
+            out.append((f"{self.name}_sum", labels, values[-1]))
+            out.append((f"{self.name}_count", labels, cumulative))
+        return out
+
+
+class Registry:
+    def __init__(self, process: str = "web"):
+        self.process = process
+        self.shared_dir = None
+        self._alive_file = None
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def collect(self) -> list:
+        """Picklable [(name, kind, documentation, samples)] with the process label applied."""
+        with self._lock:
+            metrics = list(self._metrics)
+        families = []
+        for metric in metrics:
+            samples = [(name, {"process": self.process, **labels}, value) for name, labels, value in metric.samples()]
+            families.append((metric.name, metric.kind, metric.documentation, samples))
+        return families
+
+    # ---------- several processes behind one /metrics ----------
+
+    def share(self, directory: str, interval: float = 1.0) -> None:
+        """Write this process's families to directory every interval seconds, for collect_shared()."""
+        os.makedirs(directory, exist_ok=True)
+        self.shared_dir = directory
+        # Held for the life of the process; collect_shared() tells live gauges from dead ones by it.
+        self._alive_file = open(os.path.join(directory, f"{self.process}-{os.getpid()}.lock"), "wb")
+        try_lock(self._alive_file)
+        self._write_shared()
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self._write_shared()
+                except OSError as e:
+                    print(f"Could not write shared metrics: {e}")
+
+        threading.Thread(target=loop, name="metrics-share", daemon=True).start()
+
+    def _write_shared(self) -> None:
+        path = os.path.join(self.shared_dir, f"{self.process}-{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.collect(), f)
+        os.replace(tmp, path)
+
+    def collect_shared(self) -> list:
+        """collect() summed over every process sharing shared_dir (just this one if share() was not called).
+
+        Counters and histograms add up across processes, including ones that
+        have exited, so totals never go backwards between scrapes. Gauges are
+        per process: those of live processes get a pid label, the rest are dropped.
+        """
+        if self.shared_dir is None:
+            return self.collect()
+        self._write_shared()  # this process's figures as of now
+
+        merged = {}  # name -> (kind, documentation, {(sample name, labels key): value})
+        for file_name in sorted(os.listdir(self.shared_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            stem = file_name[:-len(".json")]
+            pid = int(stem.rsplit("-", 1)[1])
+            try:
+                with open(os.path.join(self.shared_dir, file_name)) as f:
+                    families = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = is_held(os.path.join(self.shared_dir, f"{stem}.lock"))
+            for name, kind, documentation, samples in families:
+                values = merged.setdefault(name, (kind, documentation, {}))[2]
+                for sample_name, labels, value in samples:
+                    if kind in ("counter", "histogram"):
+                        key = (sample_name, _label_key(labels))
+                        values[key] = values.get(key, 0) + value
+                    elif alive:
+                        values[(sample_name, _label_key({**labels, "pid": str(pid)}))] = value
+        return [(name, kind, documentation, [(sample_name, dict(key), value)
+                                              for (sample_name, key), value in values.items()])
+                for name, (kind, documentation, values) in merged.items()]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def render(*family_lists) -> str:
+    """Prometheus text exposition (v0.0.4) of one or more collect() results.
+
+    Families with the same name (e.g. RSS from the web and the worker process)
+    are merged under a single HELP/TYPE header.
+    """
+    merged = {}
+    for families in family_lists:
+        for name, kind, documentation, samples in families:
+            entry = merged.setdefault(name, (kind, documentation, []))
+            entry[2].extend(samples)
+    lines = []
+    for name, (kind, documentation, samples) in merged.items():
+        lines.append(f"# HELP {name} {_escape(documentation)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for sample_name, labels, value in samples:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(process="web")
+
+
+# =============================================================================
+#  INFERENCE PIPELINE
+# =============================================================================
+
+STAGE_SECONDS = Histogram(
+    "ink2pixel_stage_seconds",
+    "Time spent per pipeline stage: upload, rasterize, preprocess (image resize + tokenize), "
+    "prefill (vision encode + prompt, up to the first token), decode, math_fixup, export.",
+)
+PAGES = Counter("ink2pixel_pages_total", "Pages transcribed by the model.")
+GENERATED_TOKENS = Counter("ink2pixel_generated_tokens_total", "Tokens generated by the model.")
+DECODE_TOKENS_PER_SECOND = Histogram(
+    "ink2pixel_decode_tokens_per_second",
+    "Per-page decode speed (generated tokens / decode seconds).",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 400),
+)
+VISUAL_TOKENS = Histogram(
+    "ink2pixel_visual_tokens_per_page",
+    "Image tokens the vision encoder fed to the language model, per page.",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+VISUAL_TOKENS_SAVED = Counter(
+    "ink2pixel_visual_tokens_saved_total",
+    "Visual tokens avoided by cropping pages to their text area.",
+)
+QUEUE_DEPTH = Gauge("ink2pixel_queue_depth", "Jobs waiting for the model.")
+JOBS_IN_FLIGHT = Gauge("ink2pixel_jobs_in_flight", "Jobs currently being processed.")
+
+
+# =============================================================================
+#  PROCESS RESOURCES
+# =============================================================================
+
+def resident_memory_bytes() -> int:
+    """Current RSS, from /proc where available (Linux), else peak RSS via getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    import resource  # not on Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def accelerator_memory() -> list:
+    """[(labels, bytes)] for CUDA/MPS memory, only if this process has already imported torch."""
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return []
+    out = []
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        for device in range(torch.cuda.device_count()):
+            out.append(({"device": f"cuda:{device}", "kind": "allocated"}, torch.cuda.memory_allocated(device)))
+            out.append(({"device": f"cuda:{device}", "kind": "reserved"}, torch.cuda.memory_reserved(device)))
+            out.append(({"device": f"cuda:{device}", "kind": "peak_allocated"}, torch.cuda.max_memory_allocated(device)))
+    elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        out.append(({"device": "mps", "kind": "allocated"}, torch.mps.current_allocated_memory()))
+    return out
+
+
+Gauge("process_resident_memory_bytes", "Resident memory size in bytes.").set_function(resident_memory_bytes)
+Gauge("ink2pixel_accelerator_memory_bytes", "GPU/accelerator memory held by torch.").set_function(accelerator_memory)
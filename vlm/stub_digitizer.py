@@ -0,0 +1,32 @@
+import os
+import time
+from .document_digitizer import DocumentDigitizer, new_usage
+
+
+class StubDigitizer(DocumentDigitizer):
+    """Model-free stand-in for DocumentDigitizer.
+
+    Runs the real page loop, math fixups and export path but replaces the VLM
+    call with canned text, so the web app, the inference worker and the tools
+    built on them can be exercised without a GPU or a model download.
+    INK2PIXEL_STUB_DELAY (seconds per page) simulates inference latency.
+    """
+
+    def __init__(self, delay: float = None):
+        self.device = "cpu"
+        self.delay = float(os.environ.get("INK2PIXEL_STUB_DELAY", 0)) if delay is None else delay
+        self.usage = new_usage()
+
+    def _run_vlm(self, image_path: str, prompt: str, deskew: bool = None) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        name = os.path.basename(image_path) if isinstance(image_path, str) else "image"
+        text = (
+            f"# Transcription of {name}\n\n"
+            "Claim: for all \\( n \\in \\mathbb{N} \\),\n\n"
+            "\\[ \\sum_{k=1}^{n} k = \\frac{n(n+1)}{2} \\]\n\n"
+            "Proof by induction."
+        )
+        # No tokenizer here; whitespace words stand in for generated tokens.
+        self._record_page(len(text.split()), decode_seconds=self.delay)
+        return text
@@ -0,0 +1,185 @@
+"""
+Lightweight per-job tracing to a JSONL file.
+
+Set INK2PIXEL_TRACE_FILE (or call configure()) and every span() becomes one
+JSON line written when it closes:
+
+    {"ts": 1718000000.123, "ms": 812.4, "name": "_run_vlm", "trace": "...",
+     "span": "...", "parent": "...", "pid": 4242, "job_id": "3f2a...", "page": 2}
+
+Spans nest through a contextvar, so asyncio.to_thread() and nested calls
+pick up their parent (and its job_id/page) automatically. The inference
+worker runs in another process, so InferenceClient sends current_context()
+with each job and the worker attach()es it. With tracing off, span()
+returns one shared no-op context manager, which costs a single global
+lookup.
+
+INK2PIXEL_PROFILE_DIR additionally wraps the next job in torch.profiler and
+writes a Chrome trace (chrome://tracing, Perfetto) there; once per process.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+# Attributes children inherit from their parent span.
+INHERITED = ("job_id", "page")
+
+_NOOP = nullcontext()
+_current = contextvars.ContextVar("ink2pixel_trace_span", default=None)
+_fd = None
+_fd_lock = threading.Lock()
+_profile_dir = None
+_profile_lock = threading.Lock()
+
+
+def configure(trace_file: str = None, profile_dir: str = None) -> None:
+    """Start (or with None, stop) writing spans to trace_file; arm a one-job torch profile."""
+    global _fd, _profile_dir
+    with _fd_lock:
+        if _fd is not None:
+            os.close(_fd)
+            _fd = None
+        if trace_file:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+            # O_APPEND makes each single-write line land whole even with
+            # several processes (web workers + inference worker) sharing the file.
+            _fd = os.open(trace_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    _profile_dir = profile_dir
+
+
+def enabled() -> bool:
+    return _fd is not None
+
+
+def _write(record: dict) -> None:
+    line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+    with _fd_lock:
+        if _fd is not None:
+            os.write(_fd, line)
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "inherited", "token", "ts", "started")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.inherited = dict(parent.inherited) if parent else {}
+        self.inherited.update((k, self.attrs[k]) for k in INHERITED if k in self.attrs)
+        self.token = _current.set(self)
+        self.ts = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def set(self, **attrs) -> None:
+        """Add attributes discovered while the span is open (e.g. page counts)."""
+        self.attrs.update(attrs)
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self.started) * 1000
+        _current.reset(self.token)
+        record = {"ts": round(self.ts, 6), "ms": round(ms, 3), "name": self.name,
+                  "trace": self.trace_id, "span": self.span_id, "parent": self.parent_id,
+                  "pid": os.getpid(), **self.inherited, **self.attrs}
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _write(record)
+        return False
+
+
+def span(name: str, **attrs):
+    """Context manager timing the enclosed block as one span."""
+    if _fd is None:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def emit(name: str, started: float, seconds: float, **attrs) -> None:
+    """Record an already measured interval (started is a perf_counter() value) as a child span.
+
+    For phases that cannot be wrapped in a with-block, like prefill and
+    decode inside a single generate() call.
+    """
+    if _fd is None:
+        return
+    parent = _current.get()
+    _write({
+        "ts": round(time.time() - (time.perf_counter() - started), 6), "ms": round(seconds * 1000, 3),
+        "name": name, "trace": parent.trace_id if parent else uuid.uuid4().hex,
+        "span": uuid.uuid4().hex[:16], "parent": parent.span_id if parent else None,
+        "pid": os.getpid(), **(parent.inherited if parent else {}), **attrs,
+    })
+
+
+def current_context():
+    """The open span's ids and inherited attributes, for sending to another process."""
+    parent = _current.get()
+    if parent is None or _fd is None:
+        return None
+    return {"trace": parent.trace_id, "span": parent.span_id, "inherited": parent.inherited}
+
+
+class _RemoteParent:
+    __slots__ = ("trace_id", "span_id", "inherited")
+
+    def __init__(self, context: dict):
+        self.trace_id = context["trace"]
+        self.span_id = context["span"]
+        self.inherited = dict(context.get("inherited") or {})
+
+
+@contextmanager
+def attach(context: dict = None):
+    """Continue a trace started in another process (see current_context())."""
+    if not context:
+        yield
+        return
+    token = _current.set(_RemoteParent(context))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def profile_job(job_id: str):
+    """Wrap the block in torch.profiler if INK2PIXEL_PROFILE_DIR armed it; only the first job is captured."""
+    global _profile_dir
+    if _profile_dir is None:
+        return _NOOP
+    with _profile_lock:
+        directory, _profile_dir = _profile_dir, None
+    return _profiled(job_id, directory) if directory else _NOOP
+
+
+@contextmanager
+def _profiled(job_id: str, directory: str):
+    try:
+        import torch
+        from torch.profiler import profile, ProfilerActivity
+    except ImportError:
+        print("WARNING: INK2PIXEL_PROFILE_DIR is set but torch is not installed; not profiling.")
+        yield
+        return
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    with profile(activities=activities, record_shapes=True, with_stack=False) as prof:
+        yield
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{job_id}.chrome-trace.json")
+    prof.export_chrome_trace(path)
+    print(f"Saved torch profiler trace for job {job_id} to {path}")
+
+
+configure(os.environ.get("INK2PIXEL_TRACE_FILE"), os.environ.get("INK2PIXEL_PROFILE_DIR"))
@@ -0,0 +1,548 @@
+"""
+Long-lived inference worker.
+
+One process owns the model and serves jobs to any number of web processes
+over a local socket (multiprocessing.connection: a Unix socket, or TCP on
+platforms without AF_UNIX). Messages are pickled dicts:
+
+    client -> worker   {"op": "submit", "id", "image_path", "output_path", "output_format", "deskew", "trace", "sent_at"}
+                       {"op": "page", "id", "image", "name", "output_format", "deskew", "trace", "sent_at"}
+                       {"op": "cancel", "id"}
+                       {"op": "ping", "id"}
+                       {"op": "metrics", "id"}
+    worker -> client   {"id", "event": "queued", "position"}
+                       {"id", "event": "started"}
+                       {"id", "event": "page", "page", "pages", "text", "generated_tokens"}
+                       {"id", "event": "done", "file_path"}      (submit)
+                       {"id", "event": "done", "text", "generated_tokens"}  (page)
+                       {"id", "event": "error", "error"}
+                       {"id", "event": "cancelled"}
+                       {"id", "event": "pong", "backend", "ready", "queued", "running"}
+                       {"id", "event": "metrics", "families"}    (see vlm/metrics.py)
+
+"trace" is the client's tracing.current_context() (or None), so spans the
+worker writes join the web request's trace (see vlm/tracing.py).
+
+"submit" runs a whole document from a path on the worker's disk. "page"
+carries one encoded page image in the message itself, so it also works
+against workers on other hosts (see vlm/coordinator.py).
+
+Connections are authenticated with INK2PIXEL_WORKER_AUTHKEY. The payloads are
+pickles, so a worker refuses to listen on TCP without it. On the default Unix
+socket (in a private per-user directory, see runtime_dir) the key otherwise
+comes from a random, 0600 worker.key file next to it.
+
+    python -m vlm.worker [--address PATH|HOST:PORT] [--backend qwen|stub]
+"""
+import argparse
+import os
+import queue
+import secrets
+import socket
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from .backends import BACKENDS, load_digitizer
+from .document_digitizer import new_usage
+from . import metrics, tracing
+
+TERMINAL_EVENTS = ("done", "error", "cancelled", "pong", "metrics")
+
+
+class JobCancelled(Exception):
+    """Raised when a job is cancelled before it finishes."""
+
+
+class InferenceError(RuntimeError):
+    """The worker reported a failure (or went away) while running a job."""
+
+
+def runtime_dir() -> str:
+    """Private per-user directory for the worker's socket and key.
+
+    $XDG_RUNTIME_DIR when set, else a 0700 ink2pixel-<uid> directory under
+    the temp dir. Refuses a directory another user owns or can enter, so
+    nobody else can replace the socket or read the key.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base and os.path.isdir(base):
+        path = os.path.join(base, "ink2pixel")
+    else:
+        path = os.path.join(tempfile.gettempdir(), f"ink2pixel-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{path} must be a directory owned by this user with mode 0700")
+    return path
+
+
+def default_address() -> str:
+    if hasattr(socket, "AF_UNIX"):
+        return os.path.join(runtime_dir(), "inference.sock")
+    return "127.0.0.1:8765"
+
+
+def parse_address(address):
+    """'host:port' becomes a TCP (host, port) tuple; anything else is a Unix socket path."""
+    if isinstance(address, tuple):
+        return address
+    host, sep, port = address.rpartition(":")
+    if sep and host and port.isdigit() and "/" not in host and "\\" not in host:
+        return (host, int(port))
+    return address
+
+
+def _authkey(address) -> bytes:
+    """INK2PIXEL_WORKER_AUTHKEY; required for TCP. Unix sockets fall back to the per-user key file."""
+    key = os.environ.get("INK2PIXEL_WORKER_AUTHKEY")
+    if key:
+        return key.encode("utf-8")
+    if isinstance(parse_address(address), tuple):
+        raise RuntimeError("Set INK2PIXEL_WORKER_AUTHKEY to a secret shared by the worker and its clients "
+                           "to use a TCP address: messages are pickles, so the key is all that stands "
+                           "between the port and code execution")
+    return _local_authkey()
+
+
+def _local_authkey() -> bytes:
+    """Random key in a 0600 file in runtime_dir(), created on first use."""
+    path = os.path.join(runtime_dir(), "worker.key")
+    if not os.path.exists(path):
+        # Written aside and linked into place, so a concurrent reader never sees a partial key.
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            try:
+                os.link(temporary, path)
+            except FileExistsError:
+                pass  # another process created it first; use theirs
+        finally:
+            os.unlink(temporary)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{path} must be owned by this user with mode 0600")
+    with open(path) as f:
+        return f.read().strip().encode("utf-8")
+
+
+def ensure_authkey() -> None:
+    """Give INK2PIXEL_WORKER_AUTHKEY a random value for this session if it has none.
+
+    For workers this process starts on a loopback TCP port (platforms without
+    Unix sockets): they and its clients inherit the key through the environment.
+    """
+    os.environ.setdefault("INK2PIXEL_WORKER_AUTHKEY", secrets.token_hex(32))
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Unlink a socket file left by a worker that is gone; refuse to touch a live one or a non-socket."""
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode):
+        raise RuntimeError(f"{path} exists and is not a socket; not replacing it")
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)  # stale socket from a previous run
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"Another inference worker is already listening on {path}")
+
+
+# =============================================================================
+#  WORKER (owns the model)
+# =============================================================================
+
+class InferenceWorker:
+    """Runs jobs one at a time on a single model, fed by any number of connections."""
+
+    def __init__(self, backend: str = "qwen"):
+        self.backend = backend
+        self.digitizer = None
+        self.load_error = None
+        self.ready = threading.Event()
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._cancelled = set()
+        self._running = None
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "ready": self.ready.is_set(),
+                "load_error": self.load_error,
+                "queued": self._jobs.qsize(),
+                "running": self._running,
+            }
+
+    def cancel(self, job_id: str) -> None:
+        with self._lock:
+            if job_id in self._pending:
+                self._cancelled.add(job_id)
+
+    def _is_cancelled(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._cancelled
+
+    def _load(self):
+        try:
+            self.digitizer = load_digitizer(self.backend)
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+            print(f"Inference worker failed to load the {self.backend} backend: {self.load_error}")
+        self.ready.set()
+
+    def _run_jobs(self):
+        self._load()
+        while True:
+            msg, send = self._jobs.get()
+            job_id = msg["id"]
+            with self._lock:
+                skip = job_id in self._cancelled
+                if not skip:
+                    self._running = job_id
+            try:
+                if skip:
+                    send({"id": job_id, "event": "cancelled"})
+                elif self.digitizer is None:
+                    send({"id": job_id, "event": "error", "error": self.load_error})
+                elif msg["op"] == "page":
+                    self._run_page(msg, send)
+                else:
+                    self._run_job(msg, send)
+            finally:
+                with self._lock:
+                    self._running = None
+                    self._pending.discard(job_id)
+                    self._cancelled.discard(job_id)
+
+    def _generated_tokens(self) -> int:
+        return getattr(self.digitizer, "usage", new_usage())["generated_tokens"]
+
+    @staticmethod
+    def _queued_ms(msg) -> float:
+        return round((time.time() - msg.get("sent_at", time.time())) * 1000, 3)
+
+    def _run_job(self, msg, send):
+        job_id = msg["id"]
+        send({"id": job_id, "event": "started"})
+        tokens_before = self._generated_tokens()
+
+        def on_page(page, pages, text):
+            nonlocal tokens_before
+            tokens = self._generated_tokens()
+            send({"id": job_id, "event": "page", "page": page, "pages": pages, "text": text,
+                  "generated_tokens": tokens - tokens_before})
+            tokens_before = tokens
+            if self._is_cancelled(job_id):
+                raise JobCancelled(job_id)
+
+        try:
+            with tracing.attach(msg.get("trace")), tracing.span("worker_job", queued_ms=self._queued_ms(msg)):
+                file_path = self.digitizer.process_and_save(
+                    image_path=msg["image_path"],
+                    output_path=msg["output_path"],
+                    output_format=msg.get("output_format", "md"),
+                    on_page=on_page,
+                    deskew=msg.get("deskew"),
+                )
+        except JobCancelled:
+            send({"id": job_id, "event": "cancelled"})
+        except Exception as e:
+            send({"id": job_id, "event": "error", "error": f"{type(e).__name__}: {e}"})
+        else:
+            send({"id": job_id, "event": "done", "file_path": file_path})
+
+    def _run_page(self, msg, send):
+        job_id = msg["id"]
+        send({"id": job_id, "event": "started"})
+        suffix = os.path.splitext(msg.get("name") or "page.png")[1] or ".png"
+        tokens_before = self._generated_tokens()
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                image_path = os.path.join(temp_dir, f"page{suffix}")
+                with open(image_path, "wb") as f:
+                    f.write(msg["image"])
+                prompt = self.digitizer._get_prompt_for_format(msg.get("output_format", "md"))
+                with tracing.attach(msg.get("trace")), \
+                        tracing.span("worker_page", page_name=msg.get("name"), queued_ms=self._queued_ms(msg)):
+                    text = self.digitizer._run_vlm(image_path, prompt, deskew=msg.get("deskew"))
+        except Exception as e:
+            send({"id": job_id, "event": "error", "error": f"{type(e).__name__}: {e}"})
+        else:
+            send({"id": job_id, "event": "done", "text": text,
+                  "generated_tokens": self._generated_tokens() - tokens_before})
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+
+        def send(msg):
+            with send_lock:
+                try:
+                    conn.send(msg)
+                except (OSError, EOFError, ValueError):
+                    pass  # client went away; its jobs are cancelled below
+
+        submitted = set()
+        try:
+            while True:
+                msg = conn.recv()
+                op = msg.get("op")
+                if op in ("submit", "page"):
+                    with self._lock:
+                        self._pending.add(msg["id"])
+                        submitted = {job_id for job_id in submitted if job_id in self._pending}
+                    submitted.add(msg["id"])
+                    self._jobs.put((msg, send))
+                    send({"id": msg["id"], "event": "queued", "position": self._jobs.qsize()})
+                elif op == "cancel":
+                    self.cancel(msg["id"])
+                elif op == "ping":
+                    send({"id": msg.get("id"), "event": "pong", **self.status()})
+                elif op == "metrics":
+                    send({"id": msg.get("id"), "event": "metrics", "families": metrics.REGISTRY.collect()})
+        except (EOFError, OSError):
+            pass
+        finally:
+            for job_id in submitted:
+                self.cancel(job_id)
+            conn.close()
+
+    def serve_forever(self, address=None, authkey: bytes = None):
+        address = parse_address(address or default_address())
+        authkey = authkey or _authkey(address)
+        if isinstance(address, str):
+            _remove_stale_socket(address)
+        listener = Listener(address, authkey=authkey)
+        metrics.REGISTRY.process = "worker"
+        metrics.QUEUE_DEPTH.set_function(self._jobs.qsize)
+        metrics.JOBS_IN_FLIGHT.set_function(lambda: int(self._running is not None))
+        threading.Thread(target=self._run_jobs, name="inference-jobs", daemon=True).start()
+        print(f"Inference worker ({self.backend}) listening on {listener.address}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    print(f"Rejected inference connection: {type(e).__name__}: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+
+# =============================================================================
+#  CLIENT (used by web processes)
+# =============================================================================
+
+class InferenceClient:
+    """Thread-safe connection to an InferenceWorker.
+
+    One socket is shared by all threads of a process; a reader thread routes
+    events to per-job queues by request id. The connection is (re)opened on
+    demand, waiting up to connect_timeout seconds for the worker to come up.
+    """
+
+    def __init__(self, address=None, authkey: bytes = None, connect_timeout: float = 30.0):
+        self.address = parse_address(address or default_address())
+        self.authkey = authkey or _authkey(self.address)
+        self.connect_timeout = connect_timeout
+        self._conn = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._streams = {}
+        self.usage = new_usage()
+
+    def _record_page(self, event) -> None:
+        with self._lock:
+            self.usage["pages"] += 1
+            self.usage["generated_tokens"] += event.get("generated_tokens") or 0
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return Client(self.address, authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def _connection(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+                threading.Thread(target=self._read_loop, args=(self._conn,), daemon=True).start()
+            return self._conn
+
+    def _read_loop(self, conn):
+        try:
+            while True:
+                msg = conn.recv()
+                with self._lock:
+                    stream = self._streams.get(msg.get("id"))
+                    if stream is not None and msg.get("event") in TERMINAL_EVENTS:
+                        del self._streams[msg["id"]]
+                if stream is not None:
+                    stream.put(msg)
+        except (EOFError, OSError):
+            pass
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            orphaned, self._streams = self._streams, {}
+        for job_id, stream in orphaned.items():
+            stream.put({"id": job_id, "event": "error", "error": "Lost connection to the inference worker"})
+
+    def _request(self, msg) -> queue.Queue:
+        stream = queue.Queue()
+        conn = self._connection()
+        with self._lock:
+            self._streams[msg["id"]] = stream
+        try:
+            with self._send_lock:
+                conn.send(msg)
+        except (OSError, EOFError, ValueError):
+            with self._lock:
+                self._streams.pop(msg["id"], None)
+                if self._conn is conn:
+                    self._conn = None
+            raise InferenceError("Lost connection to the inference worker")
+        return stream
+
+    def submit(self, image_path: str, output_path: str, output_format: str = "md", job_id: str = None,
+               deskew: bool = None):
+        """Queue a job and return (job_id, event_queue)."""
+        job_id = job_id or uuid.uuid4().hex
+        stream = self._request({
+            "op": "submit",
+            "id": job_id,
+            # The worker may have a different working directory.
+            "image_path": os.path.abspath(image_path),
+            "output_path": os.path.abspath(output_path),
+            "output_format": output_format,
+            "deskew": deskew,
+            "trace": tracing.current_context(),
+            "sent_at": time.time(),
+        })
+        return job_id, stream
+
+    def submit_page(self, image: bytes, output_format: str = "md", name: str = "page.png", job_id: str = None,
+                    deskew: bool = None):
+        """Queue a single encoded page image and return (job_id, event_queue)."""
+        job_id = job_id or uuid.uuid4().hex
+        stream = self._request({"op": "page", "id": job_id, "image": image, "name": name,
+                                "output_format": output_format, "deskew": deskew,
+                                "trace": tracing.current_context(),
+                                "sent_at": time.time()})
+        return job_id, stream
+
+    def transcribe_page(self, image: bytes, output_format: str = "md", name: str = "page.png",
+                        timeout: float = None, deskew: bool = None) -> str:
+        """Run one page image through the worker's model and return its text."""
+        job_id, stream = self.submit_page(image, output_format, name, deskew=deskew)
+        for event in self.events(job_id, stream, timeout=timeout):
+            if event["event"] == "done":
+                self._record_page(event)
+                return event["text"]
+            if event["event"] == "cancelled":
+                raise JobCancelled(job_id)
+            if event["event"] == "error":
+                raise InferenceError(event["error"])
+
+    def cancel(self, job_id: str) -> None:
+        try:
+            conn = self._connection()
+            with self._send_lock:
+                conn.send({"op": "cancel", "id": job_id})
+        except (OSError, EOFError, ValueError):
+            pass
+
+    def ping(self, timeout: float = 5.0) -> dict:
+        stream = self._request({"op": "ping", "id": uuid.uuid4().hex})
+        return stream.get(timeout=timeout)
+
+    def metrics(self, timeout: float = 5.0) -> list:
+        """The worker's metric families (Registry.collect() output)."""
+        request_id = uuid.uuid4().hex
+        stream = self._request({"op": "metrics", "id": request_id})
+        try:
+            event = stream.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._streams.pop(request_id, None)
+            raise InferenceError("The inference worker did not answer the metrics request")
+        if event["event"] != "metrics":
+            raise InferenceError(event.get("error") or f"Unexpected reply: {event['event']}")
+        return event["families"]
+
+    def events(self, job_id: str, stream: queue.Queue, cancel_event: threading.Event = None,
+               timeout: float = None):
+        """Yield a job's events until a terminal one.
+
+        Sends a cancel if cancel_event gets set. With a timeout, a job that has
+        not finished after that many seconds is cancelled and InferenceError raised.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        cancel_sent = False
+        while True:
+            if cancel_event is not None and cancel_event.is_set() and not cancel_sent:
+                self.cancel(job_id)
+                cancel_sent = True
+            if deadline is not None and time.monotonic() > deadline:
+                self.cancel(job_id)
+                with self._lock:
+                    self._streams.pop(job_id, None)
+                raise InferenceError(f"Job {job_id} timed out after {timeout:.0f}s")
+            try:
+                event = stream.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            yield event
+            if event["event"] in TERMINAL_EVENTS:
+                return
+
+    def process_and_save(self, image_path: str, output_path: str, output_format: str = "md",
+                         on_page=None, cancel_event: threading.Event = None, deskew: bool = None) -> str:
+        """Same contract as DocumentDigitizer.process_and_save, run on the worker."""
+        job_id, stream = self.submit(image_path, output_path, output_format, deskew=deskew)
+        for event in self.events(job_id, stream, cancel_event):
+            kind = event["event"]
+            if kind == "page":
+                self._record_page(event)
+            if kind == "page" and on_page is not None:
+                try:
+                    on_page(event["page"], event["pages"], event["text"])
+                except BaseException:
+                    self.cancel(job_id)
+                    raise
+            elif kind == "done":
+                return event["file_path"]
+            elif kind == "cancelled":
+                raise JobCancelled(job_id)
+            elif kind == "error":
+                raise InferenceError(event["error"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Ink2Pixel inference worker.")
+    parser.add_argument("--address", default=os.environ.get("INK2PIXEL_INFERENCE_ADDRESS") or default_address(),
+                        help="Unix socket path or HOST:PORT to listen on")
+    parser.add_argument("--backend", default=os.environ.get("INK2PIXEL_BACKEND", "qwen"), choices=BACKENDS)
+    args = parser.parse_args()
+    InferenceWorker(args.backend).serve_forever(args.address)
+
+
+if __name__ == "__main__":
+    main()
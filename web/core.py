@@ -6,15 +6,26 @@ import uuid
 # import html as html_lib
 import re
 from pathlib import Path
-from vlm.document_digitizer import DocumentDigitizer
 
 
 # ---------- Storage paths ----------
 UPLOAD_DIR = Path("uploads")
 OUTPUT_DIR = Path("outputs")
+STATIC_DIR = Path("static")
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Hard cap on a single uploaded file. Enforced while streaming, not after.
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# ---------- Artifact retention ----------
+# The janitor drops a document's upload and outputs once they have not been
+# used for ARTIFACT_TTL_SECONDS, and evicts least recently used documents
+# whenever the two folders together exceed STORAGE_QUOTA_BYTES.
+ARTIFACT_TTL_SECONDS = int(os.environ.get("INK2PIXEL_ARTIFACT_TTL", 24 * 3600))
+STORAGE_QUOTA_BYTES = int(os.environ.get("INK2PIXEL_STORAGE_QUOTA", 2 * 1024 ** 3))
+JANITOR_INTERVAL_SECONDS = int(os.environ.get("INK2PIXEL_JANITOR_INTERVAL", 300))
+
 FORMATS = [
     ("markdown",   "Markdown",   "md",    "text/markdown; charset=utf-8"),
     ("html",       "HTML",       "html",  "text/html; charset=utf-8"),
@@ -26,5 +37,43 @@ FORMAT_BY_KEY = {k: (label, ext, media) for k, label, ext, media in FORMATS}
 FORMAT_BY_EXT = {ext: (k, label, media) for k, label, ext, media in FORMATS}
 
 
-from .styles import fonts, css
-app, rt = fast_app(hdrs=(fonts, css))
\ No newline at end of file
+from .styles import fonts, CSS
+from .storage import UploadLimitMiddleware, StorageJanitor, ResultIndex, write_hashed_asset
+from .page_cache import PageCache
+from vlm.metrics import Counter, Gauge, REGISTRY
+
+# Set by app.py under --workers N: see vlm/metrics.py.
+if os.environ.get("INK2PIXEL_METRICS_DIR"):
+    REGISTRY.share(os.environ["INK2PIXEL_METRICS_DIR"])
+
+# The stylesheet is emitted once per process start under a content hash and
+# linked from every page, instead of being inlined into each response.
+css = Link(rel="stylesheet", href=f"/static/build/{write_hashed_asset(CSS, STATIC_DIR / 'build', 'ink2pixel', '.css')}")
+janitor = StorageJanitor(
+    [UPLOAD_DIR, OUTPUT_DIR],
+    ttl_seconds=ARTIFACT_TTL_SECONDS,
+    quota_bytes=STORAGE_QUOTA_BYTES,
+    interval_seconds=JANITOR_INTERVAL_SECONDS,
+)
+# Uploads byte-identical to an earlier one get its output instead of a new VLM run.
+results = ResultIndex(OUTPUT_DIR)
+# Landing and upload pages are identical for every visitor; render them once.
+page_cache = PageCache()
+Counter("ink2pixel_page_cache_hits_total", "Pages served from the prerendered page cache.").set_function(
+    lambda: page_cache.snapshot()["hits"])
+Counter("ink2pixel_page_cache_misses_total", "Pages rendered because the page cache had no copy.").set_function(
+    lambda: page_cache.snapshot()["misses"])
+Gauge("ink2pixel_page_cache_hit_ratio", "Page cache hits / lookups since start.").set_function(
+    lambda: page_cache.snapshot()["hit_rate"] or 0.0)
+app, rt = fast_app(
+    hdrs=(fonts, css),
+    middleware=(Middleware(UploadLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES, paths=("/process",)),),
+    on_startup=[janitor.start],
+    on_shutdown=[janitor.stop],
+)
+
+# fast_app() also registers a catch-all "/{fname}.{ext}" route that serves any
+# static-looking file under the working directory (uploads/ and outputs/
+# included). Drop it so /static/ in routes.py is the only file route, with
+# its caching rules.
+app.router.routes[:] = [r for r in app.router.routes if getattr(r, "path", "") != "/{fname:path}.{ext:static}"]
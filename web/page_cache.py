@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from fasthtml.common import *
+from .storage import _accepted_encodings, _etag_matches
+
+# =============================================================================
+#  PRERENDERED PAGES
+# =============================================================================
+
+# Tags FastHTML moves from a handler's result into the page <head>.
+HEAD_TAGS = ("title", "meta", "link", "style", "base")
+
+
+class PageCache:
+    """Render pages that never vary per user once, then serve them from memory.
+
+    Each decorated route is rendered on its first request and the finished
+    HTML bytes (plus a gzip copy) are kept together with an ETag. Later
+    requests get the bytes as-is, or a 304 when the browser already has them.
+    Entries are keyed by route, URL path and full-page vs. htmx fragment,
+    since FastHTML renders those differently; query strings and host names
+    do not change what these pages show, so they are not part of the key.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def page(self, f):
+        """Decorator for argument-free page handlers: @rt(path) then @page_cache.page."""
+        def wrapper(req):
+            htmx = "hx-request" in req.headers and "hx-history-restore-request" not in req.headers
+            key = (f.__name__, req.url.path, htmx)
+            with self._lock:
+                entry = self._pages.get(key)
+                if entry is not None:
+                    self._pages.move_to_end(key)
+                    self.hits += 1
+            if entry is None:
+                entry = self._render(req, f(), htmx)
+                with self._lock:
+                    self.misses += 1
+                    self._pages[key] = entry
+                    while len(self._pages) > self.max_entries:
+                        self._pages.popitem(last=False)
+            return self._serve(req, entry)
+
+        wrapper.__name__ = f.__name__  # FastHTML derives the HTTP method from it
+        return wrapper
+
+    def _render(self, req, ft, htmx: bool) -> dict:
+        # What FastHTML does for a handler's FT result, through its public helpers:
+        # htmx requests get the fragment, others the full page with the app's headers.
+        parts = tuplify(ft)
+        if not htmx and not any(getattr(o, "tag", "") == "html" for o in parts):
+            heads, body = partition(parts, lambda o: getattr(o, "tag", "") in HEAD_TAGS)
+            heads = list(heads)
+            if not any(getattr(o, "tag", "") == "title" for o in heads):
+                heads.append(Title(req.app.title))
+            if req.app.canonical:
+                # The path only: one cached copy serves every host name the app is reached by.
+                heads.append(Link(rel="canonical", href=req.url.path))
+            parts = respond(req, heads, body)
+        body = to_xml(parts).encode("utf-8")
+        return {
+            "body": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+            "etag": f'"{hashlib.sha256(body).hexdigest()[:16]}"',
+        }
+
+    def _serve(self, req, entry) -> Response:
+        gzipped = "gzip" in _accepted_encodings(req)
+        # Each encoding is a distinct representation and needs its own strong ETag.
+        etag = entry["etag"][:-1] + '-gzip"' if gzipped else entry["etag"]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Vary": "HX-Request, HX-History-Restore-Request, Accept-Encoding",
+        }
+        if_none_match = req.headers.get("if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+            return Response(entry["gzip"], headers=headers, media_type="text/html; charset=utf-8")
+        return Response(entry["body"], headers=headers, media_type="text/html; charset=utf-8")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._pages),
+                "bytes": sum(len(e["body"]) + len(e["gzip"]) for e in self._pages.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
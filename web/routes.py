@@ -1,19 +1,25 @@
-import re, json, uuid, asyncio
+import re, json, uuid, asyncio, threading, time
 from pathlib import Path
 from fasthtml.common import *
-from .core import rt, UPLOAD_DIR, OUTPUT_DIR, FORMAT_BY_KEY, FORMAT_BY_EXT
-from .vlm_logic import run_vlm, _render_preview_pane
+from .core import rt, janitor, results, page_cache, UPLOAD_DIR, OUTPUT_DIR, STATIC_DIR, FORMAT_BY_KEY, FORMAT_BY_EXT, MAX_UPLOAD_BYTES
+from .storage import save_upload, too_large_message, UploadTooLarge, file_response, IMMUTABLE_CACHE_CONTROL
+from .vlm_logic import run_vlm, metrics_text, _render_preview_pane
+from vlm.metrics import STAGE_SECONDS, JOBS_IN_FLIGHT
+from vlm import tracing
 from .ui_components import nav_bar, footer, home_content, upload_content
 
 @rt("/static/{fname:path}")
-def get(fname: str):
-    from pathlib import Path
-    p = Path("static") / fname
-    if p.exists():
-        return FileResponse(p)
-    return Response("Not found", status_code=404)
+def get(req, fname: str):
+    root = STATIC_DIR.resolve()
+    p = (root / fname).resolve()
+    if root not in p.parents or not p.is_file():
+        return Response("Not found", status_code=404)
+    # build/ holds content-hashed assets, which never change under the same name
+    cache = IMMUTABLE_CACHE_CONTROL if fname.startswith("build/") else "public, max-age=3600"
+    return file_response(req, p, cache_control=cache)
 
 @rt("/")
+@page_cache.page
 def get():
     hero, preview, mission, results = home_content()
     return Titled(
@@ -30,6 +36,7 @@ def get():
     )
 
 @rt("/upload")
+@page_cache.page
 def upload_page():
     upload_form, loader, dashboard = upload_content()
     return Titled(
@@ -94,45 +101,74 @@ async def post(req, agree: str = "", fmt: str = "markdown"):
 
     # --- Save upload ---
     doc_id = uuid.uuid4().hex[:12]
-    file_ext = Path(up_file.filename).suffix.lower() or ".png"
-    upload_path = UPLOAD_DIR / f"{doc_id}{file_ext}"
-    content = await up_file.read()
-    upload_path.write_bytes(content)
-
-    # --- Build the destination path the VLM will write to ---
-    _, out_ext, _ = FORMAT_BY_KEY[chosen]
-    output_path = OUTPUT_DIR / f"{doc_id}.{out_ext}"
-
-    # --- Call teammate's VLM: (upload_path, output_type, output_path) ---
-    #     Their function writes the result file at output_path.
-    try:
-        await asyncio.to_thread(run_vlm, upload_path, chosen, output_path)
-    except Exception as e:
-        return Div(
-            Div("✕  VLM call failed",
-                style="color:var(--yellow); font-family:'JetBrains Mono',monospace; letter-spacing:0.2em; font-weight:700; margin-bottom:10px;"),
-            P(f"{type(e).__name__}: {e}",
-              style="color:var(--ink-soft); white-space:pre-wrap; font-family:'JetBrains Mono',monospace; font-size:0.82rem; margin:0;"),
-            cls="warning-box", style="margin-top:0;",
-        )
-
-    # --- Confirm the VLM actually wrote something ---
-    if not output_path.exists() or output_path.stat().st_size == 0:
-        return Div(
-            P("✕  The VLM did not produce an output file. Check the VLM's output_path handling.",
-              style="color:var(--yellow); text-align:center; font-family:'JetBrains Mono',monospace; letter-spacing:0.15em; margin:0;"),
-            cls="warning-box", style="margin-top:0;",
-        )
-
-    # --- Read the file back for inline preview ---
-    vlm_output = output_path.read_text(encoding="utf-8")
-
-    # For JSON, parse it so the preview pretty-prints nicely
-    if chosen == "json":
+    with janitor.job(doc_id), tracing.span("POST /process", job_id=doc_id, format=chosen):
+        file_ext = Path(up_file.filename).suffix.lower() or ".png"
+        upload_path = UPLOAD_DIR / f"{doc_id}{file_ext}"
         try:
-            vlm_output = json.loads(vlm_output)
-        except json.JSONDecodeError:
-            pass  # leave as raw string, preview will show it
+            with tracing.span("save_upload") as span:
+                upload_size, upload_digest = await save_upload(up_file, upload_path, MAX_UPLOAD_BYTES)
+                if span is not None:
+                    span.set(bytes=upload_size, sha256=upload_digest)
+        except UploadTooLarge:
+            return Div(
+                P(too_large_message(MAX_UPLOAD_BYTES),
+                  style="color:var(--yellow); text-align:center; font-family:'JetBrains Mono',monospace; letter-spacing:0.15em; margin:0;"),
+                cls="warning-box", style="margin-top:0;",
+            )
+        STAGE_SECONDS.observe(time.perf_counter() - req.scope.get("upload_started", time.perf_counter()),
+                              stage="upload")
+
+        # --- Build the destination path the VLM will write to ---
+        _, out_ext, _ = FORMAT_BY_KEY[chosen]
+        output_path = OUTPUT_DIR / f"{doc_id}.{out_ext}"
+
+        # Always explicit: an unticked box must be able to override INK2PIXEL_DESKEW=1.
+        deskew = form.get("deskew") == "on"
+        variant = "deskew" if deskew else "plain"
+
+        # --- Same bytes, format and options as an earlier upload: serve its output ---
+        reused = results.reuse(upload_digest, out_ext, variant, output_path)
+        if not reused:
+            # --- Call teammate's VLM: (upload_path, output_type, output_path) ---
+            #     Their function writes the result file at output_path.
+            cancel = threading.Event()
+            job = asyncio.ensure_future(asyncio.to_thread(run_vlm, upload_path, chosen, output_path, cancel, deskew))
+            try:
+                with JOBS_IN_FLIGHT.track():
+                    # Stop burning GPU time on pages nobody is waiting for.
+                    while not (await asyncio.wait({job}, timeout=1.0))[0]:
+                        if not cancel.is_set() and await req.is_disconnected():
+                            cancel.set()
+                    await job
+            except Exception as e:
+                return Div(
+                    Div("✕  VLM call failed",
+                        style="color:var(--yellow); font-family:'JetBrains Mono',monospace; letter-spacing:0.2em; font-weight:700; margin-bottom:10px;"),
+                    P(f"{type(e).__name__}: {e}",
+                      style="color:var(--ink-soft); white-space:pre-wrap; font-family:'JetBrains Mono',monospace; font-size:0.82rem; margin:0;"),
+                    cls="warning-box", style="margin-top:0;",
+                )
+
+        # --- Confirm the VLM actually wrote something ---
+        if not output_path.exists() or output_path.stat().st_size == 0:
+            return Div(
+                P("✕  The VLM did not produce an output file. Check the VLM's output_path handling.",
+                  style="color:var(--yellow); text-align:center; font-family:'JetBrains Mono',monospace; letter-spacing:0.15em; margin:0;"),
+                cls="warning-box", style="margin-top:0;",
+            )
+
+        if not reused:
+            results.record(upload_digest, out_ext, variant, output_path)
+
+        # --- Read the file back for inline preview ---
+        vlm_output = output_path.read_text(encoding="utf-8")
+
+        # For JSON, parse it so the preview pretty-prints nicely
+        if chosen == "json":
+            try:
+                vlm_output = json.loads(vlm_output)
+            except json.JSONDecodeError:
+                pass  # leave as raw string, preview will show it
 
     fmt_label, fmt_ext, _ = FORMAT_BY_KEY[chosen]
 
@@ -179,7 +215,7 @@ async def post(req, agree: str = "", fmt: str = "markdown"):
     )
 
 @rt("/download/{doc_id}/{fmt}")
-def get(doc_id: str, fmt: str):
+def get(req, doc_id: str, fmt: str):
     if fmt not in FORMAT_BY_EXT:
         return Response("Unsupported format", status_code=400)
 
@@ -191,6 +227,16 @@ def get(doc_id: str, fmt: str):
     if not path.exists():
         return Response("File expired or not found", status_code=404)
 
+    janitor.touch(doc_id)
     _, _, media = FORMAT_BY_EXT[fmt]
     headers = {"Content-Disposition": f'attachment; filename="ink2pixel_{doc_id}.{fmt}"'}
-    return Response(path.read_bytes(), headers=headers, media_type=media)
+    return file_response(req, path, media, headers=headers)
+
+@rt("/storage/stats")
+def get():
+    return janitor.snapshot()
+
+@rt("/metrics")
+async def get():
+    text = await asyncio.to_thread(metrics_text)
+    return Response(text, media_type="text/plain; version=0.0.4; charset=utf-8")
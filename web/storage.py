@@ -0,0 +1,578 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from fasthtml.common import *
+from vlm.filelock import is_held, try_lock
+
+# =============================================================================
+#  UPLOAD STORAGE
+# =============================================================================
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised once an upload has grown past the configured size limit."""
+
+
+async def save_upload(up_file, dest: Path, max_bytes: int, chunk_size: int = UPLOAD_CHUNK_BYTES):
+    """Stream an uploaded file to dest chunk by chunk, hashing it on the way.
+
+    Returns (size_in_bytes, sha256_hex); the digest keys ResultIndex. Raises
+    UploadTooLarge as soon as more than max_bytes have been read; the partial
+    file is removed.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest, "wb") as f:
+            while chunk := await up_file.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+    finally:
+        await up_file.close()
+    return size, digest.hexdigest()
+
+
+def too_large_message(max_bytes: int) -> str:
+    return f"✕  File is larger than the {max_bytes // (1024 * 1024)} MB upload limit."
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware enforcing a hard body-size cap on upload routes.
+
+    Requests that announce a Content-Length over the cap are refused before any
+    of the body is read. Bodies without a length (or that lie about it) are cut
+    off as soon as the running total passes the cap, so the multipart parser
+    never spools more than the limit to disk.
+    """
+
+    def __init__(self, app, max_bytes: int, overhead: int = 64 * 1024, paths=("/process",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.body_limit = max_bytes + overhead  # room for multipart framing and the other form fields
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.body_limit:
+            return await self._reject(headers, send)
+
+        received = 0
+        started = False
+        # Read by the route to time the whole upload (receive + parse + save).
+        scope["upload_started"] = time.perf_counter()
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.body_limit:
+                    raise UploadTooLarge(f"Request body exceeds {self.body_limit} bytes")
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadTooLarge:
+            if started:
+                raise
+            await self._reject(headers, send)
+
+    async def _reject(self, headers, send):
+        # htmx only swaps 2xx responses, so form posts get the usual warning box
+        # inline; everything else gets a plain 413.
+        if b"hx-request" in headers:
+            body = to_xml(Div(
+                P(too_large_message(self.max_bytes),
+                  style="color:var(--yellow); text-align:center; font-family:'JetBrains Mono',monospace; letter-spacing:0.15em; margin:0;"),
+                cls="warning-box", style="margin-top:0;",
+            ))
+            status, media = 200, "text/html; charset=utf-8"
+        else:
+            body = too_large_message(self.max_bytes)
+            status, media = 413, "text/plain; charset=utf-8"
+        payload = body.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", media.encode("latin-1")),
+                (b"content-length", str(len(payload)).encode("latin-1")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+
+# =============================================================================
+#  ARTIFACT DOWNLOADS
+# =============================================================================
+
+# Encodings we precompute next to text artifacts, in order of preference.
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+PRECOMPRESS_MIN_BYTES = 1024
+
+
+def precompress(path: Path, min_bytes: int = PRECOMPRESS_MIN_BYTES) -> list:
+    """Write .gz (and .br when brotli is installed) siblings of a text artifact.
+
+    Tiny files are skipped — the headers would outweigh the savings. Returns the
+    paths written.
+    """
+    path = Path(path)
+    if not path.exists() or path.stat().st_size < min_bytes:
+        return []
+    data = path.read_bytes()
+    written = []
+
+    gz_path = path.with_name(path.name + ".gz")
+    gz_path.write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    written.append(gz_path)
+
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        br_path = path.with_name(path.name + ".br")
+        br_path.write_bytes(brotli.compress(data, mode=brotli.MODE_TEXT, quality=11))
+        written.append(br_path)
+
+    return written
+
+
+def _accepted_encodings(req) -> set:
+    accepted = set()
+    for part in req.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip().replace(" ", "")
+        if q.startswith("q=") and q[2:].strip("0.") == "":
+            continue  # q=0 means "not acceptable"
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+
+def file_response(req, path: Path, media_type: str = None, headers: dict = None,
+                  cache_control: str = "no-cache") -> Response:
+    """Serve a file from disk as a streamed, cache-aware response.
+
+    The file is never read into memory: FileResponse streams it in chunks and
+    handles byte ranges itself. On top of that this picks a precompressed
+    sibling (.br / .gz) when the client accepts it, sets a strong ETag and
+    Last-Modified, and answers If-None-Match / If-Modified-Since with a 304.
+    """
+    if media_type is None:
+        # Guess from the requested name; the served file may be a .gz/.br variant.
+        media_type = mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+    headers = dict(headers or {})
+    headers["Cache-Control"] = cache_control
+    headers["Vary"] = "Accept-Encoding"
+
+    served, encoding = Path(path), None
+    # Byte ranges refer to the identity representation, so only pick a
+    # compressed variant for whole-file requests.
+    if "range" not in req.headers:
+        accepted = _accepted_encodings(req)
+        for name, suffix in PRECOMPRESSED_ENCODINGS:
+            candidate = served.with_name(served.name + suffix)
+            if name in accepted and candidate.exists():
+                served, encoding = candidate, name
+                break
+
+    stat_result = served.stat()
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}{"-" + encoding if encoding else ""}"'
+    headers["ETag"] = etag
+
+    if_none_match = req.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        not_modified = False
+        if_modified_since = req.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                not_modified = int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                not_modified = False
+    if not_modified:
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "Content-Disposition"})
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(served, headers=headers, media_type=media_type, stat_result=stat_result)
+
+
+# =============================================================================
+#  STATIC ASSETS
+# =============================================================================
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def write_hashed_asset(text: str, directory: Path, stem: str, suffix: str) -> str:
+    """Write text to directory/<stem>.<hash><suffix> plus compressed siblings.
+
+    The name changes whenever the content does, so the file can be cached
+    forever. Older builds of the same asset are removed. Returns the file name.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    data = text.encode("utf-8")
+    name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{suffix}"
+    path = directory / name
+
+    if not path.exists():
+        # Several web workers may start at once: write aside, then rename.
+        tmp = directory / f".{name}.{os.getpid()}.tmp"
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    if not path.with_name(name + ".gz").exists():
+        precompress(path, min_bytes=0)
+
+    for old in directory.glob(f"{stem}.*{suffix}*"):
+        if not old.name.startswith(name):
+            old.unlink(missing_ok=True)
+    return name
+
+
+# =============================================================================
+#  RESULT REUSE
+# =============================================================================
+
+class ResultIndex:
+    """Finished outputs by upload content, so the same file uploaded again skips the VLM.
+
+    An entry is a small file in output_dir/.results, named after the upload's SHA-256,
+    the output extension and the options that change the result, holding
+    the output's file name. Like the janitor's markers they live on disk,
+    so every web worker shares them. The janitor evicts outputs without
+    knowing about entries; an entry whose output is gone is dropped when it
+    is next looked up, and the rest every prune_interval_seconds.
+    """
+
+    def __init__(self, output_dir, prune_interval_seconds: float = 3600):
+        self.output_dir = Path(output_dir)
+        self.directory = self.output_dir / ".results"  # the janitor only looks at files, not subfolders
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prune_interval_seconds = prune_interval_seconds
+        self._pruned_at = time.monotonic()
+
+    def _entry(self, digest: str, ext: str, variant: str) -> Path:
+        return self.directory / f"{digest}.{ext}.{variant}"
+
+    def reuse(self, digest: str, ext: str, variant: str, dest: Path) -> bool:
+        """Link (or copy) a finished output for this content to dest, with its precompressed siblings."""
+        entry = self._entry(digest, ext, variant)
+        try:
+            src = self.output_dir / entry.read_text().strip()
+        except FileNotFoundError:
+            return False
+        if src.name == dest.name:
+            return dest.exists()
+        written = []
+        try:
+            for suffix in ("", ".gz", ".br"):
+                sibling = src.with_name(src.name + suffix)
+                if suffix and not sibling.exists():
+                    continue
+                target = dest.with_name(dest.name + suffix)
+                _link_or_copy(sibling, target)
+                written.append(target)
+        except OSError:
+            # Evicted since it was recorded (or mid-link): forget it and run the job.
+            for target in written:
+                target.unlink(missing_ok=True)
+            entry.unlink(missing_ok=True)
+            return False
+        return True
+
+    def record(self, digest: str, ext: str, variant: str, output_path: Path) -> None:
+        entry = self._entry(digest, ext, variant)
+        tmp = entry.with_name(f".{entry.name}.{os.getpid()}.tmp")
+        tmp.write_text(Path(output_path).name)
+        os.replace(tmp, entry)
+        if time.monotonic() - self._pruned_at >= self.prune_interval_seconds:
+            self._pruned_at = time.monotonic()
+            self.prune()
+
+    def prune(self) -> int:
+        """Drop entries whose output has been evicted; returns how many."""
+        dropped = 0
+        for entry in self.directory.iterdir():
+            try:
+                if entry.name.startswith(".") or (self.output_dir / entry.read_text().strip()).exists():
+                    continue
+                entry.unlink()
+            except OSError:
+                continue
+            dropped += 1
+        return dropped
+
+
+def _link_or_copy(src: Path, dest: Path) -> None:
+    try:
+        os.link(src, dest)
+    except OSError:
+        if not src.exists():
+            raise
+        shutil.copyfile(src, dest)  # another filesystem, or no hard links (FAT)
+
+
+# =============================================================================
+#  STORAGE JANITOR
+# =============================================================================
+
+def _doc_id_of(path: Path) -> str:
+    # uploads/<id>.png, outputs/<id>.md, outputs/<id>.md.gz ... all share <id>
+    return path.name.split(".", 1)[0]
+
+
+# A pin is created, then locked: an unlocked pin younger than this still counts.
+PIN_GRACE_SECONDS = 5.0
+
+
+class StorageJanitor:
+    """Background task that keeps uploads/ and outputs/ bounded.
+
+    Files are grouped per document id, so an upload and all of its artifacts
+    are evicted together. A group is evicted once it has not been written or
+    downloaded for ttl_seconds, and when the folders exceed quota_bytes the
+    least recently used groups go first until they fit again. Documents with a
+    job in flight (see job()) are never touched, and neither is anything used
+    in the last min_age_seconds.
+
+    Pins and last-use times are marker files in state_dir (default: .janitor
+    inside the first folder), not process memory: with several web workers
+    each runs a janitor, and every one of them sees the jobs and downloads of
+    the others. A pin is a file its job holds locked (vlm/filelock.py), so the
+    pin of a process that died is unlocked, and removed by the next sweep.
+    """
+
+    def __init__(self, folders, ttl_seconds: float, quota_bytes: int, interval_seconds: float = 300,
+                 min_age_seconds: float = 900, state_dir=None):
+        self.folders = [Path(f) for f in folders]
+        self.ttl_seconds = ttl_seconds
+        self.quota_bytes = quota_bytes
+        self.interval_seconds = interval_seconds
+        self.min_age_seconds = min_age_seconds
+        self.state_dir = Path(state_dir) if state_dir else self.folders[0] / ".janitor"
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._task = None
+        self.stats = {
+            "sweeps": 0,
+            "evicted_docs": 0,
+            "evicted_files": 0,
+            "evicted_bytes": 0,
+            "expired_docs": 0,
+            "quota_docs": 0,
+            "errors": 0,
+            "tracked_docs": 0,
+            "tracked_files": 0,
+            "tracked_bytes": 0,
+            "last_sweep_at": None,
+            "last_sweep_seconds": None,
+        }
+
+    # ---------- bookkeeping used by the routes ----------
+
+    @contextmanager
+    def job(self, doc_id: str):
+        """Pin a document's files for the duration of a processing job."""
+        pin = self.state_dir / f"{doc_id}.{uuid.uuid4().hex}.pin"
+        f = open(pin, "wb")
+        try_lock(f)
+        try:
+            yield
+        finally:
+            f.close()
+            try:
+                pin.unlink(missing_ok=True)
+            except OSError:
+                pass  # another janitor is looking at it (Windows); it is unlocked now, so a sweep removes it
+            self.touch(doc_id)
+
+    def touch(self, doc_id: str) -> None:
+        """Record a download so quota eviction treats the document as recently used."""
+        (self.state_dir / f"{doc_id}.used").touch()
+
+    def snapshot(self) -> dict:
+        active_jobs = sum(self._pins().values())
+        with self._lock:
+            return dict(self.stats, active_jobs=active_jobs,
+                        ttl_seconds=self.ttl_seconds, quota_bytes=self.quota_bytes)
+
+    # ---------- markers ----------
+
+    def _pins(self, doc_id: str = None) -> dict:
+        """Jobs in flight per document id, across processes; removes pins nobody holds any more."""
+        pins = {}
+        pattern = f"{doc_id}.*.pin" if doc_id else "*.pin"
+        now = time.time()
+        for pin in self.state_dir.glob(pattern):
+            if not is_held(pin):
+                try:
+                    stale = now - pin.stat().st_mtime >= PIN_GRACE_SECONDS
+                    if stale:
+                        pin.unlink()
+                except OSError:
+                    stale = True  # gone already
+                if stale:
+                    continue
+                # Else a job is starting and has not locked it yet: it counts.
+            pin_doc = _doc_id_of(pin)
+            pins[pin_doc] = pins.get(pin_doc, 0) + 1
+        return pins
+
+    def _last_access(self) -> dict:
+        """Last job or download time per document id, from the .used markers."""
+        used = {}
+        with os.scandir(self.state_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".used"):
+                    try:
+                        used[_doc_id_of(Path(entry.path))] = entry.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+        return used
+
+    # ---------- eviction ----------
+
+    def _scan(self) -> dict:
+        groups = {}
+        for folder in self.folders:
+            if not folder.exists():
+                continue
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    group = groups.setdefault(_doc_id_of(Path(entry.path)), {"files": [], "bytes": 0, "mtime": 0.0})
+                    group["files"].append(Path(entry.path))
+                    group["bytes"] += st.st_size
+                    group["mtime"] = max(group["mtime"], st.st_mtime)
+        return groups
+
+    def sweep(self, now: float = None) -> dict:
+        """Run one eviction pass. Safe to call from a worker thread."""
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+        groups = self._scan()
+        active = set(self._pins())
+        last_access = self._last_access()
+        for doc_id, group in groups.items():
+            group["last_used"] = max(group["mtime"], last_access.get(doc_id, 0.0))
+        # Forget access times of documents that no longer exist.
+        for doc_id in last_access.keys() - groups.keys() - active:
+            (self.state_dir / f"{doc_id}.used").unlink(missing_ok=True)
+
+        candidates = sorted(
+            ((doc_id, g) for doc_id, g in groups.items()
+             if doc_id not in active and now - g["last_used"] >= self.min_age_seconds),
+            key=lambda item: item[1]["last_used"],
+        )
+        total = sum(g["bytes"] for g in groups.values())
+        evicted = {"docs": 0, "files": 0, "bytes": 0, "expired": 0, "quota": 0, "errors": 0}
+
+        for doc_id, group in candidates:
+            expired = now - group["last_used"] > self.ttl_seconds
+            over_quota = total > self.quota_bytes
+            if not (expired or over_quota):
+                break  # sorted oldest first, so nothing later qualifies either
+            if self._pins(doc_id):
+                continue  # a job started after the scan, in this process or another
+            for path in group["files"]:
+                try:
+                    size = path.stat().st_size
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    print(f"Janitor failed to delete {path}. Reason: {e}")
+                    evicted["errors"] += 1
+                    continue
+                evicted["files"] += 1
+                evicted["bytes"] += size
+                total -= size
+            evicted["docs"] += 1
+            evicted["expired" if expired else "quota"] += 1
+            (self.state_dir / f"{doc_id}.used").unlink(missing_ok=True)
+
+        with self._lock:
+            s = self.stats
+            s["sweeps"] += 1
+            s["evicted_docs"] += evicted["docs"]
+            s["evicted_files"] += evicted["files"]
+            s["evicted_bytes"] += evicted["bytes"]
+            s["expired_docs"] += evicted["expired"]
+            s["quota_docs"] += evicted["quota"]
+            s["errors"] += evicted["errors"]
+            s["tracked_docs"] = len(groups) - evicted["docs"]
+            s["tracked_files"] = sum(len(g["files"]) for g in groups.values()) - evicted["files"]
+            s["tracked_bytes"] = total
+            s["last_sweep_at"] = now
+            s["last_sweep_seconds"] = round(time.perf_counter() - started, 4)
+        if evicted["docs"]:
+            print(f"Janitor evicted {evicted['docs']} document(s), {evicted['bytes']} bytes")
+        return evicted
+
+    # ---------- lifecycle ----------
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Janitor sweep failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -17,7 +17,10 @@ fonts = Link(
     ),
 )
 
-css = Style(r"""
+# ---------- Stylesheet ----------
+# Served as a content-hashed file from /static/build/ (see web/core.py) rather
+# than inlined into every page's <head>.
+CSS = r"""
     :root {
         --bg:         #0a0a0a;
         --bg-2:       #111111;
@@ -1393,4 +1396,4 @@ css = Style(r"""
         .result-page.scan .result-page-body,
         .result-page.docx .result-page-body { padding: 28px 24px; }
     }
-""")
\ No newline at end of file
+"""
@@ -1,5 +1,7 @@
+import os
 from fasthtml.common import *
 from .vlm_logic import serialize
+from .core import MAX_UPLOAD_BYTES
 
 def nav_bar(active: str = "home"):
     return Div(
@@ -291,7 +293,7 @@ def upload_content():
             Label(
                 Span("↑  DROP FILE HERE", cls="ico"),
                 "Click, or drag a page to translate",
-                Span("IMG · JPG · PNG · ≤ 25 MB", cls="hint"),
+                Span(f"IMG · JPG · PNG · ≤ {MAX_UPLOAD_BYTES // (1024 * 1024)} MB", cls="hint"),
                 Input(
                     type="file",
                     name="up_file",
@@ -362,6 +364,12 @@ def upload_content():
             ),
             cls="format-picker",
         ),
+        Div(
+            # Starts ticked when INK2PIXEL_DESKEW=1; the box decides either way.
+            Input(type="checkbox", name="deskew", id="deskew", checked=os.environ.get("INK2PIXEL_DESKEW") == "1"),
+            Label("Straighten photographed pages (perspective & skew)", for_="deskew"),
+            cls="agreement-box",
+        ),
         Div(
             P(
                 "Experimental tool — Results may vary, "
@@ -1,24 +1,41 @@
-from .core import DocumentDigitizer, UPLOAD_DIR, OUTPUT_DIR, FORMAT_BY_KEY, FORMAT_BY_EXT
-import asyncio, json, uuid
+from .core import UPLOAD_DIR, OUTPUT_DIR, FORMAT_BY_KEY, FORMAT_BY_EXT
+import asyncio, json, os, threading, uuid
 from pathlib import Path
 from fasthtml.common import *
+from vlm.worker import InferenceClient, JobCancelled
+from vlm import metrics, tracing
+from .storage import precompress
 
 #  VLM INTEGRATION
 # =============================================================================
 
 _digitizer_instance = None
+_digitizer_lock = threading.Lock()
 
 def get_digitizer():
+    """The inference backend: a client for the shared worker process when
+    INK2PIXEL_INFERENCE_ADDRESS is set (app.py does this), else an in-process model."""
     global _digitizer_instance
-    if _digitizer_instance is None:
-        print("Initializing VLM into VRAM... (This only happens once on the first upload)")
-        _digitizer_instance = DocumentDigitizer()
+    with _digitizer_lock:
+        if _digitizer_instance is None:
+            # Imported here, not at module level: the in-process backend pulls in
+            # torch/transformers, which would add seconds to web server startup.
+            from vlm.backends import get_inference_backend
+            if not (os.environ.get("INK2PIXEL_INFERENCE_ADDRESS") or os.environ.get("INK2PIXEL_SHARD_WORKERS")):
+                print("Initializing VLM into VRAM... (This only happens once on the first upload)")
+            _digitizer_instance = get_inference_backend()
     return _digitizer_instance
 
-def run_vlm(upload_path: Path, output_type: str, output_path: Path) -> None:
-    """Send the uploaded image to the VLM. The VLM writes its result to output_path."""
+def run_vlm(upload_path: Path, output_type: str, output_path: Path, cancel_event: threading.Event = None,
+            deskew: bool = None) -> None:
+    """Send the uploaded image to the VLM. The VLM writes its result to output_path.
+
+    Setting cancel_event (e.g. when the browser disconnects) stops the job at
+    the next page boundary and raises JobCancelled. deskew=True straightens
+    photographed pages first, False never does (None: the backend's default).
+    """
     
-    # 1. Load the model lazily on the first request
+    # 1. Load the model (or connect to the inference worker) lazily on the first request
     digitizer = get_digitizer()
     
     # 2. Map app.py's format names to document_digitizer's expected format codes
@@ -36,11 +53,50 @@ def run_vlm(upload_path: Path, output_type: str, output_path: Path) -> None:
     base_output_path = str(output_path.with_suffix(""))
     
     # 4. Run the inference and save
-    digitizer.process_and_save(
-        image_path=str(upload_path),
-        output_path=base_output_path,
-        output_format=target_format
-    )
+    def on_page(page, pages, text):
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled(f"{upload_path.name}: cancelled after page {page + 1} of {pages}")
+
+    extra = {}
+    if isinstance(digitizer, InferenceClient):
+        extra["cancel_event"] = cancel_event  # lets a queued job be cancelled before its first page
+
+    with tracing.span("run_vlm", backend=type(digitizer).__name__):
+        digitizer.process_and_save(
+            image_path=str(upload_path),
+            output_path=base_output_path,
+            output_format=target_format,
+            on_page=on_page,
+            deskew=deskew,
+            **extra
+        )
+
+    # 5. Precompress the artifact once so downloads can be served as-is
+    precompress(output_path)
+
+
+_metrics_client = None
+WORKER_UP = metrics.Gauge("ink2pixel_inference_worker_up", "1 if the inference worker answered the last scrape.")
+
+def metrics_text() -> str:
+    """Prometheus exposition for /metrics: every web process plus the inference worker, if there is one.
+
+    The worker is asked over its own short-timeout connection, so a dead or
+    busy worker costs a scrape a second, not the 30 s a job would wait.
+    """
+    global _metrics_client
+    families = []
+    address = os.environ.get("INK2PIXEL_INFERENCE_ADDRESS")
+    if address:
+        if _metrics_client is None:
+            _metrics_client = InferenceClient(address, connect_timeout=1.0)
+        try:
+            families.append(_metrics_client.metrics(timeout=2.0))
+            WORKER_UP.set(1)
+        except Exception as e:
+            print(f"Could not collect inference worker metrics: {type(e).__name__}: {e}")
+            WORKER_UP.set(0)
+    return metrics.render(metrics.REGISTRY.collect_shared(), *families)
 
 
 def serialize(value, key: str) -> str: